@@ -0,0 +1,49 @@
+"""unique_meal_owner_image_url
+
+Revision ID: 0b6e3d8a5f21
+Revises: f4a7c2e9b130
+Create Date: 2026-10-16 15:03:51.772940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e3d8a5f21'
+down_revision: Union[str, None] = 'f4a7c2e9b130'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OWNER_COLUMNS = ['user_id', 'weixin_user_id']
+
+
+def upgrade() -> None:
+    # Keep only the newest record of each (owner, image_url) before the
+    # indexes become unique
+    for owner in OWNER_COLUMNS:
+        op.execute(
+            f"DELETE i FROM ingredients i "
+            f"JOIN nutrition_records r ON i.nutrition_record_id = r.id "
+            f"JOIN nutrition_records newer ON newer.{owner} = r.{owner} "
+            f"AND newer.image_url = r.image_url AND newer.id > r.id"
+        )
+        op.execute(
+            f"DELETE r FROM nutrition_records r "
+            f"JOIN nutrition_records newer ON newer.{owner} = r.{owner} "
+            f"AND newer.image_url = r.image_url AND newer.id > r.id"
+        )
+
+    for owner in OWNER_COLUMNS:
+        name = f"ix_nutrition_records_{owner.replace('_id', '')}_image_url"
+        op.drop_index(name, table_name='nutrition_records')
+        op.create_index(name, 'nutrition_records', [owner, 'image_url'], unique=True)
+
+
+def downgrade() -> None:
+    for owner in OWNER_COLUMNS:
+        name = f"ix_nutrition_records_{owner.replace('_id', '')}_image_url"
+        op.drop_index(name, table_name='nutrition_records')
+        op.create_index(name, 'nutrition_records', [owner, 'image_url'], unique=False)
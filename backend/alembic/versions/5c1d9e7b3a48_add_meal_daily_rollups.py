@@ -0,0 +1,43 @@
+"""add_meal_daily_rollups
+
+Revision ID: 5c1d9e7b3a48
+Revises: 0b6e3d8a5f21
+Create Date: 2026-10-16 16:21:09.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1d9e7b3a48'
+down_revision: Union[str, None] = '0b6e3d8a5f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('meal_daily_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('weixin_user_id', sa.Integer(), nullable=True),
+        sa.Column('local_date', sa.Date(), nullable=False),
+        sa.Column('meal_count', sa.Integer(), nullable=False),
+        sa.Column('total_carbs', sa.Float(), nullable=False),
+        sa.Column('total_protein', sa.Float(), nullable=False),
+        sa.Column('total_fat', sa.Float(), nullable=False),
+        sa.Column('total_gl', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['weixin_user_id'], ['weixin_users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_meal_daily_rollups_user_date', 'meal_daily_rollups', ['user_id', 'local_date'], unique=True)
+    op.create_index('ix_meal_daily_rollups_weixin_user_date', 'meal_daily_rollups', ['weixin_user_id', 'local_date'], unique=True)
+    # Existing meals are rolled up with: python -m app.backfill_rollups
+
+
+def downgrade() -> None:
+    op.drop_table('meal_daily_rollups')
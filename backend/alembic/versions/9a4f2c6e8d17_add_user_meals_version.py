@@ -0,0 +1,28 @@
+"""add_user_meals_version
+
+Revision ID: 9a4f2c6e8d17
+Revises: 5c1d9e7b3a48
+Create Date: 2026-10-16 17:38:42.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f2c6e8d17'
+down_revision: Union[str, None] = '5c1d9e7b3a48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('meals_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('weixin_users', sa.Column('meals_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('weixin_users', 'meals_version')
+    op.drop_column('users', 'meals_version')
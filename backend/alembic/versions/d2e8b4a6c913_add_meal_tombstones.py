@@ -0,0 +1,42 @@
+"""add_meal_tombstones
+
+Revision ID: d2e8b4a6c913
+Revises: 9a4f2c6e8d17
+Create Date: 2026-10-16 18:12:27.540318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2e8b4a6c913'
+down_revision: Union[str, None] = '9a4f2c6e8d17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('meal_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('weixin_user_id', sa.Integer(), nullable=True),
+        sa.Column('nutrition_record_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['weixin_user_id'], ['weixin_users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_meal_tombstones_user_deleted_at', 'meal_tombstones', ['user_id', 'deleted_at'], unique=False)
+    op.create_index('ix_meal_tombstones_weixin_user_deleted_at', 'meal_tombstones', ['weixin_user_id', 'deleted_at'], unique=False)
+    op.create_index('ix_nutrition_records_user_updated_at', 'nutrition_records', ['user_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_nutrition_records_weixin_user_updated_at', 'nutrition_records', ['weixin_user_id', 'updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    # The owner foreign keys stay covered by the meal_time indexes
+    op.drop_index('ix_nutrition_records_weixin_user_updated_at', table_name='nutrition_records')
+    op.drop_index('ix_nutrition_records_user_updated_at', table_name='nutrition_records')
+    op.drop_table('meal_tombstones')
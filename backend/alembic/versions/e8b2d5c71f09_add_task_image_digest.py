@@ -0,0 +1,28 @@
+"""add_task_image_digest
+
+Revision ID: e8b2d5c71f09
+Revises: c3f9a1d2e4b7
+Create Date: 2026-10-16 11:47:05.216384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b2d5c71f09'
+down_revision: Union[str, None] = 'c3f9a1d2e4b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tasks', sa.Column('image_digest', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_tasks_image_digest'), 'tasks', ['image_digest'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_tasks_image_digest'), table_name='tasks')
+    op.drop_column('tasks', 'image_digest')
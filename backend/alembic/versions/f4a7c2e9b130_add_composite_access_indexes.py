@@ -0,0 +1,42 @@
+"""add_composite_access_indexes
+
+Revision ID: f4a7c2e9b130
+Revises: e8b2d5c71f09
+Create Date: 2026-10-16 14:12:38.504117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a7c2e9b130'
+down_revision: Union[str, None] = 'e8b2d5c71f09'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_nutrition_records_user_meal_time', 'nutrition_records', ['user_id', 'meal_time', 'id'], unique=False)
+    op.create_index('ix_nutrition_records_weixin_user_meal_time', 'nutrition_records', ['weixin_user_id', 'meal_time', 'id'], unique=False)
+    op.create_index('ix_nutrition_records_user_image_url', 'nutrition_records', ['user_id', 'image_url'], unique=False)
+    op.create_index('ix_nutrition_records_weixin_user_image_url', 'nutrition_records', ['weixin_user_id', 'image_url'], unique=False)
+    op.create_index('ix_tasks_status_created_at', 'tasks', ['status', 'created_at'], unique=False)
+    op.create_index('ix_tasks_status_lease_expires_at', 'tasks', ['status', 'lease_expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tasks_status_lease_expires_at', table_name='tasks')
+    op.drop_index('ix_tasks_status_created_at', table_name='tasks')
+
+    # InnoDB drops the implicit foreign key indexes once the composite indexes
+    # cover the owner columns, so recreate single column indexes before
+    # dropping the composites.
+    op.create_index('ix_nutrition_records_user_id', 'nutrition_records', ['user_id'], unique=False)
+    op.create_index('ix_nutrition_records_weixin_user_id', 'nutrition_records', ['weixin_user_id'], unique=False)
+    op.drop_index('ix_nutrition_records_weixin_user_image_url', table_name='nutrition_records')
+    op.drop_index('ix_nutrition_records_user_image_url', table_name='nutrition_records')
+    op.drop_index('ix_nutrition_records_weixin_user_meal_time', table_name='nutrition_records')
+    op.drop_index('ix_nutrition_records_user_meal_time', table_name='nutrition_records')
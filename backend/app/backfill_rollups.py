@@ -0,0 +1,91 @@
+"""
+Rebuild meal_daily_rollups from nutrition_records.
+
+Rollups are maintained on every save and delete, so this is only needed once
+after the table is created, or after ROLLUP_TIMEZONE changes. Meals are read
+in one streaming pass and all rollups are replaced in a single transaction.
+
+    cd backend
+    python -m app.backfill_rollups
+"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+# Import all models to ensure they are registered with SQLAlchemy
+import app.models
+from app.database.database import SessionLocal
+from app.models.nutrition_models import MealDailyRollup, NutritionRecord
+from app.services.rollup_service import TOTAL_FIELDS, local_date
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(batch_size: int = 5000) -> int:
+    """Replace all rollups with totals computed from the stored meals.
+
+    Returns:
+        int: The number of rollup rows written
+    """
+    db = SessionLocal()
+    try:
+        rollups = defaultdict(lambda: {"meal_count": 0, **{field: 0.0 for field in TOTAL_FIELDS}})
+        rows = (
+            db.query(
+                NutritionRecord.user_id,
+                NutritionRecord.weixin_user_id,
+                NutritionRecord.meal_time,
+                *[getattr(NutritionRecord, field) for field in TOTAL_FIELDS],
+            )
+            .filter(NutritionRecord.meal_time.isnot(None))
+            .yield_per(batch_size)
+        )
+        for row in rows:
+            rollup = rollups[(row.user_id, row.weixin_user_id, local_date(row.meal_time))]
+            rollup["meal_count"] += 1
+            for field in TOTAL_FIELDS:
+                rollup[field] += getattr(row, field) or 0.0
+
+        now = datetime.now(timezone.utc)
+        values = [
+            {
+                "user_id": user_id,
+                "weixin_user_id": weixin_user_id,
+                "local_date": day,
+                "updated_at": now,
+                **totals,
+            }
+            for (user_id, weixin_user_id, day), totals in rollups.items()
+        ]
+        db.query(MealDailyRollup).delete(synchronize_session=False)
+        for offset in range(0, len(values), batch_size):
+            db.execute(insert(MealDailyRollup), values[offset:offset + batch_size])
+        db.commit()
+        return len(values)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the daily meal rollups")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Rows read and written per batch",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    count = backfill(args.batch_size)
+    logger.info(f"Wrote {count} daily rollups")
+
+
+if __name__ == "__main__":
+    main()
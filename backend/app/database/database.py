@@ -1,20 +1,180 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
+import threading
+import time
+from typing import Dict
 
 
 # Get database URL from environment variable or use default SQLite URL
 DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://root@localhost:3306/gluco")
+# Optional read replica for read-only endpoints, see get_read_db
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# Seconds after a user's write during which their reads stay on the primary
+READ_STICKY_SECONDS = float(os.getenv("READ_STICKY_SECONDS", "10"))
+
+# Connection pool. API handlers, the task poller and the task workers all
+# check out connections from it, so size it for their combined concurrency.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds a checkout waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this, before MySQL's wait_timeout closes them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout and reconnect if the server dropped it
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Driver timeouts in seconds, MySQL only
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+DB_READ_TIMEOUT = int(os.getenv("DB_READ_TIMEOUT", "30"))
+DB_WRITE_TIMEOUT = int(os.getenv("DB_WRITE_TIMEOUT", "30"))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    metrics_name = "db_pool"
+
+    def _do_get(self):
+        # Imported here, app.utils imports the models, which import this module
+        from app.utils import metrics
+
+        started_at = time.monotonic()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.increment(f"{self.metrics_name}_timeouts")
+            raise
+        finally:
+            metrics.observe(f"{self.metrics_name}_checkout_seconds", time.monotonic() - started_at)
+
+
+def pool_gauges(pool: QueuePool) -> dict:
+    """Current connection counts of a queue pool."""
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # overflow() counts up from -size while the pool fills
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+
+
+def create_db_engine(url: str, metrics_name: str = "db_pool") -> Engine:
+    """
+    Create an engine with the configured pool, reporting it under `metrics_name`.
+
+    Checkout waits are recorded as the timing <metrics_name>_checkout_seconds,
+    pool timeouts and invalidated connections as counters, and the current
+    connection counts as gauges. Statements are timed by query_stats.
+    """
+    from app.utils import metrics, query_stats
+
+    connect_args = {}
+    if make_url(url).get_backend_name() == "mysql":
+        connect_args = {
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "read_timeout": DB_READ_TIMEOUT,
+            "write_timeout": DB_WRITE_TIMEOUT,
+        }
+
+    # A subclass per engine, so the name survives pool recreation on dispose()
+    poolclass = type("InstrumentedQueuePool", (InstrumentedQueuePool,), {"metrics_name": metrics_name})
+    db_engine = create_engine(
+        url,
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+    @event.listens_for(db_engine, "invalidate")
+    def count_invalidated(dbapi_connection, connection_record, exception):
+        metrics.increment(f"{metrics_name}_invalidated")
+
+    metrics.register_gauges(metrics_name, lambda: pool_gauges(db_engine.pool))
+    query_stats.instrument(db_engine)
+    return db_engine
+
+
+# Create Base class. Defined before the engine, whose metrics import loads
+# app.utils and with it the models that subclass Base.
+Base = declarative_base()
 
 # Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+engine = create_db_engine(DATABASE_URL)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Create Base class
-Base = declarative_base()
+# Sessions on the read replica, None when no replica is configured
+read_engine = create_db_engine(DATABASE_READ_URL, "db_read_pool") if DATABASE_READ_URL else None
+ReadSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=read_engine, info={"replica": True})
+    if read_engine is not None
+    else None
+)
+
+# Monotonic time of each writer's last committed write. Kept per process, so
+# read-your-writes holds for requests served by the process that wrote.
+_last_writes: Dict[str, float] = {}
+_last_writes_lock = threading.Lock()
+_LAST_WRITES_MAX_ENTRIES = 10000
+
+
+def record_write(writer: str) -> None:
+    """Keep the writer's reads on the primary for READ_STICKY_SECONDS."""
+    now = time.monotonic()
+    with _last_writes_lock:
+        _last_writes[writer] = now
+        if len(_last_writes) > _LAST_WRITES_MAX_ENTRIES:
+            for key, written_at in list(_last_writes.items()):
+                if now - written_at > READ_STICKY_SECONDS:
+                    del _last_writes[key]
+
+
+def recently_wrote(writer: str) -> bool:
+    """Check whether the writer committed a write within READ_STICKY_SECONDS."""
+    with _last_writes_lock:
+        written_at = _last_writes.get(writer)
+    return written_at is not None and time.monotonic() - written_at <= READ_STICKY_SECONDS
+
+
+def track_writes(session_factory: sessionmaker) -> None:
+    """
+    Record a write for session.info["writer"] whenever a session commits changes.
+
+    Changes are flushed objects or INSERT, UPDATE and DELETE statements run
+    through the session.
+    """
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def note_statement(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            orm_execute_state.session.info["wrote"] = True
+
+    @event.listens_for(session_factory, "after_flush")
+    def note_flush(session, flush_context):
+        session.info["wrote"] = True
+
+    @event.listens_for(session_factory, "after_commit")
+    def note_commit(session):
+        if session.info.pop("wrote", False) and session.info.get("writer"):
+            record_write(session.info["writer"])
+
+    @event.listens_for(session_factory, "after_rollback")
+    def forget_writes(session):
+        session.info.pop("wrote", None)
+
+
+track_writes(SessionLocal)
 
 
 def init_db():
@@ -1,3 +1,4 @@
+from app.database import database
 from app.database.database import SessionLocal
 from fastapi import Depends, HTTPException, status, Security
 from jose import JWTError
@@ -5,14 +6,19 @@ from sqlalchemy.orm import Session
 from typing import Union
 from .models.user_models import User, WeixinUser
 from .utils.auth import decode_access_token, oauth2_scheme
-from .utils.gpt_client import GPTClient
+from .utils import metrics
+from .utils.principal_cache import principal_cache
+from .utils.gpt_client import GPTClient, get_shared_gpt_client
 from .storage.weixin_cloud_storage import WeixinCloudStorage
 import os
 
 # from .database.database import get_db
 
 
-# Dependency to get DB session
+# Dependency to get DB session. The session and driver are blocking, so
+# handlers and dependencies that use it are plain def functions, which
+# FastAPI runs in its threadpool. Async handlers that also await other I/O
+# pass their database work to run_in_threadpool.
 def get_db():
     db = SessionLocal()
     try:
@@ -21,10 +27,15 @@ def get_db():
         db.close()
 
 
-async def get_current_user(
+def get_current_user(
     token: str = Security(oauth2_scheme), db: Session = Depends(get_db)
 ) -> Union[User, WeixinUser]:
-    """Get the current user from the token."""
+    """
+    Get the current user from the token.
+
+    Resolved users are cached by token subject for PRINCIPAL_CACHE_TTL
+    seconds, so most requests resolve the user without a query.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -35,25 +46,68 @@ async def get_current_user(
         user_id = decode_access_token(token)
         if user_id is None:
             raise credentials_exception
-        if user_id.startswith("weixin"):
-            user_id = user_id[7:]
-            user = db.query(WeixinUser).filter(WeixinUser.openid == user_id).first()
-            if user is None:
-                raise credentials_exception
-            return user
+        cached = principal_cache.get(user_id)
+        if cached is not None:
+            # A session-bound copy of the cached user, without a query
+            user = db.merge(cached, load=False)
         else:
-            user_id = int(user_id)
-            user = db.query(User).filter(User.id == user_id).first()
+            subject = user_id
+            if user_id.startswith("weixin"):
+                user_id = user_id[7:]
+                user = db.query(WeixinUser).filter(WeixinUser.openid == user_id).first()
+            else:
+                user_id = int(user_id)
+                user = db.query(User).filter(User.id == user_id).first()
             if user is None:
                 raise credentials_exception
-            return user
+            db.expunge(user)
+            principal_cache.set(subject, user)
+            user = db.merge(user, load=False)
+        # Writes committed by this request keep the user's reads on the primary
+        db.info["writer"] = writer_key(user)
+        return user
     except JWTError:
         raise credentials_exception
 
 
-def get_gpt_client() -> GPTClient:
-    """Dependency provider for GPTClient"""
-    return GPTClient()
+def writer_key(user: Union[User, WeixinUser]) -> str:
+    """Identify a user's writes for read-your-writes routing."""
+    return f"{type(user).__name__}:{user.id}"
+
+
+def get_read_db(
+    current_user: Union[User, WeixinUser] = Security(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Session for read-only endpoints.
+
+    Reads go to the replica in DATABASE_READ_URL, unless none is configured
+    or the user committed a write in the last READ_STICKY_SECONDS, in which
+    case the request's primary session is used so the user sees their own
+    writes. Handlers must not write through this session.
+    """
+    if database.ReadSessionLocal is None:
+        yield db
+        return
+    if database.recently_wrote(writer_key(current_user)):
+        metrics.increment("db_reads_sticky_primary")
+        yield db
+        return
+
+    metrics.increment("db_reads_replica")
+    # Release the primary connection that loaded the user
+    db.close()
+    read_db = database.ReadSessionLocal()
+    try:
+        yield read_db
+    finally:
+        read_db.close()
+
+
+async def get_gpt_client() -> GPTClient:
+    """Dependency provider for the pooled GPTClient shared across requests"""
+    return get_shared_gpt_client()
 
 
 def get_storage() -> WeixinCloudStorage:
@@ -1,11 +1,17 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+import os
 import sys
+from typing import AsyncIterator, Optional
 from contextlib import asynccontextmanager
 from .database.database import init_db
 from .routers import jobs, meals, users, weixin_auth, auth, subscription
+from .utils.background_tasks import start_background_tasks, shutdown_background_tasks
+from .utils.gpt_client import get_shared_gpt_client, close_shared_gpt_client
+from .storage.weixin_cloud_storage import close_shared_session
+from .utils import metrics, query_stats
 # Import all models to ensure they are registered with SQLAlchemy
 import app.models
 
@@ -20,13 +26,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Run image analysis tasks inside the API process. Set to false when tasks
+# are handled by standalone workers (python -m app.worker).
+RUN_TASKS_IN_API = os.getenv("RUN_TASKS_IN_API", "true").lower() == "true"
+# Debug mode returns tracebacks in error responses
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+# Return per-request SQL statistics in X-DB-* response headers
+QUERY_STATS_HEADERS = os.getenv("QUERY_STATS_HEADERS", "false").lower() == "true"
+# Serve GET /metrics on the API port. The snapshot exposes internal pool,
+# queue and latency data, so it is off unless the port is not public.
+# Standalone workers always serve it on their internal health port.
+METRICS_ENDPOINT = os.getenv("METRICS_ENDPOINT", "false").lower() == "true"
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize database connection
     init_db()
+    # Open the pooled OpenAI client once for the lifetime of the app
+    get_shared_gpt_client()
+    if RUN_TASKS_IN_API:
+        start_background_tasks()
     yield
     logger.info("Shutting down server...")
+    if RUN_TASKS_IN_API:
+        shutdown_background_tasks()
+    await close_shared_gpt_client()
+    await close_shared_session()
 
 
 app = FastAPI(
@@ -34,7 +60,8 @@ app = FastAPI(
     description="Gluco Backend",
     version="0.1.0",
     lifespan=lifespan,
-)  # Enable debug mode
+    debug=DEBUG,
+)
 
 # Configure CORS
 app.add_middleware(
@@ -49,6 +76,38 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+
+async def _record_after_body(body: AsyncIterator, stats: query_stats.QueryStats, endpoint: Optional[str]):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        query_stats.record_request(stats, endpoint)
+
+
+@app.middleware("http")
+async def collect_query_stats(request: Request, call_next):
+    """Count the SQL statements of each request, per endpoint.
+
+    The endpoint runs in a context that already holds the stats, so the
+    statements of a streamed body are counted too, and the stats are
+    recorded once the body is sent. The headers can only report the
+    statements run before the body starts.
+    """
+    stats, token = query_stats.start_request(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.end_request(token)
+    route = request.scope.get("route")
+    if QUERY_STATS_HEADERS:
+        response.headers.update(stats.headers())
+    response.body_iterator = _record_after_body(
+        response.body_iterator, stats, getattr(route, "name", None)
+    )
+    return response
+
+
 app.include_router(users.router)
 app.include_router(weixin_auth.router)
 app.include_router(jobs.router)
@@ -67,6 +126,15 @@ async def health_check():
     }
 
 
+async def get_metrics():
+    """Return in-process counters, timings and gauges."""
+    return metrics.snapshot()
+
+
+if METRICS_ENDPOINT:
+    app.add_api_route("/metrics", get_metrics, methods=["GET"])
+
+
 if __name__ == "__main__":
     logger.info("Starting server...")
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -4,9 +4,11 @@ from sqlalchemy import (
     Float,
     String,
     DateTime,
+    Date,
     ForeignKey,
     Enum as SQLEnum,
     Text,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
@@ -19,6 +21,17 @@ from app.models.meal_models import GICategory, Level
 
 class NutritionRecord(Base):
     __tablename__ = "nutrition_records"
+    __table_args__ = (
+        # Meal history: owner filter ordered by (meal_time, id)
+        Index("ix_nutrition_records_user_meal_time", "user_id", "meal_time", "id"),
+        Index("ix_nutrition_records_weixin_user_meal_time", "weixin_user_id", "meal_time", "id"),
+        # save_meal upserts on the owner and image
+        Index("ix_nutrition_records_user_image_url", "user_id", "image_url", unique=True),
+        Index("ix_nutrition_records_weixin_user_image_url", "weixin_user_id", "image_url", unique=True),
+        # Delta sync: owner filter ordered by (updated_at, id)
+        Index("ix_nutrition_records_user_updated_at", "user_id", "updated_at", "id"),
+        Index("ix_nutrition_records_weixin_user_updated_at", "weixin_user_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -74,3 +87,41 @@ class Ingredient(Base):
     gi_category = Column(String(50), nullable=True)
     portion = Column(Float, nullable=True)
     nutrition_record = relationship("NutritionRecord", back_populates="ingredients")
+
+
+class MealDailyRollup(Base):
+    """Nutrition totals of one owner's meals on one local calendar day."""
+
+    __tablename__ = "meal_daily_rollups"
+    __table_args__ = (
+        Index("ix_meal_daily_rollups_user_date", "user_id", "local_date", unique=True),
+        Index("ix_meal_daily_rollups_weixin_user_date", "weixin_user_id", "local_date", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    weixin_user_id = Column(Integer, ForeignKey("weixin_users.id"), nullable=True)
+    local_date = Column(Date, nullable=False)
+    meal_count = Column(Integer, nullable=False, default=0)
+    total_carbs = Column(Float, nullable=False, default=0)
+    total_protein = Column(Float, nullable=False, default=0)
+    total_fat = Column(Float, nullable=False, default=0)
+    total_gl = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class MealTombstone(Base):
+    """Marks a deleted meal so that delta sync can report the deletion."""
+
+    __tablename__ = "meal_tombstones"
+    __table_args__ = (
+        Index("ix_meal_tombstones_user_deleted_at", "user_id", "deleted_at"),
+        Index("ix_meal_tombstones_weixin_user_deleted_at", "weixin_user_id", "deleted_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    weixin_user_id = Column(Integer, ForeignKey("weixin_users.id"), nullable=True)
+    # Not a foreign key, the record no longer exists
+    nutrition_record_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=False)
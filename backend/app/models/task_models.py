@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import text
 from datetime import datetime, timezone
@@ -10,6 +10,7 @@ from typing import Optional, Dict, Any, Union
 
 class TaskStatus(str, Enum):
     PENDING = "pending"
+    CLAIMED = "claimed"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
@@ -17,6 +18,11 @@ class TaskStatus(str, Enum):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Claiming: pending tasks oldest first, and leases that have expired
+        Index("ix_tasks_status_created_at", "status", "created_at"),
+        Index("ix_tasks_status_lease_expires_at", "status", "lease_expires_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -29,6 +35,11 @@ class Task(Base):
     created_at = Column(DateTime(timezone=True), nullable=False)
     updated_at = Column(DateTime(timezone=True), nullable=False)
     params = Column(JSON, nullable=True)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # sha256 of the submitted image, used to detect re-submitted photos
+    image_digest = Column(String(64), nullable=True, index=True)
 
     user = relationship("User", back_populates="tasks")
     weixin_user = relationship("WeixinUser", back_populates="tasks")
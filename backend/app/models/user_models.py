@@ -16,6 +16,8 @@ class User(Base):
     is_active = Column(Boolean, nullable=False, default=False)
     activation_token = Column(String(100), unique=True, nullable=True)
     full_name = Column(String(100), nullable=True)
+    # Incremented on every meal write, used as the meal history validator
+    meals_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(
         DateTime(timezone=True), server_default=text("CURRENT_TIMESTAMP")
     )
@@ -37,6 +39,8 @@ class WeixinUser(Base):
     openid = Column(String(100), unique=True, index=True, nullable=False)
     nickname = Column(String(100), nullable=True)
     avatar_url = Column(String(255), nullable=True)
+    # Incremented on every meal write, used as the meal history validator
+    meals_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(
         DateTime(timezone=True), server_default=text("CURRENT_TIMESTAMP")
     )
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..dependencies import get_db
 from ..models.user_models import User
@@ -13,7 +14,9 @@ async def resend_activation_email(
     email_data: EmailSchema, db: Session = Depends(get_db)
 ):
     """Resend activation email to user"""
-    user = db.query(User).filter(User.email == email_data.email).first()
+    user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.email == email_data.email).first()
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
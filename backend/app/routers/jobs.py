@@ -1,18 +1,19 @@
 import logging
 import traceback
 from datetime import datetime
-from typing import Union
+from typing import Any, List, Optional, Union
 
 from fastapi import APIRouter, HTTPException, Depends, Security
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.dependencies import get_db, get_current_user
+from app.dependencies import get_db, get_current_user, get_read_db
 from app.models.user_models import User, WeixinUser
 from app.models.meal_models import Meal
 from app.models.task_models import Task, TaskStatus, TaskResponse, TaskStatusResponse, ProcessImageAsyncRequest
 from app.storage.weixin_cloud_storage import WeixinCloudStorage
-from app.utils.background_tasks import shutdown_background_tasks
+from app.utils import metrics
+from app.utils.background_tasks import enqueue_task
 from app.schemas.storage import TempUrlResponse
 from app.dependencies import get_storage
 
@@ -25,8 +26,23 @@ class TempUrlRequest(BaseModel):
     cloud_id: str
 
 
+INGREDIENT_FIELDS = ("name", "portion", "gi", "carbs_per_100g", "protein_per_100g", "fat_per_100g")
+
+
+def previous_ingredients(analysis: Any) -> Optional[List[dict]]:
+    """Extract the ingredient list of a previous analysis sent with a correction."""
+    if not isinstance(analysis, dict) or not isinstance(analysis.get("ingredients"), list):
+        return None
+    ingredients = [
+        {field: ing[field] for field in INGREDIENT_FIELDS if ing.get(field) is not None}
+        for ing in analysis["ingredients"]
+        if isinstance(ing, dict) and ing.get("name")
+    ]
+    return ingredients or None
+
+
 @router.post("/process-image-async", response_model=TaskResponse)
-async def process_image_async(
+def process_image_async(
     request: ProcessImageAsyncRequest,
     db: Session = Depends(get_db),
     current_user: Union[User, WeixinUser] = Security(get_current_user),
@@ -37,7 +53,7 @@ async def process_image_async(
     try:
         # Check if the system is overloaded by counting active tasks
         active_tasks_count = db.query(Task.id).filter(
-            Task.status.in_([TaskStatus.PENDING, TaskStatus.PROCESSING])
+            Task.status.in_([TaskStatus.PENDING, TaskStatus.CLAIMED, TaskStatus.PROCESSING])
         ).count()
         
         # Set a reasonable limit for concurrent tasks
@@ -59,7 +75,9 @@ async def process_image_async(
             params={
                 "file_id": request.file_id,
                 "user_comment": request.user_comment,
-                # We don't store the analysis in params as it could be large
+                # Only the ingredient list is kept; corrections are made
+                # from it without sending the image again
+                "previous_ingredients": previous_ingredients(request.analysis),
             }
         )
         
@@ -73,7 +91,8 @@ async def process_image_async(
         db.commit()
         db.refresh(task)
         
-        # The task processor thread will pick up this task from the database
+        # Wake the task processor now that the task is durable
+        enqueue_task(task.id)
         logger.info(f"Created task {task.id} in PENDING state")
         
         return task
@@ -91,14 +110,28 @@ async def process_image_async(
         )
 
 
+def find_task(db: Session, task_id: int, current_user: Union[User, WeixinUser]) -> Optional[Task]:
+    """Return the user's task with this id, or None."""
+    if isinstance(current_user, User):
+        owner = Task.user_id == current_user.id
+    else:
+        owner = Task.weixin_user_id == current_user.id
+    return db.query(Task).filter(Task.id == task_id, owner).first()
+
+
 @router.get("/tasks/{task_id}", response_model=TaskStatusResponse)
-async def get_task_status(
+def get_task_status(
     task_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: Union[User, WeixinUser] = Security(get_current_user),
+    primary: Session = Depends(get_db),
 ) -> TaskStatusResponse:
     """
     Get the status of a task.
+
+    The status is read from the replica when one is configured. A task that
+    is not there yet, such as one created through another API process moments
+    ago, is looked up on the primary before answering 404.
     
     Args:
         task_id: The ID of the task to get the status of
@@ -108,19 +141,11 @@ async def get_task_status(
     """
     logger.info(f"Getting status for task {task_id}")
     
-    # Query for the task
-    task = None
-    if isinstance(current_user, User):
-        task = db.query(Task).filter(
-            Task.id == task_id,
-            Task.user_id == current_user.id
-        ).first()
-    else:
-        task = db.query(Task).filter(
-            Task.id == task_id,
-            Task.weixin_user_id == current_user.id
-        ).first()
-        
+    task = find_task(db, task_id, current_user)
+    if task is None and db is not primary:
+        metrics.increment("db_replica_task_misses")
+        task = find_task(primary, task_id, current_user)
+
     if not task:
         raise HTTPException(
             status_code=404,
@@ -134,11 +159,18 @@ async def get_task_status(
             logger.error(f"Error parsing task result: {e}")
             task.result = None
             task.status = TaskStatus.FAILED
+    elif task.status == TaskStatus.PROCESSING and task.result:
+        # Ingredients published while the notes are still being generated
+        try:
+            task.result = Meal(**task.result).model_dump()
+        except Exception as e:
+            logger.warning(f"Ignoring unparsable partial result of task {task_id}: {e}")
+            task.result = None
     return task
 
 
 @router.post("/temp-url", response_model=TempUrlResponse)
-async def get_temp_url(
+def get_temp_url(
     request: TempUrlRequest,
     current_user: Union[User, WeixinUser] = Security(get_current_user),
     storage: WeixinCloudStorage = Depends(get_storage),
@@ -150,10 +182,3 @@ async def get_temp_url(
     except Exception as e:
         logger.error(f"Failed to get temp url for {request.cloud_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to get temp url")
-
-
-# Add a shutdown event handler to stop the task processor thread
-@router.on_event("shutdown")
-def shutdown_event():
-    logger.info("Shutting down task processor thread")
-    shutdown_background_tasks()
@@ -1,59 +1,301 @@
 import logging
-from fastapi import APIRouter, HTTPException
-from app.models.nutrition_models import NutritionRecord, Ingredient
+import os
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from app.models.nutrition_models import NutritionRecord, Ingredient, MealDailyRollup, MealTombstone
 from app.models.user_models import User, WeixinUser
-from ..dependencies import get_db, get_current_user
+from ..dependencies import get_db, get_current_user, get_read_db
 from sqlalchemy.orm import Session
-from typing import Union
-from datetime import datetime, timezone
+from collections import defaultdict
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union
+from sqlalchemy import and_, or_
+from datetime import date, datetime, timedelta, timezone
 import traceback
 from fastapi import Depends, Security
+from pydantic import ValidationError
 import random
 from app.models.meal_models import TIPS, Meal
+from app.services.export_service import EXPORT_FORMATS, iter_export
+from app.services.meal_service import MealService, owner_values
+from app.services.rollup_service import summarize, today
+from app.utils.etag import etag_matches, make_etag, not_modified, set_etag
+from app.utils.pagination import decode_cursor, encode_cursor
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/meals", tags=["meals"])
 
+# Server-side bound on the number of meals returned per request
+MEALS_DEFAULT_PAGE_SIZE = int(os.getenv("MEALS_DEFAULT_PAGE_SIZE", "500"))
+MEALS_MAX_PAGE_SIZE = int(os.getenv("MEALS_MAX_PAGE_SIZE", "500"))
+# Maximum number of meals accepted by /meals/batch
+MEALS_BATCH_MAX_SIZE = int(os.getenv("MEALS_BATCH_MAX_SIZE", "50"))
+# Changes newer than this are re-sent by /meals/changes, so rows committed
+# late with an earlier updated_at are not skipped
+CHANGES_SAFETY_SECONDS = int(os.getenv("CHANGES_SAFETY_SECONDS", "5"))
+# Days covered by /meals/summary when no range is given
+SUMMARY_DEFAULT_DAYS = int(os.getenv("SUMMARY_DEFAULT_DAYS", "30"))
+
+
+# Columns read for meal history. impact_explanation is replaced by a random
+# tip in responses, so it is never loaded.
+HISTORY_RECORD_COLUMNS = [
+    NutritionRecord.id,
+    NutritionRecord.meal_time,
+    NutritionRecord.image_url,
+    NutritionRecord.total_gl,
+    NutritionRecord.total_carbs,
+    NutritionRecord.total_protein,
+    NutritionRecord.total_fat,
+    NutritionRecord.meal_gl_category,
+    NutritionRecord.impact_level,
+    NutritionRecord.protein_level,
+    NutritionRecord.fat_level,
+    NutritionRecord.protein_explanation,
+    NutritionRecord.fat_explanation,
+    NutritionRecord.best_time,
+    NutritionRecord.notes,
+]
+HISTORY_INGREDIENT_COLUMNS = [
+    Ingredient.nutrition_record_id,
+    Ingredient.name,
+    Ingredient.portion,
+    Ingredient.carbs_per_100g,
+    Ingredient.protein_per_100g,
+    Ingredient.fat_per_100g,
+    Ingredient.gi,
+    Ingredient.gl,
+    Ingredient.gi_category,
+]
+
+
+def owner_filter(current_user: Union[User, WeixinUser], model=NutritionRecord):
+    """Filter rows of `model` (nutrition records by default) owned by the current user."""
+    if isinstance(current_user, WeixinUser):
+        return model.weixin_user_id == current_user.id
+    return model.user_id == current_user.id
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value else None
+
+
+# Serializers of the fields in the history format, in response order. Each
+# reads only the record column of the same name.
+RECORD_SERIALIZERS = {
+    "id": lambda record: record.id,
+    "meal_time": lambda record: record.meal_time.isoformat() if record.meal_time else None,
+    "image_url": lambda record: record.image_url,
+    "total_gl": lambda record: _rounded(record.total_gl),
+    "total_carbs": lambda record: _rounded(record.total_carbs),
+    "total_protein": lambda record: _rounded(record.total_protein),
+    "total_fat": lambda record: _rounded(record.total_fat),
+    "meal_gl_category": lambda record: record.meal_gl_category,
+    "impact_level": lambda record: record.impact_level,
+    "protein_level": lambda record: record.protein_level,
+    "fat_level": lambda record: record.fat_level,
+    "protein_explanation": lambda record: record.protein_explanation,
+    "fat_explanation": lambda record: record.fat_explanation,
+    "impact_explanation": lambda record: random.choice(TIPS),
+    "best_time": lambda record: record.best_time,
+    "notes": lambda record: record.notes if record.notes else "",
+}
+
+# Fields selectable with ?fields=. The id and meal time are always returned,
+# since pages are keyed on them.
+HISTORY_FIELDS = set(RECORD_SERIALIZERS) | {"ingredients"}
+HISTORY_KEY_FIELDS = {"id", "meal_time"}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """
+    Parse a comma-separated ?fields= value into the set of fields to return.
+
+    Returns:
+        Optional[Set[str]]: None when every field is requested
+
+    Raises:
+        ValueError: If a field is unknown
+    """
+    if fields is None:
+        return None
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - HISTORY_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected | HISTORY_KEY_FIELDS
+
+
+def history_columns(fields: Optional[Set[str]] = None) -> list:
+    """Return the record columns read for the selected history fields."""
+    if fields is None:
+        return HISTORY_RECORD_COLUMNS
+    return [column for column in HISTORY_RECORD_COLUMNS if column.key in fields]
+
+
+def serialize_record(record, fields: Optional[Set[str]] = None) -> dict:
+    """Convert a nutrition record (or a row of its columns) to the history format.
+
+    Only the selected fields are read and returned, all of them by default.
+    """
+    return {
+        field: serialize(record)
+        for field, serialize in RECORD_SERIALIZERS.items()
+        if fields is None or field in fields
+    }
+
+
+def serialize_ingredient(ingredient) -> dict:
+    """Convert an ingredient (or a row of its columns) to the history format."""
+    return {
+        "name": ingredient.name,
+        "portion": ingredient.portion,
+        "carbs_per_100g": round(ingredient.carbs_per_100g, 1)
+        if ingredient.carbs_per_100g is not None
+        else 0,
+        "protein_per_100g": round(ingredient.protein_per_100g, 1)
+        if ingredient.protein_per_100g is not None
+        else 0,
+        "fat_per_100g": round(ingredient.fat_per_100g, 1)
+        if ingredient.fat_per_100g is not None
+        else 0,
+        "gi": round(ingredient.gi) if ingredient.gi is not None else 0,
+        "gl": round(ingredient.gl, 1)
+        if ingredient.gl is not None
+        else 0,
+        "gi_category": ingredient.gi_category,
+    }
+
+
+def load_ingredients(db: Session, record_ids: List[int]) -> Dict[int, List[dict]]:
+    """Load the ingredients of the given records in one query, grouped by record id."""
+    ingredients = defaultdict(list)
+    if not record_ids:
+        return ingredients
+    rows = (
+        db.query(*HISTORY_INGREDIENT_COLUMNS)
+        .filter(Ingredient.nutrition_record_id.in_(record_ids))
+        .order_by(Ingredient.nutrition_record_id, Ingredient.id)
+        .all()
+    )
+    for row in rows:
+        ingredients[row.nutrition_record_id].append(serialize_ingredient(row))
+    return ingredients
+
+
+def meals_version(db: Session, current_user: Union[User, WeixinUser]) -> Optional[int]:
+    """The user's meals_version as seen by `db`.
+
+    Always read from `db`: the current user may come from the principal
+    cache, and on a replica session the ETag must not label meals that lag
+    behind the version it was derived from.
+    """
+    model = type(current_user)
+    return db.query(model.meals_version).filter(model.id == current_user.id).scalar()
+
+
+def _after_cursor(meal_time: Optional[datetime], record_id: int):
+    """Filter records that sort after (meal_time, id) in descending order.
+
+    MySQL sorts NULL meal times last in descending order, so they follow every
+    dated record and are ordered among themselves by id.
+    """
+    if meal_time is None:
+        return and_(NutritionRecord.meal_time.is_(None), NutritionRecord.id < record_id)
+    return or_(
+        NutritionRecord.meal_time < meal_time,
+        and_(NutritionRecord.meal_time == meal_time, NutritionRecord.id < record_id),
+        NutritionRecord.meal_time.is_(None),
+    )
+
+
 @router.get("/history")
-async def get_meals_history(
+def get_meals_history(
+    response: Response,
     start_time: datetime = None,  # Optional UTC timestamp
     end_time: datetime = None,  # Optional UTC timestamp
+    limit: int = Query(None, ge=1),
+    cursor: str = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: Union[User, WeixinUser] = Security(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     # forward to /history
-    return await get_meals(start_time, end_time, current_user, db)
+    return get_meals(
+        response, start_time, end_time, limit, cursor, fields, if_none_match, current_user, db
+    )
 
 @router.get("")
-async def get_meals(
+def get_meals(
+    response: Response,
     start_time: datetime = None,  # Optional UTC timestamp
     end_time: datetime = None,  # Optional UTC timestamp
+    limit: int = Query(None, ge=1),
+    cursor: str = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: Union[User, WeixinUser] = Security(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    """Get user's nutrition analysis history.
+    """Get user's nutrition analysis history, newest first.
+
+    Results are paginated by (meal_time, id), at most MEALS_DEFAULT_PAGE_SIZE
+    meals per page when no limit is given. When more meals are available the
+    cursor for the next page is returned in the X-Next-Cursor header, and a
+    page without the header is the last one. Clients that need the whole
+    range must follow the cursor, as getMealHistory in wx-client does.
+
+    The ETag is derived from the user's meals_version and the request
+    parameters, so a matching If-None-Match is answered with 304 before any
+    meal is read. Reads may be served by the replica, see get_read_db.
+
+    `fields` selects the returned fields, e.g. "total_gl,image_url" for a
+    list view. Only their columns are read, and ingredients are loaded only
+    when "ingredients" is selected. The id and meal_time are always returned.
     
     Args:
         start_time: Optional start of the time range in UTC
         end_time: Optional end of the time range in UTC
+        limit: Page size, capped at MEALS_MAX_PAGE_SIZE
+        cursor: Opaque cursor from a previous page's X-Next-Cursor header
+        fields: Optional comma-separated fields to return, all by default
+        if_none_match: ETag of a previously received page
         current_user: The authenticated user
-        db: Database session
+        db: Read session
     """
+    limit = min(limit or MEALS_DEFAULT_PAGE_SIZE, MEALS_MAX_PAGE_SIZE)
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     try:
-        # Get records with ingredients in a single query using join
-        if isinstance(current_user, WeixinUser):
-            query = (
-                db.query(NutritionRecord, Ingredient)
-                .outerjoin(Ingredient)
-                .filter(NutritionRecord.weixin_user_id == current_user.id)
-            )
-        else:
-            query = (
-                db.query(NutritionRecord, Ingredient)
-                .outerjoin(Ingredient)
-                .filter(NutritionRecord.user_id == current_user.id)
-            )
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Weak, because impact_explanation is a randomly chosen tip
+    etag = make_etag(
+        type(current_user).__name__,
+        current_user.id,
+        meals_version(db, current_user),
+        start_time,
+        end_time,
+        limit,
+        cursor,
+        sorted(selected) if selected is not None else None,
+        weak=True,
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    try:
+        # Records and ingredients are read in two narrow queries. A join would
+        # repeat every wide record row once per ingredient.
+        query = db.query(*history_columns(selected)).filter(owner_filter(current_user))
             
         # Apply time filters if provided
         if start_time:
@@ -63,67 +305,33 @@ async def get_meals(
         if end_time:
             end_time = end_time.astimezone(timezone.utc)
             query = query.filter(NutritionRecord.meal_time <= end_time)
-            
-        # Apply ordering
-        query = query.order_by(NutritionRecord.meal_time.desc())
-
-        # Execute query once
-        results = query.all()
-
-        # Group results by record
-        records_map = {}
-        for record, ingredient in results:
-            if record.id not in records_map:
-                records_map[record.id] = {
-                    "id": record.id,
-                    "meal_time": record.meal_time.isoformat(),
-                    "image_url": record.image_url,
-                    "total_gl": round(record.total_gl, 1) if record.total_gl else None,
-                    "total_carbs": round(record.total_carbs, 1)
-                    if record.total_carbs
-                    else None,
-                    "total_protein": round(record.total_protein, 1)
-                    if record.total_protein
-                    else None,
-                    "total_fat": round(record.total_fat, 1)
-                    if record.total_fat
-                    else None,
-                    "meal_gl_category": record.meal_gl_category,
-                    "impact_level": record.impact_level,
-                    "protein_level": record.protein_level,
-                    "fat_level": record.fat_level,
-                    "protein_explanation": record.protein_explanation,
-                    "fat_explanation": record.fat_explanation,
-                    "impact_explanation": random.choice(TIPS),
-                    "best_time": record.best_time,
-                    "notes": record.notes if record.notes else "",
-                    "ingredients": [],
-                }
-
-            if ingredient is not None:
-                records_map[record.id]["ingredients"].append(
-                    {
-                        "name": ingredient.name,
-                        "portion": ingredient.portion,
-                        "carbs_per_100g": round(ingredient.carbs_per_100g, 1)
-                        if ingredient.carbs_per_100g is not None
-                        else 0,
-                        "protein_per_100g": round(ingredient.protein_per_100g, 1)
-                        if ingredient.protein_per_100g is not None
-                        else 0,
-                        "fat_per_100g": round(ingredient.fat_per_100g, 1)
-                        if ingredient.fat_per_100g is not None
-                        else 0,
-                        "gi": round(ingredient.gi) if ingredient.gi is not None else 0,
-                        "gl": round(ingredient.gl, 1)
-                        if ingredient.gl is not None
-                        else 0,
-                        "gi_category": ingredient.gi_category,
-                    }
-                )
-
-        # Convert to list and return
-        return list(records_map.values())
+
+        if after:
+            query = query.filter(_after_cursor(*after))
+
+        # Fetch one extra record to know whether another page follows
+        records = (
+            query.order_by(NutritionRecord.meal_time.desc(), NutritionRecord.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.meal_time, last.id)
+        if not records:
+            return []
+
+        with_ingredients = selected is None or "ingredients" in selected
+        if with_ingredients:
+            ingredients = load_ingredients(db, [record.id for record in records])
+        meals = []
+        for record in records:
+            meal = serialize_record(record, selected)
+            if with_ingredients:
+                meal["ingredients"] = ingredients.get(record.id, [])
+            meals.append(meal)
+        return meals
 
     except Exception as e:
         logger.error(f"Error fetching nutrition history: {str(e)}")
@@ -131,127 +339,251 @@ async def get_meals(
         raise HTTPException(status_code=500, detail="Failed to fetch nutrition history")
 
 
+def _changed_after(updated_at: datetime, record_id: int):
+    """Filter records that sort after (updated_at, id) in ascending order."""
+    return or_(
+        NutritionRecord.updated_at > updated_at,
+        and_(NutritionRecord.updated_at == updated_at, NutritionRecord.id > record_id),
+    )
+
+
+def _deleted_after(deleted_at: datetime, tombstone_id: int):
+    """Filter tombstones that sort after (deleted_at, id) in ascending order."""
+    return or_(
+        MealTombstone.deleted_at > deleted_at,
+        and_(MealTombstone.deleted_at == deleted_at, MealTombstone.id > tombstone_id),
+    )
+
+
+def encode_watermark(records: Tuple[datetime, int], tombstones: Tuple[datetime, int]) -> str:
+    """Encode the positions of a delta sync in the records and the tombstones."""
+    return f"{encode_cursor(*records)}.{encode_cursor(*tombstones)}"
+
+
+def decode_watermark(watermark: str) -> Tuple[Tuple[datetime, int], Tuple[datetime, int]]:
+    """
+    Decode a watermark created by encode_watermark.
+
+    A watermark holding a single cursor continues the tombstones from its
+    time, as the tombstones were not paged separately.
+
+    Raises:
+        ValueError: If the watermark is malformed
+    """
+    parts = watermark.split(".")
+    if len(parts) > 2:
+        raise ValueError("Invalid watermark")
+    positions = [decode_cursor(part) for part in parts]
+    if any(position[0] is None for position in positions):
+        raise ValueError("Invalid watermark")
+    if len(positions) == 1:
+        positions.append((positions[0][0], 0))
+    return positions[0], positions[1]
+
+
+def _next_position(
+    cutoff: datetime, last: Optional[Tuple[datetime, int]], after: Optional[Tuple[datetime, int]], has_more: bool
+) -> Tuple[Tuple[datetime, int], bool]:
+    """
+    Return where the next page of a delta sync starts and whether it follows.
+
+    The position never moves past the safety cutoff. A page that reaches past
+    it has caught up, and the rows after the cutoff are read again next sync.
+    """
+    position = last or after
+    if position is None:
+        return (cutoff, 0), False
+    position = (position[0].replace(tzinfo=None), position[1])
+    if position > (cutoff, 0):
+        return (cutoff, 0), False
+    return position, has_more
+
+
+@router.get("/changes")
+def get_meal_changes(
+    since: str = None,
+    limit: int = Query(None, ge=1),
+    current_user: Union[User, WeixinUser] = Security(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Get the meals saved and deleted since a watermark, for delta sync.
+
+    Without `since` every meal is returned, oldest change first. Clients
+    store the returned watermark and pass it as `since` on the next sync,
+    repeating while `has_more` is true. A meal may be returned again by a
+    later sync, so clients apply changes by id.
+
+    Saved meals and deletions are paged separately, each up to `limit` per
+    response, and the watermark holds the position in both. It trails the
+    current time by CHANGES_SAFETY_SECONDS, so a change whose transaction
+    commits after a sync read past it is still returned by the next sync.
+
+    Args:
+        since: Watermark from a previous response
+        limit: Maximum number of saved meals and of deleted meals, capped at
+            MEALS_MAX_PAGE_SIZE
+        current_user: The authenticated user
+        db: Database session
+
+    Returns:
+        dict: "upserted" meals in the history format, "deleted" meal ids,
+            the next "watermark" and "has_more"
+    """
+    limit = min(limit or MEALS_DEFAULT_PAGE_SIZE, MEALS_MAX_PAGE_SIZE)
+    after = deleted_after = None
+    if since:
+        try:
+            after, deleted_after = decode_watermark(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid watermark")
+
+    # Read before the changes, so nothing between it and the reads is skipped
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=CHANGES_SAFETY_SECONDS)).replace(
+        tzinfo=None, microsecond=0
+    )
+
+    try:
+        query = db.query(*HISTORY_RECORD_COLUMNS, NutritionRecord.updated_at).filter(
+            owner_filter(current_user)
+        )
+        if after:
+            query = query.filter(_changed_after(*after))
+        records = (
+            query.order_by(NutritionRecord.updated_at, NutritionRecord.id).limit(limit + 1).all()
+        )
+        has_more = len(records) > limit
+        records = records[:limit]
+
+        # A first sync returns every meal, so it has no deletions to report
+        tombstones = []
+        if deleted_after:
+            tombstones = (
+                db.query(MealTombstone.id, MealTombstone.nutrition_record_id, MealTombstone.deleted_at)
+                .filter(owner_filter(current_user, MealTombstone), _deleted_after(*deleted_after))
+                .order_by(MealTombstone.deleted_at, MealTombstone.id)
+                .limit(limit + 1)
+                .all()
+            )
+        has_more_deleted = len(tombstones) > limit
+        tombstones = tombstones[:limit]
+
+        ingredients = load_ingredients(db, [record.id for record in records])
+        upserted = []
+        for record in records:
+            meal = serialize_record(record)
+            meal["ingredients"] = ingredients.get(record.id, [])
+            upserted.append(meal)
+
+        position, has_more = _next_position(
+            cutoff, (records[-1].updated_at, records[-1].id) if records else None, after, has_more
+        )
+        deleted_position, has_more_deleted = _next_position(
+            cutoff,
+            (tombstones[-1].deleted_at, tombstones[-1].id) if tombstones else None,
+            deleted_after,
+            has_more_deleted,
+        )
+
+        return {
+            "upserted": upserted,
+            "deleted": [row.nutrition_record_id for row in tombstones],
+            "watermark": encode_watermark(position, deleted_position),
+            "has_more": has_more or has_more_deleted,
+        }
+
+    except Exception as e:
+        logger.error(f"Error fetching meal changes: {str(e)}")
+        logger.debug(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="Failed to fetch meal changes")
+
+
+@router.get("/summary")
+def get_meal_summary(
+    granularity: Literal["day", "week", "month"] = "day",
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    current_user: Union[User, WeixinUser] = Security(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """Get nutrition totals per day, week or month from the daily rollups.
+
+    Days are local days in ROLLUP_TIMEZONE and weeks start on Monday. Periods
+    without meals are omitted.
+
+    Args:
+        granularity: Period length, day, week or month
+        from_date: First local day, defaults to SUMMARY_DEFAULT_DAYS before `to`
+        to_date: Last local day, defaults to today
+        current_user: The authenticated user
+        db: Database session
+    """
+    to_date = to_date or today()
+    from_date = from_date or to_date - timedelta(days=SUMMARY_DEFAULT_DAYS - 1)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    rollups = (
+        db.query(MealDailyRollup)
+        .filter(
+            owner_filter(current_user, MealDailyRollup),
+            MealDailyRollup.local_date >= from_date,
+            MealDailyRollup.local_date <= to_date,
+        )
+        .order_by(MealDailyRollup.local_date)
+        .all()
+    )
+    return {
+        "granularity": granularity,
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "periods": summarize(rollups, granularity),
+    }
+
+
+@router.get("/export")
+async def export_meals(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: Union[User, WeixinUser] = Security(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """Download the user's full meal history, oldest first.
+
+    The response is streamed from a server-side cursor, so memory use does
+    not grow with the number of meals.
+
+    Args:
+        format: ndjson (one meal per line) or csv (ingredients as JSON)
+        current_user: The authenticated user
+        db: Database session
+    """
+    return StreamingResponse(
+        iter_export(db.get_bind(), owner_values(current_user), format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="meals.{format}"'},
+    )
+
+
 @router.post("")
-async def save_meal(
+def save_meal(
     meal_data: dict,
     current_user: Union[User, WeixinUser] = Security(get_current_user),
     db: Session = Depends(get_db),
 ):
+    """Save meal analysis results, upserting on (owner, file_id)"""
+    analysis = meal_data.get("analysis")
     # workaround for datetime.fromisoformat error
-    if "meal_time" in meal_data["analysis"] and meal_data["analysis"]["meal_time"]:
-        meal_data["analysis"]["meal_time"] = datetime.fromisoformat(meal_data["analysis"]["meal_time"])
+    if analysis and analysis.get("meal_time"):
+        analysis["meal_time"] = datetime.fromisoformat(analysis["meal_time"])
 
-    """Save meal analysis results to database using upsert logic based on file_id"""
     try:
-        # Check if record with this file_id already exists for this user
-        existing_record = None
-        if isinstance(current_user, WeixinUser):
-            existing_record = (
-                db.query(NutritionRecord)
-                .filter(
-                    NutritionRecord.weixin_user_id == current_user.id,
-                    NutritionRecord.image_url == meal_data["file_id"],
-                )
-                .first()
-            )
-        else:
-            existing_record = (
-                db.query(NutritionRecord)
-                .filter(
-                    NutritionRecord.user_id == current_user.id,
-                    NutritionRecord.image_url == meal_data["file_id"],
-                )
-                .first()
-            )
-
-        if existing_record:
-            # Update existing record
-            if "analysis" in meal_data:
-                existing_record = NutritionRecord(
-                    **existing_record.__dict__,
-                    **meal_data["analysis"],
-                    updated_at=datetime.now(timezone.utc),
-                )
-
-                # Delete existing ingredients
-                db.query(Ingredient).filter(
-                    Ingredient.nutrition_record_id == existing_record.id
-                ).delete()
-
-                # Create new ingredients
-                new_ingredients = []
-                for ing_data in meal_data["analysis"]["ingredients"]:
-                    ingredient = Ingredient(
-                        nutrition_record_id=existing_record.id,
-                        **ing_data,
-                        amount=ing_data["portion"],
-                    )
-                    new_ingredients.append(ingredient)
-
-                db.add_all(new_ingredients)
-            nutrition_record = existing_record
-
-        else:
-            # Create new record
-            if "analysis" in meal_data:
-                nutrition_record = NutritionRecord(
-                    user_id=current_user.id if isinstance(current_user, User) else None,
-                    weixin_user_id=current_user.id
-                    if isinstance(current_user, WeixinUser)
-                    else None,
-                    image_url=meal_data["file_id"],
-                    meal_time=meal_data["analysis"]["meal_time"]
-                    if "meal_time" in meal_data["analysis"]
-                    else datetime.now(timezone.utc),
-                    total_carbs=meal_data["analysis"]["total_carbs"],
-                    total_protein=meal_data["analysis"]["total_protein"],
-                    total_fat=meal_data["analysis"]["total_fat"],
-                    total_gl=meal_data["analysis"]["total_gl"],
-                    meal_gl_category=meal_data["analysis"]["meal_gl_category"],
-                    impact_level=meal_data["analysis"]["impact_level"],
-                    protein_level=meal_data["analysis"]["protein_level"],
-                    fat_level=meal_data["analysis"]["fat_level"],
-                    protein_explanation=meal_data["analysis"].get(
-                        "protein_explanation"
-                    ),
-                    fat_explanation=meal_data["analysis"].get("fat_explanation"),
-                    impact_explanation=meal_data["analysis"]["impact_explanation"],
-                    best_time=meal_data["analysis"]["best_time"],
-                    notes=meal_data["analysis"].get("notes", ""),
-                )
-
-                # Create new ingredients
-                ingredients = []
-                for ing_data in meal_data["analysis"]["ingredients"]:
-                    ingredient = Ingredient(
-                        name=ing_data["name"],
-                        carbs_per_100g=ing_data["carbs_per_100g"],
-                        protein_per_100g=ing_data["protein_per_100g"],
-                        fat_per_100g=ing_data["fat_per_100g"],
-                        gi=ing_data["gi"],
-                        gl=ing_data["gl"],
-                        portion=ing_data["portion"],
-                        gi_category=ing_data.get("gi_category"),
-                    )
-                    ingredients.append(ingredient)
-
-                nutrition_record.ingredients = ingredients
-            else:
-                nutrition_record = NutritionRecord(
-                    user_id=current_user.id if isinstance(current_user, User) else None,
-                    weixin_user_id=current_user.id
-                    if isinstance(current_user, WeixinUser)
-                    else None,
-                    image_url=meal_data["file_id"],
-                )
-            db.add(nutrition_record)
-
-        db.commit()
-        db.refresh(nutrition_record)
+        service = MealService(db)
+        record_id = service.commit_with_retry(
+            lambda: service.save_meal(current_user, meal_data["file_id"], analysis)
+        )
 
         return {
             "message": "Meal analysis saved successfully",
-            "id": nutrition_record.id,
+            "id": record_id,
         }
 
     except Exception as e:
@@ -260,3 +592,114 @@ async def save_meal(
         raise HTTPException(
             status_code=500, detail=f"Failed to save meal analysis: {str(e)}"
         )
+
+
+def parse_meal_payload(payload: Any) -> Tuple[str, Optional[dict]]:
+    """
+    Validate one meal of a batch and return its file id and analysis.
+
+    Raises:
+        ValueError: If the payload is not a valid meal
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Meal must be an object")
+    file_id = payload.get("file_id")
+    if not isinstance(file_id, str) or not file_id:
+        raise ValueError("file_id is required")
+
+    analysis = payload.get("analysis")
+    if analysis is None:
+        return file_id, None
+    if not isinstance(analysis, dict):
+        raise ValueError("analysis must be an object")
+    analysis = dict(analysis)
+    if analysis.get("meal_time"):
+        analysis["meal_time"] = datetime.fromisoformat(analysis["meal_time"])
+    ingredients = analysis.get("ingredients", [])
+    if not isinstance(ingredients, list) or not all(
+        isinstance(ingredient, dict) and ingredient.get("name") for ingredient in ingredients
+    ):
+        raise ValueError("ingredients must be a list of objects with a name")
+    # Same shape as an analysis returned by the vision model, so a malformed
+    # numeric field fails here rather than in the batch's insert
+    try:
+        Meal.model_validate(analysis)
+    except ValidationError as e:
+        error = e.errors()[0]
+        location = ".".join(str(part) for part in error["loc"])
+        raise ValueError(f"{location}: {error['msg']}")
+    return file_id, analysis
+
+
+@router.post("/batch")
+def save_meals_batch(
+    batch: dict,
+    current_user: Union[User, WeixinUser] = Security(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Save several meals in one transaction, for offline sync.
+
+    The body is {"meals": [{"file_id": ..., "analysis": {...}}, ...]}, each
+    meal shaped like a POST /meals body. Invalid meals are reported and
+    skipped; the valid ones are upserted together.
+
+    Returns:
+        dict: One result per meal, in request order, with status "saved" and
+            the record id, or status "invalid" and an error
+    """
+    meals = batch.get("meals")
+    if not isinstance(meals, list) or not meals:
+        raise HTTPException(status_code=400, detail="meals must be a non-empty list")
+    if len(meals) > MEALS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MEALS_BATCH_MAX_SIZE} meals can be saved at once"
+        )
+
+    results = []
+    valid = []
+    for index, payload in enumerate(meals):
+        result = {"index": index, "file_id": payload.get("file_id") if isinstance(payload, dict) else None}
+        try:
+            valid.append((index, parse_meal_payload(payload)))
+            result["status"] = "saved"
+        except (TypeError, ValueError) as e:
+            result.update(status="invalid", error=str(e))
+        results.append(result)
+
+    if valid:
+        try:
+            service = MealService(db)
+            record_ids = service.commit_with_retry(
+                lambda: service.save_meals(current_user, [meal for _, meal in valid])
+            )
+        except Exception as e:
+            logger.error(f"Error saving meal batch: {str(e)}")
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Failed to save meals: {str(e)}")
+        for (index, _), record_id in zip(valid, record_ids):
+            results[index]["id"] = record_id
+
+    return {"results": results}
+
+
+@router.delete("/{meal_id}")
+def delete_meal(
+    meal_id: int,
+    current_user: Union[User, WeixinUser] = Security(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Delete a meal and its ingredients"""
+    try:
+        service = MealService(db)
+        deleted = service.commit_with_retry(lambda: service.delete_meal(current_user, meal_id))
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Meal not found")
+        return {"message": "Meal deleted successfully", "id": meal_id}
+
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting meal {meal_id}: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Failed to delete meal")
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, Optional
 import json
 import logging
-from app.dependencies import get_db, get_current_user
+from app.dependencies import get_db, get_current_user, get_read_db
 from app.models.user_models import User, WeixinUser
 from app.schemas.subscription import (
     SubscriptionStatusResponse,
@@ -14,6 +15,7 @@ from app.schemas.subscription import (
 )
 from app.services.subscription_service import SubscriptionService
 from app.services.payment_service import PaymentService
+from app.utils.etag import etag_matches, not_modified, set_etag
 
 
 logger = logging.getLogger(__name__)
@@ -22,14 +24,28 @@ router = APIRouter(prefix="", tags=["subscriptions"])
 
 @router.get("/subscriptions/status", response_model=SubscriptionStatusResponse)
 def get_subscription_status(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    read_db: Session = Depends(get_read_db),
     db: Session = Depends(get_db),
     current_user: Union[User, WeixinUser] = Depends(get_current_user)
 ):
-    """Get subscription status and available actions for current user"""
+    """Get subscription status and available actions for current user
+
+    Answers a matching If-None-Match with 304 after reading only the user's
+    subscription rows, from the read replica when one is configured. The
+    full status is computed on the primary, since it may expire
+    subscriptions.
+    """
     user_id = str(current_user.id) if isinstance(current_user, User) else current_user.openid
     service = SubscriptionService(db)
     try:
+        etag = SubscriptionService(read_db).status_etag(user_id)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         status = service.get_subscription_status(user_id)
+        # Computed after the status, which may have expired subscriptions
+        set_etag(response, service.status_etag(user_id))
         return status
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -75,7 +91,8 @@ async def handle_payment_notification(
         logger.info(f"notification: {notification}")
         # Process the notification
         service = PaymentService(db)
-        service.handle_payment_notification_cloud(
+        await run_in_threadpool(
+            service.handle_payment_notification_cloud,
             headers=dict(request.headers),
             body=body,
             notification=notification
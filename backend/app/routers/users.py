@@ -11,6 +11,7 @@ import secrets
 import traceback
 from datetime import timedelta
 from ..utils.auth import ACCESS_TOKEN_EXPIRE_MINUTES
+from ..utils.principal_cache import invalidate_user
 from ..services.subscription_service import SubscriptionService
 
 
@@ -22,7 +23,7 @@ router = APIRouter(prefix="/users", tags=["users"])
 @router.post(
     "/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED
 )
-async def register_user(
+def register_user(
     user: UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
 ):
     """Register a new user."""
@@ -74,7 +75,7 @@ async def register_user(
 
 
 @router.post("/login", response_model=Token)
-async def login(user: UserLogin, db: Session = Depends(get_db)):
+def login(user: UserLogin, db: Session = Depends(get_db)):
     """Login user and return access token."""
     try:
         logger.info(f"Login attempt for email: {user.email}")
@@ -133,7 +134,7 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 
 
 @router.post("/activate/{token}", response_model=UserResponse, tags=["users"])
-async def activate_user(token: str, db: Session = Depends(get_db)):
+def activate_user(token: str, db: Session = Depends(get_db)):
     """Activate a user account using the activation token."""
     # Find user by activation token
     user = db.query(User).filter(User.activation_token == token).first()
@@ -153,6 +154,7 @@ async def activate_user(token: str, db: Session = Depends(get_db)):
 
     try:
         db.commit()
+        invalidate_user(user)
         db.refresh(user)
         return user
     except Exception as e:
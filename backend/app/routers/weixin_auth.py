@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from ..dependencies import get_db
+from ..dependencies import get_db, writer_key
 from ..models.user_models import (
     WeixinUser,
     WeixinUserCreate,
@@ -8,6 +9,7 @@ from ..models.user_models import (
     WeixinLoginRequest,
 )
 from ..utils.auth import create_access_token
+from ..utils.principal_cache import invalidate_user
 from ..utils.weixin_auth import get_weixin_openid
 from ..services.subscription_service import SubscriptionService
 from datetime import timedelta
@@ -18,6 +20,50 @@ from ..utils.invitation_code import verify_invite_code
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/weixin/auth", tags=["weixin_auth"])
 
+
+def _login_weixin_user(db: Session, openid: str) -> dict:
+    """Find or create the user of an openid and return their profile.
+
+    New users, and existing users without subscription history, get a trial
+    subscription.
+    """
+    # Check if user exists
+    user = db.query(WeixinUser).filter(WeixinUser.openid == openid).first()
+    logger.info(f"Existing user found: {user is not None}")
+
+    # If user doesn't exist, create new user
+    is_new_user = False
+    if not user:
+        # if login_data.invite_code is None:
+        #     raise HTTPException(
+        #         status_code=status.HTTP_400_BAD_REQUEST, detail="Invite code is required"
+        #     )
+        # invite_code = login_data.invite_code
+        # if not verify_invite_code(invite_code):
+        #     raise HTTPException(
+        #         status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid invite code"
+        #     )
+        user = WeixinUser(openid=openid)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        logger.info("Created new user")
+        is_new_user = True
+
+    # The first requests after login read the trial subscription from the primary
+    db.info["writer"] = writer_key(user)
+
+    # Initialize subscription service
+    subscription_service = SubscriptionService(db)
+
+    # Create trial subscription for new users or existing users without subscription history
+    if is_new_user or not subscription_service.has_subscription_history(user.openid):
+        subscription_service.create_trial_subscription(user.openid)
+        logger.info("Created trial subscription for user")
+
+    return WeixinUserResponse.model_validate(user).model_dump()
+
+
 @router.post("/login", response_model=dict)
 async def weixin_login(login_data: WeixinLoginRequest, db: Session = Depends(get_db)):
     """Login or register WeChat user using code from WeChat mini program."""
@@ -38,36 +84,8 @@ async def weixin_login(login_data: WeixinLoginRequest, db: Session = Depends(get
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid WeChat code"
             )
 
-        # Check if user exists
-        user = db.query(WeixinUser).filter(WeixinUser.openid == openid).first()
-        logger.info(f"Existing user found: {user is not None}")
-
-        # If user doesn't exist, create new user
-        is_new_user = False
-        if not user:
-            # if login_data.invite_code is None:
-            #     raise HTTPException(
-            #         status_code=status.HTTP_400_BAD_REQUEST, detail="Invite code is required"
-            #     )
-            # invite_code = login_data.invite_code
-            # if not verify_invite_code(invite_code):
-            #     raise HTTPException(
-            #         status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid invite code"
-            #     )
-            user = WeixinUser(openid=openid)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-            logger.info("Created new user")
-            is_new_user = True
-
-        # Initialize subscription service
-        subscription_service = SubscriptionService(db)
-
-        # Create trial subscription for new users or existing users without subscription history
-        if is_new_user or not subscription_service.has_subscription_history(user.openid):
-            subscription_service.create_trial_subscription(user.openid)
-            logger.info("Created trial subscription for user")
+        # The user lookup and subscription setup use the synchronous session
+        user_data = await run_in_threadpool(_login_weixin_user, db, openid)
 
         # Create access token
         access_token = create_access_token(
@@ -79,7 +97,7 @@ async def weixin_login(login_data: WeixinLoginRequest, db: Session = Depends(get
         return {
             "access_token": access_token,
             "token_type": "bearer",
-            "user": WeixinUserResponse.model_validate(user).model_dump(),
+            "user": user_data,
         }
 
     except Exception as e:
@@ -90,7 +108,7 @@ async def weixin_login(login_data: WeixinLoginRequest, db: Session = Depends(get
 
 
 @router.put("/profile", response_model=WeixinUserResponse)
-async def update_weixin_profile(
+def update_weixin_profile(
     user_data: WeixinUserCreate, db: Session = Depends(get_db)
 ):
     """Update WeChat user profile."""
@@ -108,6 +126,7 @@ async def update_weixin_profile(
         user.avatar_url = user_data.avatar_url
 
         db.commit()
+        invalidate_user(user)
         db.refresh(user)
 
         return user
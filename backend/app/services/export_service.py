@@ -0,0 +1,153 @@
+"""
+Streaming export of a user's meal history.
+
+Records are read through a server-side cursor and written out chunk by
+chunk, so an export of any size runs in constant memory and the first bytes
+are sent as soon as the first chunk is read.
+"""
+import csv
+import io
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.nutrition_models import Ingredient, NutritionRecord
+from app.services.meal_service import INGREDIENT_FIELDS, owned_by
+
+logger = logging.getLogger(__name__)
+
+# Records fetched from the server-side cursor and written per chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+EXPORT_RECORD_COLUMNS = [
+    NutritionRecord.id,
+    NutritionRecord.meal_time,
+    NutritionRecord.meal_type,
+    NutritionRecord.image_url,
+    NutritionRecord.total_carbs,
+    NutritionRecord.total_protein,
+    NutritionRecord.total_fat,
+    NutritionRecord.total_gl,
+    NutritionRecord.meal_gl_category,
+    NutritionRecord.impact_level,
+    NutritionRecord.protein_level,
+    NutritionRecord.fat_level,
+    NutritionRecord.pre_glucose,
+    NutritionRecord.post_glucose,
+    NutritionRecord.protein_explanation,
+    NutritionRecord.fat_explanation,
+    NutritionRecord.impact_explanation,
+    NutritionRecord.best_time,
+    NutritionRecord.notes,
+]
+
+CSV_COLUMNS = [column.key for column in EXPORT_RECORD_COLUMNS] + ["ingredients"]
+
+
+def _serialize(row, ingredients: List[Dict[str, Any]]) -> Dict[str, Any]:
+    meal = {}
+    for column in EXPORT_RECORD_COLUMNS:
+        value = getattr(row, column.key)
+        meal[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    meal["ingredients"] = ingredients
+    return meal
+
+
+def _load_ingredients(db: Session, record_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    ingredients = defaultdict(list)
+    rows = (
+        db.query(Ingredient.nutrition_record_id, *[getattr(Ingredient, f) for f in INGREDIENT_FIELDS])
+        .filter(Ingredient.nutrition_record_id.in_(record_ids))
+        .order_by(Ingredient.nutrition_record_id, Ingredient.id)
+    )
+    for row in rows:
+        ingredients[row.nutrition_record_id].append(
+            {field: getattr(row, field) for field in INGREDIENT_FIELDS}
+        )
+    return ingredients
+
+
+def _format_chunk(meals: List[Dict[str, Any]], export_format: str) -> str:
+    if export_format == "ndjson":
+        return "".join(json.dumps(meal, ensure_ascii=False) + "\n" for meal in meals)
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS)
+    for meal in meals:
+        writer.writerow(
+            {**meal, "ingredients": json.dumps(meal["ingredients"], ensure_ascii=False)}
+        )
+    return output.getvalue()
+
+
+def _write_chunk(db: Session, rows: List[Any], export_format: str) -> str:
+    ingredients = _load_ingredients(db, [row.id for row in rows])
+    meals = [_serialize(row, ingredients.get(row.id, [])) for row in rows]
+    return _format_chunk(meals, export_format)
+
+
+def iter_export(
+    bind: Engine,
+    owner: Dict[str, Optional[int]],
+    export_format: str,
+    chunk_size: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Yield a user's meals, oldest first, as NDJSON lines or CSV rows.
+
+    The generator opens its own sessions because it runs after the request's
+    session has been closed. Records are streamed on one connection while
+    each chunk's ingredients are read on a second one, since a connection
+    cannot run queries while a server-side cursor is open on it.
+
+    Args:
+        bind: Engine of the request's session
+        owner: Owner columns from owner_values
+        export_format: ndjson or csv
+        chunk_size: Records per chunk written to the response, defaults to
+            EXPORT_CHUNK_SIZE
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    records_db = Session(bind=bind)
+    ingredients_db = Session(bind=bind)
+    exported = 0
+    try:
+        if export_format == "csv":
+            yield ",".join(CSV_COLUMNS) + "\r\n"
+
+        records = (
+            records_db.query(*EXPORT_RECORD_COLUMNS)
+            .filter(owned_by(owner))
+            .order_by(NutritionRecord.meal_time, NutritionRecord.id)
+            .yield_per(chunk_size)
+        )
+        chunk = []
+        for row in records:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield _write_chunk(ingredients_db, chunk, export_format)
+                exported += len(chunk)
+                chunk = []
+        if chunk:
+            yield _write_chunk(ingredients_db, chunk, export_format)
+            exported += len(chunk)
+        logger.info(f"Exported {exported} meals as {export_format}")
+    except Exception as e:
+        # The status line has already been sent, so the export just ends early
+        logger.error(f"Meal export failed after {exported} meals: {str(e)}")
+        raise
+    finally:
+        ingredients_db.close()
+        records_db.close()
+
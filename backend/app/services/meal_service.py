@@ -0,0 +1,353 @@
+import logging
+import math
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+from sqlalchemy import update
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.models.nutrition_models import Ingredient, MealTombstone, NutritionRecord
+from app.models.user_models import User, WeixinUser
+from app.services.rollup_service import local_date, recompute_rollups
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Attempts of a meal write that MySQL aborts to resolve a deadlock
+DEADLOCK_RETRIES = int(os.getenv("DEADLOCK_RETRIES", "3"))
+MYSQL_DEADLOCK = 1213
+# Isolation of meal write transactions, see MealService.commit_with_retry
+WRITE_ISOLATION_LEVEL = "READ COMMITTED"
+
+T = TypeVar("T")
+
+# Analysis fields stored on the record
+RECORD_FIELDS = [
+    "meal_time",
+    "total_carbs",
+    "total_protein",
+    "total_fat",
+    "total_gl",
+    "meal_gl_category",
+    "impact_level",
+    "protein_level",
+    "fat_level",
+    "protein_explanation",
+    "fat_explanation",
+    "impact_explanation",
+    "best_time",
+    "notes",
+]
+
+INGREDIENT_FIELDS = [
+    "name",
+    "portion",
+    "carbs_per_100g",
+    "protein_per_100g",
+    "fat_per_100g",
+    "gi",
+    "gl",
+    "gi_category",
+]
+
+
+def _same_value(stored: Any, value: Any) -> bool:
+    # FLOAT columns are single precision, so compare numbers approximately
+    if isinstance(stored, float) and isinstance(value, (int, float)):
+        return math.isclose(stored, value, rel_tol=1e-6, abs_tol=1e-6)
+    return stored == value
+
+
+def same_ingredients(stored: List[Any], ingredients: List[Dict[str, Any]]) -> bool:
+    """Check whether stored ingredient rows match the submitted ingredients, in order."""
+    if len(stored) != len(ingredients):
+        return False
+    return all(
+        _same_value(getattr(row, field), ingredient.get(field))
+        for row, ingredient in zip(stored, ingredients)
+        for field in INGREDIENT_FIELDS
+    )
+
+
+def owner_values(current_user: Union[User, WeixinUser]) -> Dict[str, Optional[int]]:
+    """Return the owner columns of a record belonging to `current_user`."""
+    return {
+        "user_id": current_user.id if isinstance(current_user, User) else None,
+        "weixin_user_id": current_user.id if isinstance(current_user, WeixinUser) else None,
+    }
+
+
+def owned_by(owner: Dict[str, Optional[int]]):
+    """Filter nutrition records by the owner columns from owner_values."""
+    if owner["user_id"] is not None:
+        return NutritionRecord.user_id == owner["user_id"]
+    return NutritionRecord.weixin_user_id == owner["weixin_user_id"]
+
+
+def is_deadlock(error: OperationalError) -> bool:
+    """Check whether MySQL rolled the transaction back to resolve a deadlock."""
+    return bool(getattr(error.orig, "args", None)) and error.orig.args[0] == MYSQL_DEADLOCK
+
+
+class MealService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def commit_with_retry(self, write: Callable[[], T]) -> T:
+        """
+        Run `write` in a READ COMMITTED transaction, commit, and return its result.
+
+        Under MySQL's default REPEATABLE READ a plain read returns the
+        transaction's snapshot, which can predate meals committed while the
+        write waited for its locks; the daily rollup aggregate must see them.
+        Concurrent saves of new meals can still deadlock. MySQL then rolls one
+        transaction back, and the whole write is run again, up to
+        DEADLOCK_RETRIES times.
+        """
+        for attempt in range(1, DEADLOCK_RETRIES + 1):
+            try:
+                self._begin_write()
+                result = write()
+                self.db.commit()
+                return result
+            except OperationalError as e:
+                self.db.rollback()
+                if not is_deadlock(e) or attempt == DEADLOCK_RETRIES:
+                    raise
+                metrics.increment("meal_write_deadlocks")
+                logger.warning(f"Meal write deadlocked, retrying (attempt {attempt} of {DEADLOCK_RETRIES})")
+
+    def _begin_write(self) -> None:
+        # The isolation level applies from the point a transaction acquires its
+        # connection, so first end the read-only transaction that resolving the
+        # user may have started.
+        if self.db.in_transaction():
+            self.db.commit()
+        self.db.connection(execution_options={"isolation_level": WRITE_ISOLATION_LEVEL})
+
+    def _bump_meals_version(self, owner: Dict[str, Optional[int]]) -> None:
+        """Invalidate the owner's meal history ETags."""
+        model = User if owner["user_id"] is not None else WeixinUser
+        owner_id = owner["user_id"] if owner["user_id"] is not None else owner["weixin_user_id"]
+        self.db.execute(
+            update(model)
+            .where(model.id == owner_id)
+            # Keep updated_at, which tracks profile changes
+            .values(meals_version=model.meals_version + 1, updated_at=model.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+    def save_meal(
+        self,
+        current_user: Union[User, WeixinUser],
+        file_id: str,
+        analysis: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Insert or update the meal for (owner, file_id) and return its id.
+
+        See save_meals. The caller commits.
+
+        Args:
+            current_user: The owner of the meal
+            file_id: Cloud file id of the meal photo, stored as image_url
+            analysis: Analysis result with the record fields and ingredients
+
+        Returns:
+            int: The id of the nutrition record
+        """
+        return self.save_meals(current_user, [(file_id, analysis)])[0]
+
+    def save_meals(
+        self,
+        current_user: Union[User, WeixinUser],
+        meals: List[Tuple[str, Optional[Dict[str, Any]]]],
+    ) -> List[int]:
+        """
+        Insert or update meals keyed on (owner, file_id) and return their ids.
+
+        Records are written with INSERT ... ON DUPLICATE KEY UPDATE against
+        the unique (owner, image_url) index, so concurrent retries of the same
+        save converge on one row. The number of statements does not grow
+        with the number of meals: records are written in multi-row upserts,
+        two per set of analysis fields, and changed ingredients in one
+        delete and one executemany insert. Ingredients
+        that match the stored ones are not rewritten. The daily rollups of
+        each meal's previous and new day are recomputed. The caller commits.
+
+        Args:
+            current_user: The owner of the meals
+            meals: (file_id, analysis) pairs. A file id given twice is saved
+                once, with its last analysis.
+
+        Returns:
+            List[int]: The record id of each meal, in the order given
+        """
+        now = datetime.now(timezone.utc)
+        owner = owner_values(current_user)
+        latest = dict(meals)
+        # Sorted, so that concurrent saves of the same meals lock them in order
+        file_ids = sorted(latest)
+
+        # Rows with the same columns share one multi-row statement
+        groups = defaultdict(list)
+        for file_id in file_ids:
+            values, updated = self._record_values(owner, file_id, latest[file_id], now)
+            groups[(tuple(sorted(values)), updated)].append(values)
+
+        # Create the missing records and lock the existing ones, unchanged.
+        # A locking read before the insert would gap-lock the index for new
+        # meals, and two concurrent first saves of a meal would then deadlock
+        # on each other's gap lock.
+        for rows in groups.values():
+            statement = insert(NutritionRecord).values(rows)
+            self.db.execute(statement.on_duplicate_key_update(id=NutritionRecord.id))
+
+        # Every record now exists and is locked by this transaction, so the
+        # read takes no gap locks and sees the time each meal moves away from
+        previous = {
+            row.image_url: row
+            for row in self.db.query(
+                NutritionRecord.id, NutritionRecord.image_url, NutritionRecord.meal_time
+            )
+            .filter(owned_by(owner), NutritionRecord.image_url.in_(file_ids))
+            .with_for_update()
+        }
+        record_ids = {file_id: row.id for file_id, row in previous.items()}
+
+        for (_, updated), rows in groups.items():
+            if not updated:
+                continue
+            statement = insert(NutritionRecord).values(rows)
+            self.db.execute(
+                statement.on_duplicate_key_update(
+                    **{column: statement.inserted[column] for column in updated}
+                )
+            )
+
+        self._sync_ingredients(
+            {
+                record_ids[file_id]: analysis["ingredients"]
+                for file_id, analysis in latest.items()
+                if analysis is not None and "ingredients" in analysis
+            }
+        )
+
+        # Every locked record's day, also of those saved without analysis
+        days = set()
+        for file_id, analysis in latest.items():
+            row = previous[file_id]
+            if row.meal_time is not None:
+                days.add(local_date(row.meal_time))
+            if analysis is None:
+                continue
+            meal_time = analysis["meal_time"] if "meal_time" in analysis else row.meal_time
+            if meal_time is not None:
+                days.add(local_date(meal_time))
+        if days:
+            recompute_rollups(self.db, owner["user_id"], owner["weixin_user_id"], days)
+        self._bump_meals_version(owner)
+        return [record_ids[file_id] for file_id, _ in meals]
+
+    @staticmethod
+    def _record_values(
+        owner: Dict[str, Optional[int]],
+        file_id: str,
+        analysis: Optional[Dict[str, Any]],
+        now: datetime,
+    ) -> Tuple[Dict[str, Any], Tuple[str, ...]]:
+        """Return the inserted values of a record and the columns an update sets."""
+        values = {**owner, "image_url": file_id, "created_at": now, "updated_at": now}
+        if analysis is None:
+            return values, ()
+
+        updated = tuple(field for field in RECORD_FIELDS if field in analysis) + ("updated_at",)
+        values.update({field: analysis[field] for field in RECORD_FIELDS if field in analysis})
+        values.setdefault("meal_time", now)
+        values.setdefault("notes", "")
+        return values, updated
+
+    def delete_meal(self, current_user: Union[User, WeixinUser], record_id: int) -> bool:
+        """
+        Delete a meal with its ingredients and update the rollup of its day.
+
+        A tombstone records the deletion for delta sync. The caller commits.
+
+        Returns:
+            bool: False if the user has no meal with this id
+        """
+        owner = owner_values(current_user)
+        record = (
+            self.db.query(NutritionRecord.id, NutritionRecord.meal_time)
+            .filter(
+                NutritionRecord.id == record_id,
+                owned_by(owner),
+            )
+            .with_for_update()
+            .first()
+        )
+        if record is None:
+            return False
+
+        self.db.query(Ingredient).filter(Ingredient.nutrition_record_id == record_id).delete(
+            synchronize_session=False
+        )
+        self.db.query(NutritionRecord).filter(NutritionRecord.id == record_id).delete(
+            synchronize_session=False
+        )
+        self.db.execute(
+            insert(MealTombstone).values(
+                **owner, nutrition_record_id=record_id, deleted_at=datetime.now(timezone.utc)
+            )
+        )
+        if record.meal_time is not None:
+            recompute_rollups(
+                self.db, owner["user_id"], owner["weixin_user_id"], [local_date(record.meal_time)]
+            )
+        self._bump_meals_version(owner)
+        return True
+
+    def _sync_ingredients(self, ingredients_by_record: Dict[int, List[Dict[str, Any]]]) -> None:
+        if not ingredients_by_record:
+            return
+
+        # The upsert holds the records' row locks, and a locking read sees
+        # ingredients committed by a concurrent save of the same meal.
+        stored = defaultdict(list)
+        for ingredient in (
+            self.db.query(Ingredient)
+            .filter(Ingredient.nutrition_record_id.in_(list(ingredients_by_record)))
+            .order_by(Ingredient.nutrition_record_id, Ingredient.id)
+            .with_for_update()
+        ):
+            stored[ingredient.nutrition_record_id].append(ingredient)
+
+        changed = [
+            record_id
+            for record_id, ingredients in ingredients_by_record.items()
+            if not same_ingredients(stored[record_id], ingredients)
+        ]
+        if not changed:
+            return
+
+        replaced = [record_id for record_id in changed if stored[record_id]]
+        if replaced:
+            self.db.query(Ingredient).filter(
+                Ingredient.nutrition_record_id.in_(replaced)
+            ).delete(synchronize_session=False)
+        rows = [
+            {
+                "nutrition_record_id": record_id,
+                **{field: ingredient.get(field) for field in INGREDIENT_FIELDS},
+            }
+            for record_id in changed
+            for ingredient in ingredients_by_record[record_id]
+        ]
+        if rows:
+            # A list of parameter sets is sent as one executemany
+            self.db.execute(Ingredient.__table__.insert(), rows)
+        logger.info(f"Rewrote the ingredients of {len(changed)} nutrition records")
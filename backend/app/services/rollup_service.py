@@ -0,0 +1,146 @@
+"""
+Daily nutrition rollups.
+
+meal_daily_rollups keeps the meal count and nutrition totals of each owner
+per local calendar day, so reports read one row per day instead of every
+meal. Rows are recomputed from nutrition_records for the days a write
+touches, inside the writing transaction.
+"""
+import os
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import Session
+
+from app.models.nutrition_models import MealDailyRollup, NutritionRecord
+
+# Meals are bucketed into days of this timezone
+ROLLUP_TIMEZONE = ZoneInfo(os.getenv("ROLLUP_TIMEZONE", "Asia/Shanghai"))
+
+GRANULARITIES = ("day", "week", "month")
+
+TOTAL_FIELDS = ["total_carbs", "total_protein", "total_fat", "total_gl"]
+
+
+def local_date(meal_time: datetime) -> date:
+    """Return the rollup day of a meal time stored in UTC."""
+    if meal_time.tzinfo is None:
+        meal_time = meal_time.replace(tzinfo=timezone.utc)
+    return meal_time.astimezone(ROLLUP_TIMEZONE).date()
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """Return the UTC start and end of a local day."""
+    start = datetime.combine(day, time.min, tzinfo=ROLLUP_TIMEZONE)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=ROLLUP_TIMEZONE)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+def today() -> date:
+    """Return the current date in the rollup timezone."""
+    return datetime.now(ROLLUP_TIMEZONE).date()
+
+
+def recompute_rollups(
+    db: Session,
+    user_id: Optional[int],
+    weixin_user_id: Optional[int],
+    days: Iterable[date],
+) -> None:
+    """
+    Recompute the rollup rows of one owner for the given local days.
+
+    Days without meals lose their row. The caller commits, in a READ
+    COMMITTED transaction such as those of MealService.commit_with_retry.
+
+    Args:
+        db: Database session
+        user_id: Owner id for email users
+        weixin_user_id: Owner id for Weixin users
+        days: Local days whose meals changed
+    """
+    owner_column = NutritionRecord.user_id if user_id is not None else NutritionRecord.weixin_user_id
+    rollup_owner = MealDailyRollup.user_id if user_id is not None else MealDailyRollup.weixin_user_id
+    owner_id = user_id if user_id is not None else weixin_user_id
+    now = datetime.now(timezone.utc)
+    days = sorted(set(days))
+    if not days:
+        return
+
+    # Serialize recomputations of a day on its rollup row: create it if it
+    # is missing, or lock it, before the meals are read.
+    empty = {"meal_count": 0, **{field: 0.0 for field in TOTAL_FIELDS}, "updated_at": now}
+    statement = insert(MealDailyRollup).values(
+        [
+            {"user_id": user_id, "weixin_user_id": weixin_user_id, "local_date": day, **empty}
+            for day in days
+        ]
+    )
+    db.execute(statement.on_duplicate_key_update(id=MealDailyRollup.id))
+
+    for day in days:
+        start, end = day_bounds(day)
+        totals = (
+            db.query(
+                func.count(NutritionRecord.id).label("meal_count"),
+                *[
+                    func.coalesce(func.sum(getattr(NutritionRecord, field)), 0).label(field)
+                    for field in TOTAL_FIELDS
+                ],
+            )
+            .filter(
+                owner_column == owner_id,
+                NutritionRecord.meal_time >= start,
+                NutritionRecord.meal_time < end,
+            )
+            # The rollup row lock serializes recomputations of the day, so a
+            # plain read is enough. Meal writes run as READ COMMITTED (see
+            # MealService.commit_with_retry), so it sees every committed meal.
+            .one()
+        )
+
+        if totals.meal_count == 0:
+            db.query(MealDailyRollup).filter(
+                rollup_owner == owner_id, MealDailyRollup.local_date == day
+            ).delete(synchronize_session=False)
+            continue
+
+        values = {field: float(getattr(totals, field)) for field in TOTAL_FIELDS}
+        values["meal_count"] = totals.meal_count
+        values["updated_at"] = now
+        db.query(MealDailyRollup).filter(
+            rollup_owner == owner_id, MealDailyRollup.local_date == day
+        ).update(values, synchronize_session=False)
+
+
+def period_start(day: date, granularity: str) -> date:
+    """Return the first day of the day, week (Monday) or month containing `day`."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def summarize(rollups: Iterable[MealDailyRollup], granularity: str) -> List[dict]:
+    """Sum daily rollups, ordered by day, into periods of the given granularity."""
+    periods = OrderedDict()
+    for rollup in rollups:
+        start = period_start(rollup.local_date, granularity)
+        if start not in periods:
+            periods[start] = {"period": start.isoformat(), "meal_count": 0, "days": 0}
+            periods[start].update({field: 0.0 for field in TOTAL_FIELDS})
+        period = periods[start]
+        period["meal_count"] += rollup.meal_count
+        period["days"] += 1
+        for field in TOTAL_FIELDS:
+            period[field] += getattr(rollup, field)
+
+    for period in periods.values():
+        for field in TOTAL_FIELDS:
+            period[field] = round(period[field], 1)
+    return list(periods.values())
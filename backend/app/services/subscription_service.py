@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Optional, Dict, Any, List
+import json
 import logging
 
 from sqlalchemy.orm import Session
@@ -12,9 +13,12 @@ from app.schemas.subscription import (
     PendingSubscription
 )
 from app.config.subscription_plans import SUBSCRIPTION_PLANS
+from app.utils.etag import make_etag
 
 logger = logging.getLogger(__name__)
 
+PLANS_VERSION = make_etag(json.dumps(SUBSCRIPTION_PLANS, sort_keys=True, default=str))
+
 
 class SubscriptionService:
     def __init__(self, db: Session):
@@ -158,6 +162,25 @@ class SubscriptionService:
                 logger.error(f"Error updating subscription statuses: {str(e)}")
                 raise ValueError(f"Failed to update subscription statuses: {str(e)}")
 
+    def status_etag(self, user_id: str) -> str:
+        """
+        Entity tag of get_subscription_status for a user.
+
+        The status only depends on the user's subscription rows, the plan
+        configuration and the current day, so the tag changes exactly when
+        the status could.
+        """
+        rows = self.db.query(
+            Subscription.id,
+            Subscription.plan_id,
+            Subscription.status,
+            Subscription.start_date,
+            Subscription.expires_at,
+            Subscription.updated_at,
+        ).filter(Subscription.user_id == user_id).order_by(Subscription.id).all()
+        today = datetime.utcnow().date()
+        return make_etag(user_id, today, PLANS_VERSION, *[tuple(row) for row in rows])
+
     def get_subscription_status(self, user_id: str) -> Dict[str, Any]:
         """Get current subscription status for a user"""
         self.update_expired_subscriptions(user_id)
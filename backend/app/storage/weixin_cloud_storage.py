@@ -1,9 +1,39 @@
+import asyncio
+import weakref
+
+import aiohttp
 import requests
 from typing import Optional, Dict
 import os
 import time
 from pathlib import Path
 
+# Timeout in seconds of a request to the Weixin API from the event loop
+WEIXIN_API_TIMEOUT = float(os.getenv("WEIXIN_API_TIMEOUT", "10"))
+
+# Shared sessions, one per event loop. aiohttp connections are bound to the
+# loop that opened them, and the API and the task processor run separate loops.
+_shared_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_shared_session() -> aiohttp.ClientSession:
+    """Return the pooled aiohttp session for the running event loop, creating it once."""
+    loop = asyncio.get_running_loop()
+    session = _shared_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=WEIXIN_API_TIMEOUT))
+        _shared_sessions[loop] = session
+    return session
+
+
+async def close_shared_session() -> None:
+    """Close the pooled aiohttp session of the running event loop, if any."""
+    session = _shared_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
 
 class WeixinCloudStorage:
     def __init__(
@@ -154,14 +184,50 @@ class WeixinCloudStorage:
 
         # print("Debug - Download response:", result)  # Debug info
 
+        return self._parse_download_url(result)
+
+    async def get_download_url_async(self, file_id: str) -> str:
+        """
+        Get download URL for a file without blocking the event loop
+
+        Args:
+            file_id: File ID from upload response
+
+        Returns:
+            str: Download URL
+        """
+        url = f"{self.base_url}/tcb/batchdownloadfile"
+        json_data = {
+            "env": self.env_id,
+            "file_list": [
+                {"fileid": file_id, "max_age": 7200}  # URL valid for 2 hours
+            ],
+        }
+
+        async with get_shared_session().post(
+            url, json=json_data, ssl=None if self.verify_ssl else False
+        ) as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+
+        return self._parse_download_url(result)
+
+    def _parse_download_url(self, result: Dict) -> str:
+        """Extract the download URL from a batchdownloadfile response"""
         if result.get("errcode", 0) != 0:
             raise Exception(
                 f"Failed to get download URL: {result.get('errmsg', 'Unknown error')}"
             )
 
-        if not result.get("file_list") or not result["file_list"][0].get(
-            "download_url"
-        ):
+        if not result.get("file_list"):
+            raise Exception("No download URL in response")
+        # Errors of a single file are reported in its own status
+        file_info = result["file_list"][0]
+        if file_info.get("status", 0) != 0:
+            raise Exception(
+                f"Failed to get download URL: {file_info.get('errmsg', 'Unknown error')}"
+            )
+        if not file_info.get("download_url"):
             raise Exception("No download URL in response")
 
         return result["file_list"][0]["download_url"]
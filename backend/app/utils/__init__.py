@@ -5,12 +5,19 @@ Utility functions package.
 from . import weixin_auth
 from .weixin_auth import get_weixin_openid
 from . import background_tasks
-from .background_tasks import process_image_background_thread, shutdown_background_tasks
+from .background_tasks import (
+    enqueue_task,
+    process_image_task,
+    start_background_tasks,
+    shutdown_background_tasks,
+)
 
 __all__ = [
     "weixin_auth", 
     "get_weixin_openid", 
     "background_tasks", 
-    "process_image_background_thread", 
+    "enqueue_task",
+    "process_image_task", 
+    "start_background_tasks",
     "shutdown_background_tasks"
 ]
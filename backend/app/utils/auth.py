@@ -1,8 +1,12 @@
 from passlib.context import CryptContext
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 from jose import JWTError, jwt
+import hashlib
 import os
+import threading
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
@@ -18,6 +22,8 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(
     os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(7 * 24 * 60))
 )  # Default to 7 days
+# Verified tokens remembered until they expire, 0 disables the cache
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
@@ -58,11 +64,49 @@ def authenticate_user(email: str, password: str, db: Session) -> Optional[User]:
     return user
 
 
-def decode_access_token(token: str) -> Optional[int]:
+# sha256 of each verified token -> (exp as a Unix timestamp, subject)
+_verified_tokens: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
+def _cached_subject(key: bytes) -> Optional[str]:
+    with _verified_tokens_lock:
+        entry = _verified_tokens.get(key)
+        if entry is None:
+            return None
+        expires_at, subject = entry
+        if expires_at <= time.time():
+            del _verified_tokens[key]
+            return None
+        _verified_tokens.move_to_end(key)
+        return subject
+
+
+def _cache_subject(key: bytes, expires_at: float, subject: str) -> None:
+    with _verified_tokens_lock:
+        _verified_tokens[key] = (expires_at, subject)
+        _verified_tokens.move_to_end(key)
+        while len(_verified_tokens) > TOKEN_CACHE_MAX_ENTRIES:
+            _verified_tokens.popitem(last=False)
+
+
+def decode_access_token(token: str) -> Optional[str]:
+    """
+    Verify a token and return its subject, or None if it is invalid.
+
+    Verified tokens that carry an expiry are remembered until then, so a
+    client reusing its token is not re-verified on every request.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    subject = _cached_subject(key)
+    if subject is not None:
+        return subject
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
-        # Convert string back to int for internal use
+        # jwt.decode has checked exp, tokens without one are not cached
+        if TOKEN_CACHE_MAX_ENTRIES > 0 and user_id is not None and payload.get("exp") is not None:
+            _cache_subject(key, float(payload["exp"]), user_id)
         return user_id
     except (JWTError, ValueError):
         return None
@@ -1,29 +1,87 @@
 import logging
 import os
+import socket
 import threading
 import traceback
 import asyncio
 import time
 import json
-import concurrent.futures
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Collection, List, Optional
 
+from sqlalchemy import and_, or_, update
 from sqlalchemy.orm import Session
 
-from app.models.meal_models import Meal
 from app.models.task_models import Task, TaskStatus
-from app.utils.gpt_client import GPTClient
-from app.utils.food_analyzer import analyze_food_image
-from app.storage.weixin_cloud_storage import WeixinCloudStorage
+from app.utils.gpt_client import get_shared_gpt_client, close_shared_gpt_client
+from app.utils.food_analyzer import analyze_food_image, correct_food_analysis
+from app.utils import metrics
+from app.utils.image_prefilter import ImageRejectedError
+from app.utils.image_processing import (
+    ImageProcessingError,
+    image_digest,
+    load_image_bytes,
+    prepare_image,
+    shutdown_image_pool,
+)
+from app.storage.weixin_cloud_storage import WeixinCloudStorage, close_shared_session
 
 logger = logging.getLogger(__name__)
 
-# Create a thread pool executor for processing tasks
-thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+# Maximum number of tasks this process runs at the same time. Tasks spend
+# almost all their time waiting on the network, so this can be far higher
+# than the number of CPU cores.
+TASK_WORKER_CONCURRENCY = int(os.getenv("TASK_WORKER_CONCURRENCY", "32"))
 
 # Flag to control the task processor thread
-task_processor_running = True
+task_processor_running = False
+task_processor_thread: Optional[threading.Thread] = None
+
+# Event loop of the task processor thread and its wake-up queue of task ids
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wakeup: Optional[asyncio.Queue] = None
+_loop_ready = threading.Event()
+
+# Queued instead of a task id to request an immediate reconciliation scan
+_RECONCILE_NOW = object()
+
+# Task ids claimed by this process and not yet finished, with their asyncio tasks
+_inflight_tasks = {}
+
+# Seconds between fallback scans of the tasks table. The scan only picks up
+# tasks that were never signalled through enqueue_task (e.g. created by another
+# process or left over from a restart), so it can be slow.
+TASK_RECONCILE_INTERVAL = float(os.getenv("TASK_RECONCILE_INTERVAL", "30"))
+TASK_RECONCILE_BATCH_SIZE = int(os.getenv("TASK_RECONCILE_BATCH_SIZE", "50"))
+
+# Lease settings for claimed tasks. A task whose lease expires without a
+# heartbeat is considered abandoned and can be claimed by another worker.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "60"))
+TASK_HEARTBEAT_INTERVAL = float(
+    os.getenv("TASK_HEARTBEAT_INTERVAL", str(TASK_LEASE_SECONDS / 3))
+)
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+# Monotonic time of the next sweep for tasks that exhausted their attempts.
+# Leases run for TASK_LEASE_SECONDS, so sweeping more often finds nothing new.
+_next_exhausted_sweep = 0.0
+
+# Statuses held by a task while a worker owns its lease
+LEASED_STATUSES = [TaskStatus.CLAIMED, TaskStatus.PROCESSING]
+
+
+# Progress reported once streamed ingredients are available, before the notes
+TASK_PARTIAL_RESULT_PROGRESS = 40
+
+# A photo re-submitted by the same user within this many seconds of a
+# completed analysis reuses that result instead of calling the model again
+TASK_DUPLICATE_WINDOW = int(os.getenv("TASK_DUPLICATE_WINDOW", "300"))
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker no longer owns the lease of the task it is running."""
+
 
 # --- Nutrition lookup loaded once at module level ---
 try:
@@ -45,185 +103,714 @@ def get_nutrition_lookup():
     """Return the nutrition lookup dictionary loaded from ingredients.json."""
     return _nutrition_lookup
 
-# Function to process tasks from the database
-def process_pending_tasks():
-    """Background thread that continuously processes pending tasks from the database."""
-    logger.info(f"Starting task processor thread - Process ID: {os.getpid()}, Thread ID: {threading.get_ident()}")
-    
+
+def apply_nutrition_lookup(ingredients: list) -> None:
+    """Replace GPT nutrition estimates with lookup values for known ingredients."""
+    nutrition_lookup = get_nutrition_lookup()
+    for ing in ingredients:
+        name = ing.get("name")
+        if name in nutrition_lookup:
+            logger.info(f"Found nutrition data for {name} in lookup")
+            lookup = nutrition_lookup[name]
+            ing["gi"] = lookup.get("gi", ing.get("gi"))
+            ing["carbs_per_100g"] = lookup.get("carbs_per_100g", ing.get("carbs_per_100g"))
+            ing["protein_per_100g"] = lookup.get("protein_per_100g", ing.get("protein_per_100g"))
+            ing["fat_per_100g"] = lookup.get("fat_per_100g", ing.get("fat_per_100g"))
+
+
+def _claimable(now: datetime):
+    """Filter matching tasks that are pending or whose lease has expired."""
+    return and_(
+        Task.attempts < TASK_MAX_ATTEMPTS,
+        or_(
+            Task.status == TaskStatus.PENDING,
+            and_(Task.status.in_(LEASED_STATUSES), Task.lease_expires_at < now),
+        ),
+    )
+
+
+def claim_task(db: Session, task_id: int, owner: str = WORKER_ID) -> bool:
+    """Atomically move a task to CLAIMED and take its lease.
+
+    The conditional UPDATE only matches a pending task or one with an expired
+    lease, so when several workers race for the same task exactly one wins.
+
+    Returns:
+        bool: True if this worker now owns the task
+    """
+    now = datetime.now(timezone.utc)
+    result = db.execute(
+        update(Task)
+        .where(Task.id == task_id, _claimable(now))
+        .values(
+            status=TaskStatus.CLAIMED,
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=TASK_LEASE_SECONDS),
+            attempts=Task.attempts + 1,
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def claim_pending_tasks(
+    db: Session,
+    limit: int = TASK_RECONCILE_BATCH_SIZE,
+    owner: str = WORKER_ID,
+    exclude: Collection[int] = (),
+) -> List[Task]:
+    """Claim up to `limit` claimable tasks, oldest first.
+
+    Rows locked by another worker's claim are skipped rather than waited on.
+    Tasks in `exclude`, those this worker is still running, are not claimed
+    again even if their lease has expired, as the claim reuses the owner.
+    """
+    now = datetime.now(timezone.utc)
+    query = db.query(Task.id).filter(_claimable(now))
+    if exclude:
+        query = query.filter(Task.id.notin_(exclude))
+    task_ids = [
+        row.id
+        for row in query
+        .order_by(Task.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    ]
+    if not task_ids:
+        db.commit()
+        return []
+
+    db.execute(
+        update(Task)
+        .where(Task.id.in_(task_ids))
+        .values(
+            status=TaskStatus.CLAIMED,
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=TASK_LEASE_SECONDS),
+            attempts=Task.attempts + 1,
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return db.query(Task).filter(Task.id.in_(task_ids)).order_by(Task.created_at).all()
+
+
+def fail_exhausted_tasks(db: Session) -> int:
+    """Fail tasks whose lease expired after TASK_MAX_ATTEMPTS claims."""
+    now = datetime.now(timezone.utc)
+    result = db.execute(
+        update(Task)
+        .where(
+            Task.status.in_(LEASED_STATUSES),
+            Task.lease_expires_at < now,
+            Task.attempts >= TASK_MAX_ATTEMPTS,
+        )
+        .values(
+            status=TaskStatus.FAILED,
+            error="Task was abandoned too many times",
+            lease_expires_at=None,
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def update_claimed_task(
+    db: Session,
+    task_id: int,
+    status: TaskStatus,
+    progress: Optional[int] = None,
+    result: Optional[dict] = None,
+    error: Optional[str] = None,
+    owner: str = WORKER_ID,
+) -> None:
+    """Update a task this worker has claimed, renewing its lease.
+
+    Raises:
+        LeaseLostError: If another worker has taken over the task
+    """
+    now = datetime.now(timezone.utc)
+    values = {"status": status, "updated_at": now}
+    if progress is not None:
+        values["progress"] = progress
+    if result is not None:
+        values["result"] = result
+    if error is not None:
+        values["error"] = error
+    if status in LEASED_STATUSES:
+        values["lease_expires_at"] = now + timedelta(seconds=TASK_LEASE_SECONDS)
+    else:
+        values["lease_expires_at"] = None
+
+    updated = db.execute(
+        update(Task)
+        .where(Task.id == task_id, Task.lease_owner == owner)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if updated.rowcount != 1:
+        raise LeaseLostError(f"Lease on task {task_id} is no longer held by {owner}")
+
+
+def record_image_digest(
+    db: Session,
+    task_id: int,
+    digest: str,
+    find_duplicate: bool = True,
+    owner: str = WORKER_ID,
+) -> Optional[Task]:
+    """Store the image digest of a claimed task and look for a recent duplicate.
+
+    Returns:
+        Optional[Task]: The latest task of the same user that completed the
+            same image within TASK_DUPLICATE_WINDOW seconds, if any
+
+    Raises:
+        LeaseLostError: If another worker has taken over the task
+    """
+    task = db.query(Task).filter(Task.id == task_id, Task.lease_owner == owner).first()
+    if task is None:
+        raise LeaseLostError(f"Lease on task {task_id} is no longer held by {owner}")
+    task.image_digest = digest
+    db.commit()
+
+    if not find_duplicate:
+        return None
+
+    since = datetime.now(timezone.utc) - timedelta(seconds=TASK_DUPLICATE_WINDOW)
+    return (
+        db.query(Task)
+        .filter(
+            Task.id != task_id,
+            Task.image_digest == digest,
+            Task.user_id == task.user_id,
+            Task.weixin_user_id == task.weixin_user_id,
+            Task.status == TaskStatus.COMPLETED,
+            Task.updated_at >= since,
+        )
+        .order_by(Task.updated_at.desc())
+        .first()
+    )
+
+
+def _renew_lease(task_id: int, owner: str) -> bool:
+    from app.database.database import SessionLocal
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        renewed = db.execute(
+            update(Task)
+            .where(
+                Task.id == task_id,
+                Task.lease_owner == owner,
+                Task.status.in_(LEASED_STATUSES),
+            )
+            .values(lease_expires_at=now + timedelta(seconds=TASK_LEASE_SECONDS))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return renewed.rowcount == 1
+    finally:
+        db.close()
+
+
+class LeaseHeartbeat:
+    """Periodically renew the lease of a claimed task while it runs."""
+
+    def __init__(self, task_id: int, owner: str = WORKER_ID):
+        self.task_id = task_id
+        self.owner = owner
+        self.lost = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(TASK_HEARTBEAT_INTERVAL)
+            try:
+                renewed = await asyncio.to_thread(_renew_lease, self.task_id, self.owner)
+            except Exception as e:
+                logger.error(f"Failed to renew lease on task {self.task_id}: {str(e)}")
+                continue
+            if not renewed:
+                logger.warning(f"Lost lease on task {self.task_id}")
+                self.lost = True
+                return
+
+
+async def _update_task(task_id: int, status: TaskStatus, **kwargs) -> None:
+    """Run update_claimed_task on its own session without blocking the loop."""
+    from app.database.database import SessionLocal
+
+    def run():
+        db = SessionLocal()
+        try:
+            update_claimed_task(db, task_id, status, **kwargs)
+        finally:
+            db.close()
+
+    await asyncio.to_thread(run)
+
+
+async def _find_duplicate_result(
+    task_id: int, digest: str, find_duplicate: bool
+) -> Optional[dict]:
+    """Run record_image_digest on its own session and return the duplicate's result."""
+    from app.database.database import SessionLocal
+
+    def run():
+        db = SessionLocal()
+        try:
+            duplicate = record_image_digest(db, task_id, digest, find_duplicate)
+            if duplicate is None:
+                return None
+            logger.info(f"Task {task_id} re-submits the image of task {duplicate.id}")
+            return duplicate.result
+        finally:
+            db.close()
+
+    return await asyncio.to_thread(run)
+
+
+def enqueue_task(task_id: int) -> None:
+    """Wake the task processor for a task that has just been committed.
+
+    Safe to call from any thread. Does nothing when this process does not run
+    tasks; a standalone worker will find the task on its next scan instead.
+    """
+    if task_processor_running and _loop is not None:
+        _loop.call_soon_threadsafe(_wakeup.put_nowait, task_id)
+
+
+def available_slots() -> int:
+    """Number of additional tasks this process can run right now."""
+    return max(TASK_WORKER_CONCURRENCY - len(_inflight_tasks), 0)
+
+
+def get_worker_stats() -> dict:
+    """Snapshot of the task processor state for health checks."""
+    return {
+        "worker_id": WORKER_ID,
+        "running": task_processor_running,
+        "concurrency": TASK_WORKER_CONCURRENCY,
+        "in_flight": len(_inflight_tasks),
+    }
+
+
+def runnable_params(task: Task, db: Session) -> Optional[dict]:
+    """Return the parameters of a claimed task, failing it if they are invalid."""
+    params = task.params or {}
+    if not params.get("file_id"):
+        # Mark the task as failed if it doesn't have required parameters
+        update_claimed_task(
+            db, task.id, TaskStatus.FAILED, error="Missing required parameters"
+        )
+        return None
+    return params
+
+
+def start_claimed_task(task_id: int, params: dict) -> asyncio.Task:
+    """Start processing a task this worker has claimed on the running loop."""
+    task = asyncio.create_task(
+        process_image_task(
+            task_id=task_id,
+            file_id=params["file_id"],
+            previous_ingredients=params.get("previous_ingredients"),
+            user_comment=params.get("user_comment"),
+        )
+    )
+    _inflight_tasks[task_id] = task
+
+    def finish(_):
+        _inflight_tasks.pop(task_id, None)
+        # A slot is free again, look for tasks that were left pending meanwhile
+        if task_processor_running and _wakeup is not None:
+            _wakeup.put_nowait(_RECONCILE_NOW)
+
+    task.add_done_callback(finish)
+    logger.info(f"Started task {task_id}")
+    return task
+
+
+def _claim_task_params(task_id: int) -> Optional[dict]:
+    from app.database.database import SessionLocal
+    db = SessionLocal()
+    try:
+        if not claim_task(db, task_id):
+            return None
+        task = db.query(Task).filter(Task.id == task_id).first()
+        return runnable_params(task, db)
+    finally:
+        db.close()
+
+
+async def dispatch_task(task_id: int) -> bool:
+    """Claim a task and start processing it.
+
+    Returns:
+        bool: True if this worker claimed and started the task
+    """
+    # Leave the task pending rather than holding a lease on it while it
+    # waits for a free slot; it is picked up when a slot frees up.
+    if available_slots() == 0:
+        return False
+    # Already running here, e.g. after its lease expired while it ran
+    if task_id in _inflight_tasks:
+        return False
+    params = await asyncio.to_thread(_claim_task_params, task_id)
+    if params is None:
+        return False
+    start_claimed_task(task_id, params)
+    return True
+
+
+def _claim_pending_task_params(
+    limit: int, sweep_exhausted: bool = True, exclude: Collection[int] = ()
+) -> List[tuple]:
+    from app.database.database import SessionLocal
+    db = SessionLocal()
+    try:
+        if sweep_exhausted:
+            exhausted = fail_exhausted_tasks(db)
+            if exhausted:
+                logger.warning(f"Failed {exhausted} tasks that exceeded {TASK_MAX_ATTEMPTS} attempts")
+        claimed = []
+        if limit == 0:
+            return claimed
+        for task in claim_pending_tasks(db, limit=limit, exclude=exclude):
+            params = runnable_params(task, db)
+            if params is not None:
+                claimed.append((task.id, params))
+        return claimed
+    finally:
+        db.close()
+
+
+async def reconcile_pending_tasks() -> int:
+    """Claim and start tasks that were never signalled to this process.
+
+    This also recovers tasks whose worker died and let the lease expire, and
+    fails those that exhausted their attempts, at most every TASK_LEASE_SECONDS.
+
+    Returns:
+        int: Number of tasks started
+    """
+    global _next_exhausted_sweep
+    slots = min(available_slots(), TASK_RECONCILE_BATCH_SIZE)
+    sweep_exhausted = time.monotonic() >= _next_exhausted_sweep
+    if slots == 0 and not sweep_exhausted:
+        return 0
+    if sweep_exhausted:
+        _next_exhausted_sweep = time.monotonic() + TASK_LEASE_SECONDS
+    # Snapshot on the loop, which is the only place the in-flight tasks change
+    claimed = await asyncio.to_thread(
+        _claim_pending_task_params, slots, sweep_exhausted, list(_inflight_tasks)
+    )
+    for task_id, params in claimed:
+        start_claimed_task(task_id, params)
+    if claimed:
+        logger.info(f"Reconciliation scan started {len(claimed)} pending tasks")
+    return len(claimed)
+
+
+def idle_backoff(
+    interval: float, started: int, base: float, maximum: Optional[float] = None
+) -> float:
+    """Seconds until the next scan of the tasks table.
+
+    Without `maximum` scans run every `base` seconds. Otherwise each scan that
+    started no task doubles the interval, up to `maximum`, and a scan that
+    started one returns it to `base`.
+    """
+    if started or maximum is None:
+        return base
+    return min(interval * 2, max(maximum, base))
+
+
+async def process_pending_tasks(
+    reconcile_interval: float = TASK_RECONCILE_INTERVAL,
+    max_reconcile_interval: Optional[float] = None,
+):
+    """Dispatch tasks as soon as they are enqueued.
+
+    The tasks table stays the durable record: when no task has been signalled
+    for `reconcile_interval` seconds, the table is scanned for pending tasks
+    that were missed. With `max_reconcile_interval`, an idle process backs off
+    to scanning that often, see idle_backoff. On shutdown, waits for in-flight
+    tasks to finish.
+    """
+    global _loop, _wakeup
+    logger.info(f"Starting task processor - Process ID: {os.getpid()}, Thread ID: {threading.get_ident()}")
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Queue()
+    _loop_ready.set()
+
+    # One pooled OpenAI client for every task run on this loop
+    get_shared_gpt_client()
+
+    # Pick up tasks left pending before this process started
+    next_reconcile = 0.0
+    interval = reconcile_interval
+
     while task_processor_running:
         try:
-            # Create a new database session for this iteration
-            from app.database.database import SessionLocal
-            db = SessionLocal()
-            
+            now = time.monotonic()
+            if now >= next_reconcile:
+                started = await reconcile_pending_tasks()
+                interval = idle_backoff(interval, started, reconcile_interval, max_reconcile_interval)
+                next_reconcile = time.monotonic() + interval
+                continue
+
             try:
-                # Find the oldest pending task
-                task = db.query(Task).filter(
-                    Task.status == TaskStatus.PENDING
-                ).order_by(Task.created_at).first()
-                
-                if task:
-                    logger.info(f"Found pending task {task.id} to process")
-                    
-                    # Get the task parameters
-                    params = task.params or {}
-                    file_id = params.get("file_id")
-                    user_comment = params.get("user_comment")
-                    
-                    if file_id:
-                        # Submit the task to the thread pool
-                        thread_pool.submit(
-                            process_image_background_thread,
-                            task_id=task.id,
-                            file_id=file_id,
-                            user_comment=user_comment
-                        )
-                    else:
-                        # Mark the task as failed if it doesn't have required parameters
-                        task.update_status(
-                            TaskStatus.FAILED, 
-                            error="Missing required parameters"
-                        )
-                        db.commit()
-                
-            finally:
-                # Always close the database session
-                db.close()
-                
-            # Sleep for a short time before checking for more tasks
-            # This prevents excessive database queries
-            time.sleep(1)
-            
+                task_id = await asyncio.wait_for(
+                    _wakeup.get(), timeout=next_reconcile - now
+                )
+            except asyncio.TimeoutError:
+                continue
+
+            if task_id is _RECONCILE_NOW:
+                next_reconcile = 0.0
+            # None is the shutdown sentinel
+            elif task_id is not None:
+                await dispatch_task(task_id)
+
         except Exception as e:
-            logger.error(f"Error in task processor thread: {str(e)}")
+            logger.error(f"Error in task processor: {str(e)}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             # Sleep a bit longer after an error to prevent rapid failure loops
-            time.sleep(5)
+            await asyncio.sleep(5)
+
+    # Let the tasks that are already running finish
+    if _inflight_tasks:
+        logger.info(f"Waiting for {len(_inflight_tasks)} in-flight tasks")
+        await asyncio.gather(*_inflight_tasks.values(), return_exceptions=True)
 
+    await close_shared_gpt_client()
+    await close_shared_session()
+    await asyncio.to_thread(shutdown_image_pool)
 
-# Function to process image in a background thread
-def process_image_background_thread(
+
+async def process_image_task(
     task_id: int,
     file_id: str,
-    analysis: Optional[Meal] = None,
+    previous_ingredients: Optional[List[dict]] = None,
     user_comment: Optional[str] = None,
 ):
-    """Background task for processing an image, designed to run in a separate thread."""
-    logger.info(f"Starting threaded background task for image processing: {task_id} - Process ID: {os.getpid()}, Thread ID: {threading.get_ident()}")
-    
-    # Create new database session
-    from app.database.database import SessionLocal
-    db = SessionLocal()
-    
-    # Create new GPT client
-    gpt_client = GPTClient()
-    
-    # Create new storage client
-    from app.dependencies import get_storage
-    storage = get_storage()
-    
+    """Process an image analysis task on the task processor's event loop.
+
+    Corrections (previous ingredients plus a user comment) are answered by the
+    text model first and only fall back to re-analysing the image.
+
+    The task must already be claimed by this worker (see claim_task). Every
+    status write is fenced on the lease owner, so a worker that lost its lease
+    stops without overwriting the new owner's progress.
+    """
+    logger.info(f"Starting image processing task {task_id}")
+
     try:
-        # Get task from database
-        task = db.query(Task).filter(Task.id == task_id).first()
-        if not task:
-            logger.error(f"Task {task_id} not found")
-            return
-        
-        # Update task status to processing
-        task.update_status(TaskStatus.PROCESSING, progress=10)
-        db.commit()
-        logger.info(f"Task {task_id} updated: status={task.status}, progress={task.progress}")
-        
-        # Process image URL
-        if file_id.startswith("cloud://"):
-            img_url = storage.get_download_url(file_id)
-        else:
-            img_url = file_id
-            
-        # Update progress
-        task.update_status(TaskStatus.PROCESSING, progress=20)
-        db.commit()
-        
-        # Prepare context if needed
-        context = None
-        if analysis or user_comment:
-            context = {}
-            if analysis:
-                context["previous_analysis"] = analysis.model_dump()
-            if user_comment:
-                context["user_comment"] = user_comment
-                
-        # Update progress
-        task.update_status(TaskStatus.PROCESSING, progress=30)
-        db.commit()
-        
-        # First get ingredients analysis using asyncio.run
-        gpt_analysis = asyncio.run(analyze_food_image(img_url, gpt_client, context))
-
-        # Use nutrition lookup loaded at module level
-        nutrition_lookup = get_nutrition_lookup()
-
-        # Replace nutrition info for known ingredients
-        if gpt_analysis and "ingredients" in gpt_analysis:
-            for ing in gpt_analysis["ingredients"]:
-                name = ing.get("name")
-                if name in nutrition_lookup:
-                    logger.info(f"Found nutrition data for {name} in lookup")
-                    lookup = nutrition_lookup[name]
-                    ing["gi"] = lookup.get("gi", ing.get("gi"))
-                    ing["carbs_per_100g"] = lookup.get("carbs_per_100g", ing.get("carbs_per_100g"))
-                    ing["protein_per_100g"] = lookup.get("protein_per_100g", ing.get("protein_per_100g"))
-                    ing["fat_per_100g"] = lookup.get("fat_per_100g", ing.get("fat_per_100g"))
-
-        # Update progress
-        task.update_status(TaskStatus.PROCESSING, progress=50)
-        db.commit()
-        
-        # Then get meal notes with the ingredients analysis as context
-        # notes = gpt_analysis["notes"]
-        
-        # Update progress
-        # task.update_status(TaskStatus.PROCESSING, progress=90)
-        # db.commit()
-            
-        # Create meal response
-        # meal = {
-        #     "ingredients": ingredients,
-        #     "notes": notes,
-        # }
-        
-        # Update task with result
-        task.update_status(TaskStatus.COMPLETED, progress=100, result=gpt_analysis)
-        db.commit()
-        
-        logger.info(f"Successfully completed threaded background task for image processing: {task_id}")
-            
+        gpt_client = get_shared_gpt_client()
+
+        # Create new storage client
+        from app.dependencies import get_storage
+        storage = get_storage()
+
+        async with LeaseHeartbeat(task_id) as heartbeat:
+            # Update task status to processing
+            await _update_task(task_id, TaskStatus.PROCESSING, progress=10)
+            logger.info(f"Task {task_id} updated: status={TaskStatus.PROCESSING}, progress=10")
+
+            if previous_ingredients and user_comment:
+                corrected = await correct_food_analysis(
+                    previous_ingredients, user_comment, gpt_client
+                )
+                if corrected is not None:
+                    metrics.increment("correction_text_only")
+                    apply_nutrition_lookup(corrected["ingredients"])
+                    if heartbeat.lost:
+                        raise LeaseLostError(f"Lease on task {task_id} expired during analysis")
+                    await _update_task(
+                        task_id, TaskStatus.COMPLETED, progress=100, result=corrected
+                    )
+                    logger.info(f"Completed task {task_id} with a text-only correction")
+                    return
+                metrics.increment("correction_image_fallback")
+
+            # Process image URL
+            if file_id.startswith("cloud://"):
+                img_url = await storage.get_download_url_async(file_id)
+            else:
+                img_url = file_id
+
+            # Cloud file IDs are unique per upload, so they identify the image
+            # for the cache when its content cannot be fetched
+            image_key = file_id
+            try:
+                original = await load_image_bytes(img_url)
+            except Exception as e:
+                original = None
+                logger.warning(f"Sending original image for task {task_id}: {str(e)}")
+
+            if original is not None:
+                image_key = image_digest(original)
+
+                # Reuse the result of an accidental re-submission. Corrections
+                # (previous ingredients or user comment) always go to the model.
+                duplicate_result = await _find_duplicate_result(
+                    task_id,
+                    image_key,
+                    find_duplicate=not (previous_ingredients or user_comment),
+                )
+                if duplicate_result is not None:
+                    metrics.increment("image_prefilter_duplicates")
+                    await _update_task(
+                        task_id, TaskStatus.COMPLETED, progress=100, result=duplicate_result
+                    )
+                    logger.info(f"Completed task {task_id} from a duplicate submission")
+                    return
+
+                # Reject unusable frames, then send a downsized copy instead of
+                # the full-resolution photo
+                try:
+                    img_url = await prepare_image(original)
+                except ImageProcessingError as e:
+                    logger.warning(f"Sending original image for task {task_id}: {str(e)}")
+
+            # Update progress
+            await _update_task(task_id, TaskStatus.PROCESSING, progress=20)
+
+            # Prepare context if needed
+            context = None
+            if previous_ingredients or user_comment:
+                context = {}
+                if previous_ingredients:
+                    context["previous_analysis"] = {"ingredients": previous_ingredients}
+                if user_comment:
+                    context["user_comment"] = user_comment
+
+            # Update progress
+            await _update_task(task_id, TaskStatus.PROCESSING, progress=30)
+
+            async def publish_ingredients(ingredients: list) -> None:
+                # Publish the ingredients while the comment is still being
+                # generated; get_task_status computes the meal totals from them.
+                apply_nutrition_lookup(ingredients)
+                await _update_task(
+                    task_id,
+                    TaskStatus.PROCESSING,
+                    progress=TASK_PARTIAL_RESULT_PROGRESS,
+                    result={"ingredients": ingredients, "notes": ""},
+                )
+
+            # First get ingredients analysis
+            gpt_analysis = await analyze_food_image(
+                img_url,
+                gpt_client,
+                context,
+                image_key=image_key,
+                on_ingredients=publish_ingredients,
+            )
+
+            # A partial result may already be stored, so a failed analysis
+            # must not complete the task with it
+            if gpt_analysis is None:
+                raise ValueError("Image analysis returned no result")
+
+            # Replace nutrition info for known ingredients
+            if gpt_analysis and "ingredients" in gpt_analysis:
+                apply_nutrition_lookup(gpt_analysis["ingredients"])
+
+            if heartbeat.lost:
+                raise LeaseLostError(f"Lease on task {task_id} expired during analysis")
+
+            # Update progress
+            await _update_task(task_id, TaskStatus.PROCESSING, progress=50)
+
+            # Update task with result
+            await _update_task(
+                task_id, TaskStatus.COMPLETED, progress=100, result=gpt_analysis
+            )
+
+        logger.info(f"Successfully completed image processing task {task_id}")
+
+    except LeaseLostError as e:
+        # Another worker owns the task now, leave it alone
+        logger.warning(str(e))
+
+    except ImageRejectedError as e:
+        logger.info(f"Image of task {task_id} rejected by the pre-filter: {e.reason}")
+        try:
+            await _update_task(task_id, TaskStatus.FAILED, error=str(e))
+        except Exception as inner_e:
+            logger.error(f"Failed to update task status: {str(inner_e)}")
+
     except Exception as e:
-        logger.error(f"Threaded background task error: {str(e)}")
+        logger.error(f"Image processing task error: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
-        
+
         # Update task status to failed
         try:
-            task = db.query(Task).filter(Task.id == task_id).first()
-            if task:
-                task.update_status(TaskStatus.FAILED, error=str(e))
-                db.commit()
+            await _update_task(task_id, TaskStatus.FAILED, error=str(e))
         except Exception as inner_e:
             logger.error(f"Failed to update task status: {str(inner_e)}")
-    finally:
-        # Always close the database session
-        db.close()
 
 
-# Start the task processor thread when the module is loaded
-task_processor_thread = threading.Thread(target=process_pending_tasks, daemon=True)
-task_processor_thread.start()
+def _run_processor(reconcile_interval: float, max_reconcile_interval: Optional[float]) -> None:
+    asyncio.run(process_pending_tasks(reconcile_interval, max_reconcile_interval))
+
+
+def start_background_tasks(
+    concurrency: Optional[int] = None,
+    reconcile_interval: float = TASK_RECONCILE_INTERVAL,
+    max_reconcile_interval: Optional[float] = None,
+):
+    """Start the task processor thread and its event loop in this process.
+
+    Args:
+        concurrency: Maximum number of tasks run at the same time
+        reconcile_interval: Seconds between scans of the tasks table
+        max_reconcile_interval: Longest interval an idle process backs off to
+    """
+    global task_processor_running, task_processor_thread, TASK_WORKER_CONCURRENCY
+    if task_processor_running:
+        return
+
+    if concurrency is not None:
+        TASK_WORKER_CONCURRENCY = concurrency
+
+    task_processor_running = True
+    _loop_ready.clear()
+    task_processor_thread = threading.Thread(
+        target=_run_processor, args=(reconcile_interval, max_reconcile_interval), daemon=True
+    )
+    task_processor_thread.start()
+    _loop_ready.wait()
 
 
 def shutdown_background_tasks():
-    """Shutdown the background task processor thread and thread pool."""
-    global task_processor_running
+    """Stop claiming new tasks and wait for the running ones to finish."""
+    global task_processor_running, _loop
     logger.info("Shutting down task processor thread")
     task_processor_running = False
-    # Wait for the thread pool to complete all tasks
-    thread_pool.shutdown(wait=True) 
\ No newline at end of file
+    if _loop is not None:
+        # Wake the processor so it notices the flag immediately
+        _loop.call_soon_threadsafe(_wakeup.put_nowait, None)
+    if task_processor_thread is not None:
+        task_processor_thread.join()
+    _loop = None
@@ -0,0 +1,45 @@
+"""
+Entity tags for conditional GET requests.
+
+Endpoints compute a validator from data that is cheap to read (a version
+counter or a few small rows) and answer a matching If-None-Match with
+304 Not Modified before loading or serializing the response body.
+"""
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Response
+
+# Clients must revalidate, and shared caches must not store per-user data
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any, weak: bool = False) -> str:
+    """Build a quoted entity tag from the parts that determine a response."""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    tag = f'"{digest[:32]}"'
+    return f"W/{tag}" if weak else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an entity tag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    """Return an empty 304 response carrying the entity tag."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """Attach the entity tag and revalidation policy to a full response."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
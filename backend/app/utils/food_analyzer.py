@@ -1,8 +1,9 @@
 import logging
 from .gpt_client import GPTClient
 import json
-from typing import Union, Optional, Dict, Any
-from .system_prompt import SYSTEM_PROMPT
+from typing import Union, Optional, Dict, Any, Callable, Awaitable, List
+from .system_prompt import SYSTEM_PROMPT, CORRECTION_PROMPT
+from app.models.meal_models import Meal
 import re
 
 logger = logging.getLogger(__name__)
@@ -23,12 +24,65 @@ def extract_between_tags(text: str, start_tag: str, end_tag: str) -> list[str]:
     matches = re.findall(pattern, text, re.DOTALL)
     return matches
 
+class TagStreamParser:
+    """
+    Incrementally extract tagged sections from a streamed completion.
+
+    Text chunks are fed as they arrive; each section is returned once, as soon
+    as its closing tag has been received.
+    """
+
+    def __init__(self, tags: List[str]):
+        self.buffer = ""
+        self._pending = list(tags)
+
+    def feed(self, text: str) -> Dict[str, str]:
+        """Add a chunk and return the sections completed by it, keyed by tag."""
+        self.buffer += text
+        completed = {}
+        for tag in list(self._pending):
+            end_tag = f"</{tag}>"
+            # Only rescan the tail where the closing tag can have appeared
+            if end_tag not in self.buffer[-(len(text) + len(end_tag)):]:
+                continue
+            sections = extract_between_tags(self.buffer, f"<{tag}>", end_tag)
+            if sections:
+                completed[tag] = sections[0]
+                self._pending.remove(tag)
+        return completed
+
+
 async def analyze_food_image(
-    image_url: str, gpt_client: GPTClient, context: Optional[Dict[str, Any]] = None
+    image_url: str,
+    gpt_client: GPTClient,
+    context: Optional[Dict[str, Any]] = None,
+    image_key: Optional[str] = None,
+    on_ingredients: Optional[Callable[[list], Awaitable[None]]] = None,
 ) -> dict:
     """
     Analyze food image using GPT-4 Vision.
+
+    `image_key` identifies the image content for the vision response cache
+    when `image_url` is a short-lived download URL. When `on_ingredients` is
+    given the response is streamed, and it is awaited with the ingredients as
+    soon as the <JSON> section is complete, before the comment is generated.
     """
+    result = None
+    on_delta = None
+    if on_ingredients is not None:
+        parser = TagStreamParser(["JSON"])
+
+        async def on_delta(text: str) -> None:
+            sections = parser.feed(text)
+            if "JSON" not in sections:
+                return
+            try:
+                ingredients = json.loads(sections["JSON"])["ingredients"]
+                await on_ingredients(ingredients)
+            except Exception as e:
+                # Early publication is best effort, the full result follows
+                logger.warning(f"Failed to publish streamed ingredients: {str(e)}")
+
     try:
         # Convert context to user message if provided
         user_message = "\n\n"
@@ -46,7 +100,9 @@ async def analyze_food_image(
         result = await gpt_client(
             image_url,
             SYSTEM_PROMPT,
-            user_message
+            user_message,
+            image_key=image_key,
+            on_delta=on_delta,
         )
 
         data = extract_between_tags(result, "<JSON>", "</JSON>")
@@ -63,3 +119,44 @@ async def analyze_food_image(
         return None
 
 
+async def correct_food_analysis(
+    previous_ingredients: List[dict], user_comment: str, gpt_client: GPTClient
+) -> Optional[dict]:
+    """
+    Apply a user's correction to a previous analysis with the text model.
+
+    The image is not sent again; the model only sees the previous ingredient
+    list and the user's comment.
+
+    Returns:
+        dict: The corrected ingredients and notes, or None if the response is
+            missing or incomplete and the image should be analysed instead
+    """
+    user_message = (
+        "上次分析结果：\n"
+        f"{json.dumps({'ingredients': previous_ingredients}, ensure_ascii=False)}\n\n"
+        f"用户评论：{user_comment}\n"
+        "请认真阅读用户反馈，输出修改后的营养分析。"
+    )
+    result = await gpt_client.get_json_response(CORRECTION_PROMPT, user_message)
+    if not result:
+        return None
+
+    try:
+        # Every ingredient needs complete nutrition data to be usable
+        meal = Meal(**result)
+    except Exception as e:
+        logger.warning(f"Incomplete text correction, falling back to image: {str(e)}")
+        return None
+    if not meal.ingredients:
+        return None
+
+    return {
+        "ingredients": [
+            ingredient.model_dump(
+                include={"name", "portion", "gi", "carbs_per_100g", "protein_per_100g", "fat_per_100g"}
+            )
+            for ingredient in meal.ingredients
+        ],
+        "notes": meal.notes,
+    }
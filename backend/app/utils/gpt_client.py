@@ -4,13 +4,28 @@ Module for handling GPT API interactions.
 import os
 import json
 import logging
-from openai import OpenAI
-from typing import List, Dict, Any
-from functools import lru_cache
+import asyncio
+import importlib.util
+import time
+import weakref
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 import re
 
+from app.utils import metrics
+from app.utils.vision_cache import VisionCache, make_cache_key, vision_cache
+
 logger = logging.getLogger(__name__)
 
+# HTTP connection pool shared by every OpenAI request made on one event loop
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+# "auto" enables HTTP/2 when the optional h2 package is installed
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "auto").lower()
+
 
 def repair_json_str(text: str) -> str:
     """Repair JSON string that may contain syntax issues.
@@ -58,27 +73,84 @@ def repair_json_str(text: str) -> str:
     #     return json_str
     return repaired_text
 
+def _http2_enabled() -> bool:
+    if OPENAI_HTTP2 == "auto":
+        return importlib.util.find_spec("h2") is not None
+    return OPENAI_HTTP2 == "true"
+
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["gluco_started_at"] = time.monotonic()
+    request.extensions["trace"] = _on_trace
+    metrics.increment("openai_http_requests")
+
+
+async def _on_response(response: httpx.Response) -> None:
+    started_at = response.request.extensions.get("gluco_started_at")
+    if started_at is not None:
+        metrics.observe("openai_http_response_seconds", time.monotonic() - started_at)
+
+
+async def _on_trace(event_name: str, info: dict) -> None:
+    # Each new connection costs a TCP (and usually TLS) handshake; with a
+    # healthy keep-alive pool these stay far below the request count.
+    if event_name == "connection.connect_tcp.complete":
+        metrics.increment("openai_http_new_connections")
+    elif event_name == "connection.start_tls.complete":
+        metrics.increment("openai_http_tls_handshakes")
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the pooled, keep-alive HTTP client used for OpenAI requests."""
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+        http2=_http2_enabled(),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
 class GPTClient:
-    def __init__(self):
-        self.text_client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL")
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[VisionCache] = vision_cache,
+    ):
+        """
+        Args:
+            http_client: Pooled HTTP client shared by the text and vision
+                clients. When omitted each OpenAI client opens its own pool.
+            cache: Cache for vision responses, or None to disable caching.
+        """
+        self.http_client = http_client
+        self.cache = cache
+        self.text_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            http_client=http_client,
         )
-        self.vision_client = OpenAI(
+        self.vision_client = AsyncOpenAI(
             api_key=os.getenv("OPENAI_VISION_API_KEY"),
             base_url=os.getenv("OPENAI_VISION_BASE_URL"),
+            http_client=http_client,
         )
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
         self.vision_model = os.getenv("OPENAI_VISION_MODEL", "gpt-4o-mini")
         self.max_tokens = int(os.getenv("OPENAI_MAX_TOKENS", "1000"))
         self.vision_max_tokens = int(os.getenv("OPENAI_VISION_MAX_TOKENS", "1000"))
 
-    @lru_cache(maxsize=100)
     async def __call__(
         self,
         image_url: str,
         system_message: str,
         user_message: str,
         response_format: str = None,
+        image_key: Optional[str] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> dict | str:
         """
         Analyze an image using GPT-4 Vision.
@@ -86,10 +158,45 @@ class GPTClient:
         Args:
             image_url: URL of the image
             system_message: The system message defining GPT's role and response format
+            image_key: Stable identifier of the image content. Download URLs
+                are often signed and change between requests, so callers
+                should pass one to make cached responses reusable. Defaults
+                to image_url itself.
+            on_delta: When given, the completion is requested with
+                stream=True and this coroutine is awaited with each text
+                chunk as it arrives. Responses served from the cache are not
+                streamed, so callers must still use the returned text.
 
         Returns:
             dict: Parsed JSON response, or None if request fails
         """
+        if self.cache is None:
+            return await self._analyze_image(
+                image_url, system_message, user_message, response_format, on_delta
+            )
+
+        key = make_cache_key(
+            image_key or image_url,
+            system_message,
+            user_message,
+            self.vision_model,
+            response_format,
+        )
+        return await self.cache.get_or_compute(
+            key,
+            lambda: self._analyze_image(
+                image_url, system_message, user_message, response_format, on_delta
+            ),
+        )
+
+    async def _analyze_image(
+        self,
+        image_url: str,
+        system_message: str,
+        user_message: str,
+        response_format: str = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> dict | str:
         try:
             # Check if the input is a URL or base64 data
             if image_url.startswith(("http://", "https://")):
@@ -101,7 +208,8 @@ class GPTClient:
                     image_data = f"data:image/jpeg;base64,{image_data}"
                 image_content = {"url": image_data}
 
-            response = self.vision_client.chat.completions.create(
+            stream = on_delta is not None and response_format is None
+            response = await self.vision_client.chat.completions.create(
                 model=self.vision_model,
                 messages=[
                     {"role": "system", "content": system_message},
@@ -115,13 +223,27 @@ class GPTClient:
                 response_format={"type": "text"}
                 if response_format is None
                 else {"type": response_format},
+                stream=stream,
             )
 
+            if stream:
+                chunks = []
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        chunks.append(delta)
+                        await on_delta(delta)
+                content = "".join(chunks)
+            else:
+                content = response.choices[0].message.content
+
             logger.info("Successfully analyzed image with GPT Vision")
 
             if response_format == "json_object":
                 # qwen2.5 VL model not good at json response
-                data = response.choices[0].message.content
+                data = content
                 if data.startswith("```json"):
                     data = data[len("```json") :]
                 data = data.split("```")[0]
@@ -136,7 +258,7 @@ class GPTClient:
                     result = None
                 return result
             else:
-                return response.choices[0].message.content
+                return content
 
         except Exception as e:
             logger.error(f"Error analyzing image with GPT Vision: {str(e)}")
@@ -156,7 +278,7 @@ class GPTClient:
             dict: Parsed JSON response, or None if request fails
         """
         try:
-            response = self.text_client.chat.completions.create(
+            response = await self.text_client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_message},
@@ -172,3 +294,51 @@ class GPTClient:
         except Exception as e:
             logger.error(f"Error getting JSON response from GPT: {str(e)}")
             return None
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+
+
+# Shared clients, one per event loop. httpx connections are bound to the loop
+# that opened them, and the API and the task processor run separate loops.
+_shared_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, GPTClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_shared_gpt_client() -> GPTClient:
+    """Return the pooled GPTClient for the running event loop, creating it once."""
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None:
+        client = GPTClient(http_client=create_http_client())
+        _shared_clients[loop] = client
+        logger.info(f"Created shared GPT client (http2={_http2_enabled()})")
+    return client
+
+
+async def close_shared_gpt_client() -> None:
+    """Close the pooled GPTClient of the running event loop, if any."""
+    client = _shared_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _pool_gauges() -> dict:
+    """Current connection counts across the shared HTTP pools."""
+    stats = {"clients": 0, "connections": 0, "idle_connections": 0}
+    for client in list(_shared_clients.values()):
+        stats["clients"] += 1
+        # httpx does not expose pool state publicly; read it from the
+        # underlying httpcore pool when the default transport is in use.
+        pool = getattr(getattr(client.http_client, "_transport", None), "_pool", None)
+        for connection in getattr(pool, "connections", []):
+            stats["connections"] += 1
+            if connection.is_idle():
+                stats["idle_connections"] += 1
+    return stats
+
+
+metrics.register_gauges("openai_http_pool", _pool_gauges)
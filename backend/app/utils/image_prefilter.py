@@ -0,0 +1,88 @@
+"""
+CPU-only pre-filter for photos submitted for analysis.
+
+Rejects frames that cannot contain a usable meal photo (black or blown-out
+frames, blank surfaces, heavy blur and tiny images) before any tokens are
+spent on the vision model. The checks run on a downscaled grayscale copy and
+take a few milliseconds.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+IMAGE_MIN_EDGE = int(os.getenv("IMAGE_MIN_EDGE", "64"))
+IMAGE_MIN_BRIGHTNESS = float(os.getenv("IMAGE_MIN_BRIGHTNESS", "15"))
+IMAGE_MAX_BRIGHTNESS = float(os.getenv("IMAGE_MAX_BRIGHTNESS", "245"))
+# Standard deviation of the grayscale pixels
+IMAGE_MIN_CONTRAST = float(os.getenv("IMAGE_MIN_CONTRAST", "6"))
+# Variance of the Laplacian of the grayscale image
+IMAGE_MIN_SHARPNESS = float(os.getenv("IMAGE_MIN_SHARPNESS", "10"))
+
+# Edge length the checks run at, independent of the photo resolution
+_ANALYSIS_EDGE = 256
+
+# Rejection reasons
+TOO_SMALL = "too_small"
+TOO_DARK = "too_dark"
+TOO_BRIGHT = "too_bright"
+BLANK = "blank"
+BLURRY = "blurry"
+
+REJECTION_MESSAGES = {
+    TOO_SMALL: "Image is too small",
+    TOO_DARK: "Image is too dark",
+    TOO_BRIGHT: "Image is overexposed",
+    BLANK: "Image appears to be blank",
+    BLURRY: "Image is too blurry",
+}
+
+
+class ImageRejectedError(Exception):
+    """Raised when an image fails the pre-filter."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(REJECTION_MESSAGES.get(reason, reason))
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian, a standard focus measure."""
+    laplacian = (
+        gray[:-2, 1:-1]
+        + gray[2:, 1:-1]
+        + gray[1:-1, :-2]
+        + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def check_image(image: Image.Image) -> Optional[str]:
+    """
+    Run the pre-filter heuristics on a decoded image.
+
+    Args:
+        image: The image, already rotated upright
+
+    Returns:
+        Optional[str]: The rejection reason, or None if the image looks usable
+    """
+    if min(image.size) < IMAGE_MIN_EDGE:
+        return TOO_SMALL
+
+    gray = image.convert("L")
+    gray.thumbnail((_ANALYSIS_EDGE, _ANALYSIS_EDGE))
+    pixels = np.asarray(gray, dtype=np.float32)
+
+    brightness = float(pixels.mean())
+    if brightness < IMAGE_MIN_BRIGHTNESS:
+        return TOO_DARK
+    if brightness > IMAGE_MAX_BRIGHTNESS:
+        return TOO_BRIGHT
+    if float(pixels.std()) < IMAGE_MIN_CONTRAST:
+        return BLANK
+    if laplacian_variance(pixels) < IMAGE_MIN_SHARPNESS:
+        return BLURRY
+    return None
@@ -0,0 +1,223 @@
+"""
+Image normalization before vision analysis.
+
+Phone photos are fetched once, checked by the pre-filter (see
+image_prefilter), rotated according to their EXIF orientation, downsized to
+IMAGE_MAX_EDGE and re-encoded without metadata. The compact result is sent
+to the vision model as base64 instead of the original URL, which cuts upload
+size, image tokens and model latency.
+
+Pillow work runs on a process pool so it does not hold the GIL of the event
+loop thread.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+import aiohttp
+from PIL import Image, ImageOps
+
+from app.utils import metrics
+from app.utils.image_prefilter import ImageRejectedError, check_image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+# JPEG or WEBP
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.getenv("IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+IMAGE_DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "30"))
+# 0 runs normalization on a thread instead of a process pool
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class ImageProcessingError(Exception):
+    """Raised when an image cannot be fetched or decoded."""
+
+
+def _encode(image: Image.Image, max_edge: int, image_format: str, quality: int) -> bytes:
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    if image_format == "WEBP":
+        image.save(output, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def normalize_image(
+    data: bytes,
+    max_edge: int = IMAGE_MAX_EDGE,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> bytes:
+    """
+    Downsize and re-encode an image.
+
+    The image is rotated upright from its EXIF orientation, scaled so that its
+    longest edge is at most `max_edge` and saved without EXIF or other metadata.
+
+    Args:
+        data: Encoded image bytes in any format Pillow can read
+        max_edge: Maximum width or height in pixels
+        image_format: Output format, JPEG or WEBP
+        quality: Encoder quality (1-100)
+
+    Returns:
+        bytes: The re-encoded image
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        return _encode(ImageOps.exif_transpose(image), max_edge, image_format, quality)
+
+
+def filter_and_normalize_image(data: bytes) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Pre-filter an image and normalize it if it passes.
+
+    Both steps share one decode, and the function runs in a worker process.
+
+    Returns:
+        Tuple[Optional[str], Optional[bytes]]: The rejection reason and None,
+            or None and the normalized image
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        reason = check_image(image)
+        if reason is not None:
+            return reason, None
+        return None, _encode(image, IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Forking a process that runs event loop threads is unsafe, spawn
+        # fresh interpreters instead.
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """Drop a broken pool, unless another caller has replaced it already."""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_filter_and_normalize(original: bytes) -> Tuple[Optional[str], Optional[bytes]]:
+    if IMAGE_PROCESS_WORKERS <= 0:
+        return await asyncio.to_thread(filter_and_normalize_image, original)
+
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            return await loop.run_in_executor(executor, filter_and_normalize_image, original)
+        except BrokenProcessPool:
+            # A worker process died, e.g. killed for memory, and the pool
+            # refuses all further work. Start a new one and retry once.
+            logger.warning("Image process pool is broken, restarting it")
+            metrics.increment("image_pool_restarts")
+            _discard_executor(executor)
+            if attempt == 1:
+                raise
+
+
+def shutdown_image_pool() -> None:
+    """Stop the normalization process pool, if it was started."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def fetch_image(url: str) -> bytes:
+    """Download an image, refusing bodies larger than IMAGE_MAX_DOWNLOAD_BYTES."""
+    timeout = aiohttp.ClientTimeout(total=IMAGE_DOWNLOAD_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise ImageProcessingError(f"Failed to fetch image: HTTP {response.status}")
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data.extend(chunk)
+                if len(data) > IMAGE_MAX_DOWNLOAD_BYTES:
+                    raise ImageProcessingError("Image exceeds the maximum download size")
+            return bytes(data)
+
+
+def _decode_base64_image(source: str) -> bytes:
+    if source.startswith("data:"):
+        source = source.split(",", 1)[-1]
+    try:
+        return base64.b64decode(source, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ImageProcessingError(f"Invalid base64 image data: {str(e)}")
+
+
+async def load_image_bytes(source: str) -> bytes:
+    """Return the raw bytes of an image given as an http(s) URL or base64 data."""
+    if source.startswith(("http://", "https://")):
+        return await fetch_image(source)
+    return _decode_base64_image(source)
+
+
+def image_digest(data: bytes) -> str:
+    """Return the sha256 hex digest identifying the image content."""
+    return hashlib.sha256(data).hexdigest()
+
+
+async def prepare_image(original: bytes) -> str:
+    """
+    Pre-filter and normalize an image for the vision model.
+
+    Args:
+        original: Image bytes as uploaded
+
+    Returns:
+        str: The normalized image as a base64 data URL
+
+    Raises:
+        ImageRejectedError: If the pre-filter rejects the image
+        ImageProcessingError: If the image cannot be decoded
+    """
+    started_at = time.monotonic()
+    try:
+        reason, normalized = await _run_filter_and_normalize(original)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        # Pillow's decode errors; a pool failure is not the image's fault
+        raise ImageProcessingError(f"Failed to decode image: {str(e)}")
+
+    metrics.observe("image_normalize_seconds", time.monotonic() - started_at)
+    if reason is not None:
+        metrics.increment(f"image_prefilter_rejected_{reason}")
+        raise ImageRejectedError(reason)
+
+    metrics.increment("image_bytes_in", len(original))
+    metrics.increment("image_bytes_out", len(normalized))
+    logger.info(f"Normalized image from {len(original)} to {len(normalized)} bytes")
+
+    mime_type = _MIME_TYPES.get(IMAGE_FORMAT, "image/jpeg")
+    encoded = base64.b64encode(normalized).decode("ascii")
+    return f"data:{mime_type};base64,{encoded}"
@@ -0,0 +1,65 @@
+"""
+In-process metrics registry.
+
+Counters and timings are accumulated in memory and exposed as JSON by the
+API's GET /metrics endpoint and the worker's health server. Gauges are read
+from callbacks at snapshot time so they always reflect the current state.
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_timings: Dict[str, Dict[str, float]] = {}
+_gauges: Dict[str, Callable[[], dict]] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    """Add `value` to the counter `name`."""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one observation (e.g. a duration in seconds) for `name`."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+        timing["count"] += 1
+        timing["sum"] += value
+        timing["max"] = max(timing["max"], value)
+
+
+def register_gauges(name: str, callback: Callable[[], dict]) -> None:
+    """Register a callback returning a dict of current values for `name`."""
+    with _lock:
+        _gauges[name] = callback
+
+
+def snapshot() -> dict:
+    """Return the current value of every counter, timing and gauge."""
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: dict(timing) for name, timing in _timings.items()}
+        gauges = dict(_gauges)
+
+    gauge_values = {}
+    for name, callback in gauges.items():
+        try:
+            gauge_values[name] = callback()
+        except Exception as e:
+            logger.error(f"Failed to read gauges {name}: {str(e)}")
+
+    return {"counters": counters, "timings": timings, "gauges": gauge_values}
+
+
+def reset() -> None:
+    """Clear counters and timings. Registered gauges are kept."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
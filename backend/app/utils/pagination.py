@@ -0,0 +1,34 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last row of a page, so the next page is
+read with an indexed range condition instead of an OFFSET that rescans all
+previous rows.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+def encode_cursor(sort_time: Optional[datetime], row_id: int) -> str:
+    """Encode the (time, id) sort key of the last row of a page."""
+    payload = {"t": sort_time.isoformat() if sort_time else None, "id": row_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    Decode a cursor created by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        sort_time = datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        return sort_time, int(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
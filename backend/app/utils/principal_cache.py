@@ -0,0 +1,89 @@
+"""
+In-process cache of authenticated principals.
+
+get_current_user resolves the token subject ("weixin:<openid>" or a user id)
+to a User or WeixinUser on every authenticated request. Resolved users are
+kept here, detached from any session, for PRINCIPAL_CACHE_TTL seconds so
+that most requests skip the lookup. Handlers that change a cached user's
+columns call invalidate_user after committing. The cache is per process, so
+other API processes may serve the old values until the TTL expires.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from app.models.user_models import User, WeixinUser
+from app.utils import metrics
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+
+def user_subject(user: Union[User, WeixinUser]) -> str:
+    """The token subject that resolves to `user`."""
+    if isinstance(user, WeixinUser):
+        return f"weixin:{user.openid}"
+    return str(user.id)
+
+
+class PrincipalCache:
+    """Size-bounded LRU cache of detached users with a TTL."""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Dependencies run in the threadpool, so the entries are guarded by a lock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Union[User, WeixinUser]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, subject: str) -> Optional[Union[User, WeixinUser]]:
+        """
+        Return the cached user for `subject`, or None.
+
+        The user is detached and shared between requests. Callers attach a
+        copy to their session with Session.merge(user, load=False).
+        """
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[subject]
+                entry = None
+            if entry is None:
+                metrics.increment("principal_cache_misses")
+                return None
+            self._entries.move_to_end(subject)
+        metrics.increment("principal_cache_hits")
+        return entry[1]
+
+    def set(self, subject: str, user: Union[User, WeixinUser]) -> None:
+        """Cache a user that is already detached from its session."""
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("principal_cache_evictions")
+
+    def invalidate(self, subject: str) -> None:
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_user(user: Union[User, WeixinUser]) -> None:
+    """Drop `user` from the cache, after a change to its columns is committed."""
+    principal_cache.invalidate(user_subject(user))
@@ -0,0 +1,137 @@
+"""
+Per-request SQL statistics.
+
+Cursor events on each engine count the statements a request runs, their
+total time and the slowest one. The API middleware starts a QueryStats for
+every request and publishes it as metrics, and as response headers when
+QUERY_STATS_HEADERS is set. Slow statements are logged wherever they run,
+and a statement shape repeated within one request is reported as a likely
+N+1 query.
+"""
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged, 0 disables the log
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+# Warn when one statement shape runs more often than this in a request
+REPEATED_STATEMENT_THRESHOLD = int(os.getenv("REPEATED_STATEMENT_THRESHOLD", "10"))
+
+# Placeholder lists of expanded IN clauses, e.g. (%s, %s, %s)
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?|%\(\w+\)s)(?:\s*,\s*(?:%s|\?|%\(\w+\)s))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize a statement so that IN lists of any length compare equal."""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """Statements run on behalf of one request."""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: Optional[str] = None
+        self._shapes: Dict[str, int] = defaultdict(int)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+        shape = statement_shape(statement)
+        self._shapes[shape] += 1
+        # Reported once, when the shape first exceeds the threshold
+        if self._shapes[shape] == REPEATED_STATEMENT_THRESHOLD + 1:
+            metrics.increment("db_repeated_statements")
+            logger.warning(
+                f"Statement repeated more than {REPEATED_STATEMENT_THRESHOLD} times in "
+                f"{self.label or 'one request'}, possible N+1 query: {shape[:300]}"
+            )
+
+    def headers(self) -> Dict[str, str]:
+        """Debug response headers describing the request's statements."""
+        headers = {
+            "X-DB-Statements": str(self.count),
+            "X-DB-Time-Ms": f"{self.total_seconds * 1000:.1f}",
+            "X-DB-Slowest-Ms": f"{self.slowest_seconds * 1000:.1f}",
+        }
+        if self.slowest_statement:
+            slowest = _WHITESPACE.sub(" ", self.slowest_statement).strip()[:200]
+            headers["X-DB-Slowest-Statement"] = slowest.encode("ascii", "replace").decode("ascii")
+        return headers
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar(
+    "query_stats", default=None
+)
+
+
+def start_request(label: str = "") -> Tuple[QueryStats, contextvars.Token]:
+    """
+    Collect the statements of the current context into a new QueryStats.
+
+    Threadpool calls made by the request copy the context, and so record
+    into the same object.
+    """
+    stats = QueryStats(label)
+    return stats, _current.set(stats)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def record_request(stats: QueryStats, endpoint: Optional[str]) -> None:
+    """Publish a finished request's statistics, per endpoint."""
+    if endpoint is None:
+        return
+    metrics.observe(f"db_statements_per_request.{endpoint}", stats.count)
+    metrics.observe(f"db_seconds_per_request.{endpoint}", stats.total_seconds)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started_at"].pop()
+    metrics.observe("db_statement_seconds", seconds)
+    if SLOW_QUERY_SECONDS > 0 and seconds >= SLOW_QUERY_SECONDS:
+        metrics.increment("db_slow_statements")
+        logger.warning(f"Slow statement ({seconds * 1000:.0f} ms): {statement_shape(statement)[:1000]}")
+
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started_at"):
+        connection.info["query_started_at"].pop()
+
+
+def instrument(engine: Engine) -> None:
+    """Time every statement run on the engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,131 @@
+"""
+Content-addressed cache for vision model responses.
+
+Responses are keyed by a hash of the image, prompts and model so that
+re-analysing the same photo is answered from memory instead of the API.
+Entries expire after a TTL and the least recently used entry is evicted once
+the cache is full. Concurrent identical requests on the same event loop share
+a single upstream call.
+"""
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+VISION_CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "512"))
+VISION_CACHE_TTL = float(os.getenv("VISION_CACHE_TTL", "86400"))
+
+_MISSING = object()
+# Result handed to waiting callers when the leading call raised
+_FAILED = object()
+
+
+def make_cache_key(*parts: Optional[str]) -> str:
+    """Return a stable sha256 key for the given request parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(("" if part is None else part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class VisionCache:
+    """Size-bounded LRU cache with TTL and single-flight de-duplication."""
+
+    def __init__(self, max_entries: int = VISION_CACHE_MAX_ENTRIES, ttl: float = VISION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # The API and the task processor run separate event loops in separate
+        # threads, so the entries are guarded by a thread lock.
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.increment("vision_cache_evictions")
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for `key`, computing it with `compute` on a miss.
+
+        None results are returned but not cached, so failed requests are retried.
+        """
+        if self.max_entries <= 0:
+            return await compute()
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._get(key)
+            if value is _MISSING:
+                future = self._inflight.get(key)
+                # Futures cannot be awaited across event loops
+                leader = future is None or future.get_loop() is not loop
+                if leader:
+                    future = loop.create_future()
+                    self._inflight[key] = future
+
+        if value is not _MISSING:
+            metrics.increment("vision_cache_hits")
+            return copy.deepcopy(value)
+
+        if not leader:
+            metrics.increment("vision_cache_coalesced")
+            value = await asyncio.shield(future)
+            if value is _FAILED:
+                return await compute()
+            return copy.deepcopy(value)
+
+        metrics.increment("vision_cache_misses")
+        try:
+            value = await compute()
+        except BaseException:
+            self._finish(key, future, _FAILED)
+            raise
+
+        self._finish(key, future, value)
+        return value
+
+    def _finish(self, key: str, future: asyncio.Future, value: Any) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if value is not None and value is not _FAILED:
+                self._set(key, copy.deepcopy(value))
+        future.set_result(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+vision_cache = VisionCache()
+
+metrics.register_gauges("vision_cache", lambda: {"entries": len(vision_cache)})
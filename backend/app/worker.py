@@ -0,0 +1,152 @@
+"""
+Standalone task worker.
+
+Runs the image analysis pipeline outside the API process so that API and
+worker replicas can be scaled independently:
+
+    python -m app.worker --concurrency 8 --health-port 8001
+
+Set RUN_TASKS_IN_API=false on the API replicas when running workers.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Import all models to ensure they are registered with SQLAlchemy
+import app.models
+from app.utils import background_tasks, metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - [%(name)s] %(message)s - %(pathname)s:%(lineno)d",
+    handlers=[
+        logging.StreamHandler(sys.stdout),
+    ],
+)
+logger = logging.getLogger(__name__)
+
+# Workers never receive in-process wake-ups from the API, so they scan the
+# tasks table at a much shorter interval than the API's fallback scan. Each
+# scan that finds nothing doubles the interval up to WORKER_MAX_POLL_INTERVAL,
+# so idle workers do not load the database, and finding a task resets it.
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1"))
+WORKER_MAX_POLL_INTERVAL = float(
+    os.getenv("WORKER_MAX_POLL_INTERVAL", str(background_tasks.TASK_LEASE_SECONDS))
+)
+WORKER_HEALTH_PORT = int(os.getenv("WORKER_HEALTH_PORT", "8001"))
+
+_draining = threading.Event()
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Serves GET /health with the worker state and GET /metrics as JSON."""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, metrics.snapshot())
+            return
+        if self.path != "/health":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        stats = background_tasks.get_worker_stats()
+        stats["status"] = "draining" if _draining.is_set() else "healthy"
+
+        # Report unhealthy while draining so no new traffic is routed here
+        self._send_json(503 if _draining.is_set() else 200, stats)
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_health_server(port: int) -> ThreadingHTTPServer:
+    """Serve the health endpoint from a daemon thread."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), HealthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Worker health endpoint listening on port {port}")
+    return server
+
+
+def run(
+    concurrency: int,
+    poll_interval: float,
+    health_port: int,
+    max_poll_interval: float = WORKER_MAX_POLL_INTERVAL,
+) -> None:
+    """Run the worker until SIGTERM or SIGINT, then drain in-flight tasks."""
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, draining worker")
+        _draining.set()
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    health_server = start_health_server(health_port)
+    background_tasks.start_background_tasks(
+        concurrency=concurrency,
+        reconcile_interval=poll_interval,
+        max_reconcile_interval=max_poll_interval,
+    )
+    logger.info(
+        f"Worker {background_tasks.WORKER_ID} started with concurrency {concurrency}"
+    )
+
+    stop.wait()
+
+    # Stop claiming new tasks and let the running ones finish. Tasks that are
+    # still running when the process is killed keep their lease until it
+    # expires, after which another worker picks them up.
+    background_tasks.shutdown_background_tasks()
+    health_server.shutdown()
+    logger.info("Worker stopped")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Gluco task worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=background_tasks.TASK_WORKER_CONCURRENCY,
+        help="Maximum number of tasks processed at the same time",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=WORKER_POLL_INTERVAL,
+        help="Seconds between scans of the tasks table",
+    )
+    parser.add_argument(
+        "--max-poll-interval",
+        type=float,
+        default=WORKER_MAX_POLL_INTERVAL,
+        help="Longest interval between scans that an idle worker backs off to",
+    )
+    parser.add_argument(
+        "--health-port",
+        type=int,
+        default=WORKER_HEALTH_PORT,
+        help="Port of the /health endpoint",
+    )
+    args = parser.parse_args(argv)
+    run(args.concurrency, args.poll_interval, args.health_port, args.max_poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark API throughput at increasing numbers of concurrent clients.
+
+Each level keeps N clients sending requests to one endpoint of a running
+server for a fixed duration, and reports requests per second with latency
+percentiles. A single probe client polls --probe-path (GET /health by
+default) alongside them: its latency shows whether database work is
+stalling the event loop, in which case even requests that do not touch the
+database wait behind it.
+
+    cd backend
+    uvicorn app.main:app --port 8000 &
+    python -m benchmarks.concurrency --url http://localhost:8000 \\
+        --user-id 1 --path "/meals?limit=20" --levels 50 100 200 500
+
+--user-id signs a token with JWT_SECRET_KEY, which must match the server's.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.utils.auth import create_access_token
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_client(client: httpx.AsyncClient, path: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        started_at = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started_at)
+
+
+async def run_probe(client: httpx.AsyncClient, path: str, deadline: float, latencies: list):
+    while time.perf_counter() < deadline:
+        started_at = time.perf_counter()
+        try:
+            await client.get(path)
+        except httpx.HTTPError:
+            pass
+        latencies.append(time.perf_counter() - started_at)
+        await asyncio.sleep(0.1)
+
+
+async def run_level(args, headers: dict, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+    async with httpx.AsyncClient(
+        base_url=args.url, headers=headers, limits=limits, timeout=args.timeout
+    ) as client:
+        latencies, errors, probe_latencies = [], [], []
+        deadline = time.perf_counter() + args.duration
+        started_at = time.perf_counter()
+        await asyncio.gather(
+            run_probe(client, args.probe_path, deadline, probe_latencies),
+            *[
+                run_client(client, args.path, deadline, latencies, errors)
+                for _ in range(concurrency)
+            ],
+        )
+        elapsed = time.perf_counter() - started_at
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "probe_p95": percentile(probe_latencies, 0.95),
+    }
+
+
+async def main_async(args) -> None:
+    headers = {}
+    if args.token:
+        headers["Authorization"] = f"Bearer {args.token}"
+    elif args.user_id:
+        headers["Authorization"] = f"Bearer {create_access_token(data={'sub': args.user_id})}"
+
+    print(
+        f"{'clients':>7} {'requests':>9} {'errors':>7} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'probe p95':>10}"
+    )
+    for concurrency in args.levels:
+        result = await run_level(args, headers, concurrency)
+        print(
+            f"{result['concurrency']:>7} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rps']:>8.1f} {result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} "
+            f"{result['p99'] * 1000:>8.1f} {result['probe_p95'] * 1000:>10.1f}"
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/meals?limit=20")
+    parser.add_argument("--probe-path", default="/health")
+    parser.add_argument("--token", help="Bearer token sent with every request")
+    parser.add_argument("--user-id", help="Sign a token for this user id (or weixin:<openid>)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,19 @@ def set_test_database(monkeypatch):
     monkeypatch.setenv("DATABASE_URL", test_db_url)
 
 
+@pytest.fixture(autouse=True)
+def clear_auth_caches():
+    """Forget cached tokens and users, whose ids are reused by fresh test databases."""
+    from app.utils import auth
+    from app.utils.principal_cache import principal_cache
+
+    principal_cache.clear()
+    auth._verified_tokens.clear()
+    yield
+    principal_cache.clear()
+    auth._verified_tokens.clear()
+
+
 @pytest.fixture(scope="function")
 def test_db() -> Session:
     """Create a fresh test database for each test."""
@@ -84,5 +97,5 @@ def set_dummy_openai_env(monkeypatch):
 @pytest.fixture(autouse=True)
 def patch_openai_init(monkeypatch):
     monkeypatch.setattr(
-        "app.utils.gpt_client.OpenAI.__init__", lambda *args, **kwargs: None
+        "app.utils.gpt_client.AsyncOpenAI.__init__", lambda *args, **kwargs: None
     )
\ No newline at end of file
@@ -4,7 +4,7 @@ from app.models.task_models import TaskStatus
 from app.models.user_models import User
 from app.utils.auth import get_password_hash, create_access_token
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 @pytest.fixture(autouse=True)
 def mock_jwt_secret(monkeypatch):
@@ -49,8 +49,9 @@ class TestAsyncJobs:
         # Mock data
         request_data = {"file_id": "cloud://test_file_id"}
         
-        # Mock thread pool submit function
-        with patch("app.utils.background_tasks.thread_pool.submit") as mock_submit:
+        # Mock task start and the dispatcher wake-up
+        with patch("app.utils.background_tasks.start_claimed_task") as mock_start, \
+                patch("app.routers.jobs.enqueue_task") as mock_enqueue:
             # Make request
             response = client.post(
                 "/jobs/process-image-async",
@@ -73,9 +74,10 @@ class TestAsyncJobs:
             assert task is not None
             assert task.status == TaskStatus.PENDING
             
-            # Verify thread pool submit was not called directly
-            # The task processor thread should pick up the task from the database
-            assert not mock_submit.called
+            # Verify the dispatcher was woken for the committed task
+            # instead of the request starting the task itself
+            mock_enqueue.assert_called_once_with(task_id)
+            assert not mock_start.called
 
     def test_get_task_status(self, client, auth_headers, test_db):
         """Test getting task status."""
@@ -106,7 +108,45 @@ class TestAsyncJobs:
         assert data["id"] == task.id
         assert data["status"] == TaskStatus.PROCESSING
         assert data["progress"] == 50
-        
+
+    def test_get_task_status_partial_result(self, client, auth_headers, test_db):
+        """Test that streamed ingredients of a processing task include meal totals."""
+        from app.models.task_models import Task
+
+        user = test_db.query(User).filter(User.email == "test@example.com").first()
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PROCESSING,
+            progress=40,
+            params={"file_id": "test.jpg"},
+            result={
+                "ingredients": [{
+                    "name": "米饭",
+                    "portion": 100,
+                    "gi": 83,
+                    "carbs_per_100g": 25.9,
+                    "protein_per_100g": 2.6,
+                    "fat_per_100g": 0.3
+                }],
+                "notes": ""
+            }
+        )
+        test_db.add(task)
+        test_db.commit()
+        test_db.refresh(task)
+
+        response = client.get(
+            f"/jobs/tasks/{task.id}",
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == TaskStatus.PROCESSING
+        assert data["result"]["total_carbs"] == 25.9
+        assert data["result"]["notes"] == ""
+
     def test_get_nonexistent_task(self, client, auth_headers):
         """Test getting a task that doesn't exist."""
         # Make request for a non-existent task
@@ -118,10 +158,11 @@ class TestAsyncJobs:
         # Check response
         assert response.status_code == 404 
         
-    def test_task_processor_thread(self, test_db, test_user):
-        """Test that the task processor thread picks up pending tasks."""
+    @pytest.mark.asyncio
+    async def test_task_processor_reconcile(self, test_db, test_user):
+        """Test that the reconciliation scan claims and starts pending tasks."""
         from app.models.task_models import Task, TaskStatus
-        from app.utils.background_tasks import process_image_background_thread
+        from app.utils.background_tasks import reconcile_pending_tasks
         
         # Use the test user from the fixture
         user = test_user["user"]
@@ -138,39 +179,198 @@ class TestAsyncJobs:
         )
         test_db.add(task)
         test_db.commit()
-        test_db.refresh(task)
+        task_id = task.id
         
-        # Instead of calling process_pending_tasks, we'll directly test the logic
-        # that would be executed in a single iteration of the loop
-        with patch("app.utils.background_tasks.thread_pool.submit") as mock_submit:
-            # Get the task from the database
-            pending_task = test_db.query(Task).filter(
-                Task.status == TaskStatus.PENDING
-            ).order_by(Task.created_at).first()
-            
-            assert pending_task is not None
-            assert pending_task.id == task.id
+        with patch("app.database.database.SessionLocal", return_value=test_db), \
+                patch("app.utils.background_tasks.start_claimed_task") as mock_start:
+            assert await reconcile_pending_tasks() == 1
             
-            # Simulate submitting the task to the thread pool
-            mock_submit(
-                process_image_background_thread,
-                task_id=pending_task.id,
-                file_id=pending_task.params.get("file_id"),
-                user_comment=pending_task.params.get("user_comment")
+            # Verify that the claimed task was started with its parameters
+            mock_start.assert_called_once_with(
+                task_id,
+                {"file_id": "test.jpg", "user_comment": "Test comment"},
             )
-            
-            # Verify that thread_pool.submit was called with the correct arguments
-            mock_submit.assert_called_once_with(
-                process_image_background_thread,
-                task_id=task.id,
-                file_id="test.jpg",
-                user_comment="Test comment"
+
+            # The task is now claimed, so a second scan finds nothing
+            assert await reconcile_pending_tasks() == 0
+
+    @pytest.mark.asyncio
+    async def test_dispatch_task_starts_once(self, test_db, test_user):
+        """Test that a pending task is claimed and started only once."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import WORKER_ID, dispatch_task
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "test.jpg", "user_comment": "Test comment"}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+
+        with patch("app.database.database.SessionLocal", return_value=test_db), \
+                patch("app.utils.background_tasks.start_claimed_task") as mock_start:
+            assert await dispatch_task(task_id) is True
+            # A second wake-up or reconciliation scan must not start it again
+            assert await dispatch_task(task_id) is False
+
+            mock_start.assert_called_once_with(
+                task_id,
+                {"file_id": "test.jpg", "user_comment": "Test comment"},
+            )
+
+        claimed = test_db.query(Task).filter(Task.id == task_id).first()
+        assert claimed.status == TaskStatus.CLAIMED
+        assert claimed.lease_owner == WORKER_ID
+        assert claimed.lease_expires_at is not None
+        assert claimed.attempts == 1
+
+    @pytest.mark.asyncio
+    async def test_dispatch_task_missing_file_id(self, test_db, test_user):
+        """Test that a task without a file id is failed instead of started."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import dispatch_task
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+
+        with patch("app.database.database.SessionLocal", return_value=test_db), \
+                patch("app.utils.background_tasks.start_claimed_task") as mock_start:
+            assert await dispatch_task(task_id) is False
+            assert not mock_start.called
+
+        failed = test_db.query(Task).filter(Task.id == task_id).first()
+        assert failed.status == TaskStatus.FAILED
+        assert failed.error == "Missing required parameters"
+
+    @pytest.mark.asyncio
+    async def test_dispatch_task_without_free_slot(self, test_db, test_user, monkeypatch):
+        """Test that a busy worker leaves the task pending instead of claiming it."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import dispatch_task
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "test.jpg"}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+
+        monkeypatch.setattr("app.utils.background_tasks.TASK_WORKER_CONCURRENCY", 0)
+        with patch("app.database.database.SessionLocal", return_value=test_db):
+            assert await dispatch_task(task_id) is False
+
+        pending = test_db.query(Task).filter(Task.id == task_id).first()
+        assert pending.status == TaskStatus.PENDING
+
+    def test_claim_pending_tasks_excludes(self, test_db, test_user):
+        """Test that tasks still running on this worker are not claimed again."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import claim_pending_tasks
+
+        user = test_user["user"]
+        tasks = [
+            Task(
+                user_id=user.id,
+                task_type="process_image",
+                status=TaskStatus.PROCESSING,
+                progress=0,
+                attempts=1,
+                lease_owner="worker-a",
+                lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+                params={"file_id": f"test_{i}.jpg"}
             )
+            for i in range(2)
+        ]
+        test_db.add_all(tasks)
+        test_db.commit()
+
+        claimed = claim_pending_tasks(test_db, owner="worker-a", exclude=[tasks[0].id])
+        assert [task.id for task in claimed] == [tasks[1].id]
 
-    def test_process_image_background_thread(self, test_db, test_user):
-        """Test the process_image_background_thread function."""
+    def test_claim_task_is_exclusive(self, test_db, test_user):
+        """Test that only one worker can claim a task until its lease expires."""
         from app.models.task_models import Task, TaskStatus
-        from app.utils.background_tasks import process_image_background_thread
+        from app.utils.background_tasks import claim_task
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "test.jpg"}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+
+        assert claim_task(test_db, task_id, owner="worker-a") is True
+        assert claim_task(test_db, task_id, owner="worker-b") is False
+
+        # Simulate worker-a dying and its lease running out
+        task = test_db.query(Task).filter(Task.id == task_id).first()
+        task.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        test_db.commit()
+
+        assert claim_task(test_db, task_id, owner="worker-b") is True
+        task = test_db.query(Task).filter(Task.id == task_id).first()
+        assert task.lease_owner == "worker-b"
+        assert task.attempts == 2
+
+    def test_update_claimed_task_is_fenced(self, test_db, test_user):
+        """Test that a worker that lost its lease cannot overwrite the task."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import (
+            LeaseLostError,
+            claim_task,
+            update_claimed_task,
+        )
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "test.jpg"}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+
+        assert claim_task(test_db, task_id, owner="worker-b") is True
+        with pytest.raises(LeaseLostError):
+            update_claimed_task(
+                test_db, task_id, TaskStatus.COMPLETED, progress=100, owner="worker-a"
+            )
+
+        task = test_db.query(Task).filter(Task.id == task_id).first()
+        assert task.status == TaskStatus.CLAIMED
+
+    @pytest.mark.asyncio
+    async def test_process_image_task(self, test_db, test_user):
+        """Test the process_image_task coroutine."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import process_image_task
         
         # Use the test user from the fixture
         user = test_user["user"]
@@ -188,6 +388,10 @@ class TestAsyncJobs:
         test_db.add(task)
         test_db.commit()
         task_id = task.id
+
+        # The processor only runs tasks this worker has claimed
+        from app.utils.background_tasks import claim_task
+        assert claim_task(test_db, task_id)
         
         # Mock dependencies
         with patch("app.database.database.SessionLocal", return_value=test_db):
@@ -198,7 +402,9 @@ class TestAsyncJobs:
                 with patch("app.dependencies.get_storage") as mock_get_storage:
                     mock_storage = MagicMock()
                     # Mock the get_download_url method
-                    mock_storage.get_download_url.return_value = "https://example.com/test.jpg"
+                    mock_storage.get_download_url_async = AsyncMock(
+                        return_value="https://example.com/test.jpg"
+                    )
                     mock_get_storage.return_value = mock_storage
                     
                     # Create a mock for the analyze_food_image function
@@ -221,7 +427,7 @@ class TestAsyncJobs:
                     # Patch the async functions
                     with patch("app.utils.background_tasks.analyze_food_image", mock_analyze):
                         # Call the function
-                        process_image_background_thread(
+                        await process_image_task(
                             task_id=task_id,
                             file_id="test.jpg"
                         )
@@ -235,10 +441,11 @@ class TestAsyncJobs:
                         assert updated_task.progress == 100
                         assert updated_task.result is not None
                         
-    def test_process_image_background_thread_error(self, test_db, test_user):
-        """Test error handling in the process_image_background_thread function."""
+    @pytest.mark.asyncio
+    async def test_process_image_task_error(self, test_db, test_user):
+        """Test error handling in the process_image_task coroutine."""
         from app.models.task_models import Task, TaskStatus
-        from app.utils.background_tasks import process_image_background_thread
+        from app.utils.background_tasks import process_image_task
         
         # Use the test user from the fixture
         user = test_user["user"]
@@ -256,6 +463,10 @@ class TestAsyncJobs:
         test_db.add(task)
         test_db.commit()
         task_id = task.id
+
+        # The processor only runs tasks this worker has claimed
+        from app.utils.background_tasks import claim_task
+        assert claim_task(test_db, task_id)
         
         # Mock dependencies
         with patch("app.database.database.SessionLocal", return_value=test_db):
@@ -266,7 +477,9 @@ class TestAsyncJobs:
                 with patch("app.dependencies.get_storage") as mock_get_storage:
                     mock_storage = MagicMock()
                     # Mock the get_download_url method
-                    mock_storage.get_download_url.return_value = "https://example.com/test.jpg"
+                    mock_storage.get_download_url_async = AsyncMock(
+                        return_value="https://example.com/test.jpg"
+                    )
                     mock_get_storage.return_value = mock_storage
                     
                     # Create a mock for the analyze_food_image function that raises an exception
@@ -275,7 +488,7 @@ class TestAsyncJobs:
                     # Patch the async functions
                     with patch("app.utils.background_tasks.analyze_food_image", mock_analyze):
                         # Call the function
-                        process_image_background_thread(
+                        await process_image_task(
                             task_id=task_id,
                             file_id="test.jpg"
                         )
@@ -288,4 +501,155 @@ class TestAsyncJobs:
                         assert updated_task.status == TaskStatus.FAILED
                         assert "Test error" == updated_task.error
 
- 
\ No newline at end of file
+ 
+    @pytest.mark.asyncio
+    async def test_process_image_task_duplicate(self, test_db, test_user):
+        """Test that a re-submitted photo reuses the completed result without calling GPT."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import claim_task, process_image_task
+        from app.utils.image_processing import image_digest
+
+        user = test_user["user"]
+        image_bytes = b"same photo bytes"
+        result = {"ingredients": [], "notes": "Earlier analysis"}
+        completed = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.COMPLETED,
+            progress=100,
+            params={"file_id": "first.jpg"},
+            result=result,
+            image_digest=image_digest(image_bytes)
+        )
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "second.jpg"}
+        )
+        test_db.add_all([completed, task])
+        test_db.commit()
+        task_id = task.id
+        assert claim_task(test_db, task_id)
+
+        mock_analyze = AsyncMock()
+        with patch("app.database.database.SessionLocal", return_value=test_db), \
+                patch("app.utils.background_tasks.load_image_bytes", AsyncMock(return_value=image_bytes)), \
+                patch("app.utils.background_tasks.analyze_food_image", mock_analyze):
+            await process_image_task(task_id=task_id, file_id="https://example.com/second.jpg")
+
+        test_db.expire_all()
+        duplicate = test_db.query(Task).filter(Task.id == task_id).first()
+        assert duplicate.status == TaskStatus.COMPLETED
+        assert duplicate.result == result
+        assert duplicate.image_digest == image_digest(image_bytes)
+        assert not mock_analyze.called
+
+    @pytest.mark.asyncio
+    async def test_process_image_task_rejected(self, test_db, test_user):
+        """Test that images failing the pre-filter fail the task with the reason."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import claim_task, process_image_task
+        from app.utils.image_prefilter import ImageRejectedError
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "dark.jpg"}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+        assert claim_task(test_db, task_id)
+
+        mock_analyze = AsyncMock()
+        with patch("app.database.database.SessionLocal", return_value=test_db), \
+                patch("app.utils.background_tasks.load_image_bytes", AsyncMock(return_value=b"dark")), \
+                patch("app.utils.background_tasks.prepare_image", AsyncMock(side_effect=ImageRejectedError("too_dark"))), \
+                patch("app.utils.background_tasks.analyze_food_image", mock_analyze):
+            await process_image_task(task_id=task_id, file_id="https://example.com/dark.jpg")
+
+        test_db.expire_all()
+        rejected = test_db.query(Task).filter(Task.id == task_id).first()
+        assert rejected.status == TaskStatus.FAILED
+        assert rejected.error == "Image is too dark"
+        assert not mock_analyze.called
+
+    def test_process_image_async_keeps_previous_ingredients(self, client, auth_headers, test_db):
+        """Test that a correction request stores the previous ingredient list."""
+        request_data = {
+            "file_id": "cloud://test_file_id",
+            "user_comment": "米饭只有100克",
+            "analysis": {
+                "ingredients": [
+                    {"name": "米饭", "portion": 150, "gi": 83, "gl_category": "high", "id": "x"},
+                    {"portion": 10},
+                ],
+                "notes": "Long notes that are not needed for the correction",
+            },
+        }
+
+        with patch("app.routers.jobs.enqueue_task"):
+            response = client.post(
+                "/jobs/process-image-async",
+                json=request_data,
+                headers=auth_headers,
+            )
+
+        assert response.status_code == 200
+        from app.models.task_models import Task
+        task = test_db.query(Task).filter(Task.id == response.json()["id"]).first()
+        assert task.params["previous_ingredients"] == [{"name": "米饭", "portion": 150, "gi": 83}]
+
+    @pytest.mark.asyncio
+    async def test_process_image_task_text_correction(self, test_db, test_user):
+        """Test that corrections complete from the text model without the image."""
+        from app.models.task_models import Task, TaskStatus
+        from app.utils.background_tasks import claim_task, process_image_task
+
+        user = test_user["user"]
+        task = Task(
+            user_id=user.id,
+            task_type="process_image",
+            status=TaskStatus.PENDING,
+            progress=0,
+            params={"file_id": "cloud://photo"}
+        )
+        test_db.add(task)
+        test_db.commit()
+        task_id = task.id
+        assert claim_task(test_db, task_id)
+
+        corrected = {
+            "ingredients": [{
+                "name": "test_ingredient",
+                "portion": 100,
+                "gi": 50,
+                "carbs_per_100g": 10,
+                "protein_per_100g": 10,
+                "fat_per_100g": 10
+            }],
+            "notes": "Corrected notes"
+        }
+        mock_analyze = AsyncMock()
+        with patch("app.database.database.SessionLocal", return_value=test_db), \
+                patch("app.utils.background_tasks.correct_food_analysis", AsyncMock(return_value=corrected)), \
+                patch("app.utils.background_tasks.analyze_food_image", mock_analyze), \
+                patch("app.dependencies.get_storage") as mock_get_storage:
+            await process_image_task(
+                task_id=task_id,
+                file_id="cloud://photo",
+                previous_ingredients=[{"name": "test_ingredient", "portion": 150}],
+                user_comment="Only 100g"
+            )
+            assert not mock_get_storage.return_value.get_download_url_async.called
+
+        test_db.expire_all()
+        completed = test_db.query(Task).filter(Task.id == task_id).first()
+        assert completed.status == TaskStatus.COMPLETED
+        assert completed.result == corrected
+        assert not mock_analyze.called
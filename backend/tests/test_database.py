@@ -0,0 +1,184 @@
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+
+from app.database import database
+from app.dependencies import get_read_db, writer_key
+from app.models.task_models import Task, TaskStatus
+from app.models.user_models import User
+from app.routers.jobs import get_task_status
+from app.utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def small_pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 0.1)
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'pool.db'}", "test_pool")
+    yield engine
+    engine.dispose()
+
+
+class TestConnectionPool:
+    def test_pool_settings(self, small_pool):
+        """Test that the pool is created with the configured settings."""
+        assert small_pool.pool.size() == 1
+        assert small_pool.pool._max_overflow == 1
+        assert small_pool.pool._timeout == 0.1
+        assert small_pool.pool._recycle == database.DB_POOL_RECYCLE
+        assert small_pool.pool._pre_ping == database.DB_POOL_PRE_PING
+
+    def test_gauges_count_connections(self, small_pool):
+        """Test that the gauges report checked out and overflow connections."""
+        first = small_pool.connect()
+        second = small_pool.connect()
+        assert metrics.snapshot()["gauges"]["test_pool"] == {
+            "size": 1,
+            "checked_out": 2,
+            "idle": 0,
+            "overflow": 1,
+            "max_overflow": 1,
+        }
+
+        first.close()
+        second.close()
+        gauges = metrics.snapshot()["gauges"]["test_pool"]
+        assert gauges["checked_out"] == 0
+        assert gauges["idle"] == 1
+
+    def test_checkout_wait_and_timeout(self, small_pool):
+        """Test that checkout waits are timed and pool timeouts counted."""
+        connections = [small_pool.connect(), small_pool.connect()]
+        with pytest.raises(PoolTimeoutError):
+            small_pool.connect()
+        for connection in connections:
+            connection.close()
+
+        snapshot = metrics.snapshot()
+        assert snapshot["counters"]["test_pool_timeouts"] == 1
+        timing = snapshot["timings"]["test_pool_checkout_seconds"]
+        assert timing["count"] == 3
+        assert timing["max"] >= 0.1
+
+    def test_metrics_name_survives_dispose(self, small_pool):
+        """Test that a recreated pool keeps reporting under the engine's name."""
+        small_pool.dispose()
+        small_pool.connect().close()
+        assert metrics.snapshot()["timings"]["test_pool_checkout_seconds"]["count"] == 1
+
+
+@pytest.fixture
+def last_writes(monkeypatch):
+    monkeypatch.setattr(database, "_last_writes", {})
+    monkeypatch.setattr(database, "READ_STICKY_SECONDS", 10)
+
+
+@pytest.fixture
+def tracked_sessions(tmp_path, last_writes):
+    engine = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    User.__table__.create(engine)
+    session_factory = sessionmaker(bind=engine)
+    database.track_writes(session_factory)
+    yield session_factory
+    engine.dispose()
+
+
+class TestReadRouting:
+    def test_sticky_window(self, last_writes, monkeypatch):
+        """Test that a write keeps the writer on the primary for the window only."""
+        assert not database.recently_wrote("User:1")
+        database.record_write("User:1")
+        assert database.recently_wrote("User:1")
+        assert not database.recently_wrote("User:2")
+
+        monkeypatch.setattr(database, "READ_STICKY_SECONDS", 0)
+        assert not database.recently_wrote("User:1")
+
+    def test_commits_with_changes_are_recorded(self, tracked_sessions):
+        """Test that only commits that wrote something record the writer."""
+        db = tracked_sessions()
+        db.info["writer"] = "User:1"
+        db.query(User).all()
+        db.commit()
+        assert not database.recently_wrote("User:1")
+
+        db.add(User(email="a@example.com", hashed_password="x", full_name="A"))
+        db.commit()
+        assert database.recently_wrote("User:1")
+
+        db.info["writer"] = "User:2"
+        db.execute(update(User).values(full_name="B"))
+        db.commit()
+        assert database.recently_wrote("User:2")
+        db.close()
+
+    def test_rolled_back_writes_are_not_recorded(self, tracked_sessions):
+        """Test that a rolled back write does not make the next commit sticky."""
+        db = tracked_sessions()
+        db.info["writer"] = "User:1"
+        db.execute(update(User).values(full_name="B"))
+        db.rollback()
+        db.commit()
+        assert not database.recently_wrote("User:1")
+        db.close()
+
+    def test_get_read_db_routes_to_replica(self, tracked_sessions, monkeypatch):
+        """Test that reads use the replica unless the user wrote recently."""
+        user = User(id=1)
+        primary = tracked_sessions()
+        monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(info={"replica": True}))
+
+        dependency = get_read_db(user, primary)
+        assert next(dependency).info.get("replica")
+        dependency.close()
+
+        database.record_write(writer_key(user))
+        dependency = get_read_db(user, primary)
+        assert next(dependency) is primary
+        dependency.close()
+
+    def test_without_replica_reads_use_primary(self, tracked_sessions, monkeypatch):
+        """Test that the primary session is used when no replica is configured."""
+        monkeypatch.setattr(database, "ReadSessionLocal", None)
+        primary = tracked_sessions()
+        assert next(get_read_db(User(id=1), primary)) is primary
+
+    def test_task_missing_on_replica_is_read_from_primary(self, tmp_path):
+        """Test that a task the replica has not received yet is found on the primary."""
+        sessions = {}
+        for name in ("primary", "replica"):
+            engine = create_engine(f"sqlite:///{tmp_path / f'{name}.db'}")
+            User.__table__.create(engine)
+            Task.__table__.create(engine)
+            sessions[name] = sessionmaker(bind=engine)()
+        now = datetime.now(timezone.utc)
+        sessions["primary"].add(
+            Task(id=1, user_id=1, task_type="image_analysis", status=TaskStatus.PENDING,
+                 created_at=now, updated_at=now)
+        )
+        sessions["primary"].commit()
+
+        user = User(id=1)
+        task = get_task_status(1, db=sessions["replica"], current_user=user, primary=sessions["primary"])
+        assert task.status == TaskStatus.PENDING
+        assert metrics.snapshot()["counters"]["db_replica_task_misses"] == 1
+
+        with pytest.raises(HTTPException) as error:
+            get_task_status(2, db=sessions["replica"], current_user=user, primary=sessions["primary"])
+        assert error.value.status_code == 404
+        for session in sessions.values():
+            session.close()
+            session.get_bind().dispose()
@@ -0,0 +1,22 @@
+from app.utils.etag import etag_matches, make_etag
+
+
+class TestEtag:
+    def test_make_etag(self):
+        """Test that tags are quoted, stable and depend on every part."""
+        etag = make_etag("User", 1, 3)
+        assert etag.startswith('"') and etag.endswith('"')
+        assert make_etag("User", 1, 3) == etag
+        assert make_etag("User", 1, 4) != etag
+        assert make_etag("User", 1, 3, weak=True) == f"W/{etag}"
+
+    def test_etag_matches(self):
+        """Test If-None-Match parsing with lists, wildcards and weak tags."""
+        etag = make_etag("a")
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", {etag}', etag)
+        assert etag_matches("*", etag)
+        assert etag_matches(f"W/{etag}", etag)
+        assert etag_matches(etag, f"W/{etag}")
+        assert not etag_matches(None, etag)
+        assert not etag_matches('"other"', etag)
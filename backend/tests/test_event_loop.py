@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi.routing import APIRoute
+
+from app.dependencies import get_current_user, get_db, get_read_db
+from app.main import app
+
+# Async handlers that pass their database work to run_in_threadpool, or only
+# hand the engine to a streamed response
+OFFLOADING_HANDLERS = {
+    "resend_activation_email",
+    "weixin_login",
+    "handle_payment_notification",
+    "export_meals",
+}
+
+
+def uses_session(route: APIRoute) -> bool:
+    return any(
+        dependency.call in (get_db, get_read_db) for dependency in route.dependant.dependencies
+    )
+
+
+class TestEventLoop:
+    def test_session_users_run_in_threadpool(self):
+        """Test that handlers using the blocking session are not coroutines."""
+        blocking = [
+            route.endpoint.__name__
+            for route in app.routes
+            if isinstance(route, APIRoute)
+            and uses_session(route)
+            and asyncio.iscoroutinefunction(route.endpoint)
+            and route.endpoint.__name__ not in OFFLOADING_HANDLERS
+        ]
+        assert blocking == []
+
+    def test_current_user_runs_in_threadpool(self):
+        """Test that the user lookup dependency is not a coroutine."""
+        assert not asyncio.iscoroutinefunction(get_current_user)
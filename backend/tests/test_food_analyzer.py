@@ -0,0 +1,146 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from app.utils.food_analyzer import TagStreamParser, analyze_food_image, correct_food_analysis
+from app.utils.gpt_client import GPTClient
+
+RESPONSE = (
+    '<JSON>{"ingredients": [{"name": "米饭", "portion": 150, "gi": 83, '
+    '"carbs_per_100g": 25.9, "protein_per_100g": 2.6, "fat_per_100g": 0.3}]}</JSON>'
+    "<COMMENT>建议搭配蔬菜。</COMMENT>"
+)
+
+
+def _chunks(text: str, size: int = 7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class StreamingClient:
+    """Stand-in for GPTClient that streams a fixed response in small chunks."""
+
+    def __init__(self, response: str):
+        self.response = response
+        self.events = []
+
+    async def __call__(self, image_url, system_message, user_message, image_key=None, on_delta=None):
+        for chunk in _chunks(self.response):
+            self.events.append(("delta", chunk))
+            if on_delta is not None:
+                await on_delta(chunk)
+        return self.response
+
+
+class TestTagStreamParser:
+    def test_sections_complete_once(self):
+        """Test that each section is returned once, when its closing tag arrives."""
+        parser = TagStreamParser(["JSON", "COMMENT"])
+        completed = [parser.feed(chunk) for chunk in _chunks(RESPONSE)]
+        found = [sections for sections in completed if sections]
+
+        assert len(found) == 2
+        assert '"米饭"' in found[0]["JSON"]
+        assert found[1] == {"COMMENT": "建议搭配蔬菜。"}
+
+    def test_closing_tag_split_across_chunks(self):
+        """Test that a closing tag split over two chunks is detected."""
+        parser = TagStreamParser(["JSON"])
+        assert parser.feed("<JSON>{}</JS") == {}
+        assert parser.feed("ON>") == {"JSON": "{}"}
+        assert parser.feed("</JSON>") == {}
+
+
+class TestAnalyzeFoodImage:
+    @pytest.mark.asyncio
+    async def test_ingredients_published_before_comment(self):
+        """Test that ingredients are published before the comment is streamed."""
+        client = StreamingClient(RESPONSE)
+
+        async def on_ingredients(ingredients):
+            client.events.append(("ingredients", ingredients))
+
+        result = await analyze_food_image(
+            "https://example.com/a.jpg", client, on_ingredients=on_ingredients
+        )
+
+        assert result["notes"] == "建议搭配蔬菜。"
+        published = [i for i, event in enumerate(client.events) if event[0] == "ingredients"]
+        assert len(published) == 1
+        assert client.events[published[0]][1][0]["name"] == "米饭"
+        # More chunks (the comment) were still streamed after publication
+        assert published[0] < len(client.events) - 1
+
+    @pytest.mark.asyncio
+    async def test_publication_errors_do_not_fail_analysis(self):
+        """Test that a failing early publication still returns the full result."""
+        client = StreamingClient(RESPONSE)
+        on_ingredients = AsyncMock(side_effect=RuntimeError("db down"))
+
+        result = await analyze_food_image(
+            "https://example.com/a.jpg", client, on_ingredients=on_ingredients
+        )
+        assert on_ingredients.await_count == 1
+        assert result["ingredients"][0]["portion"] == 150
+
+
+class TestCorrectFoodAnalysis:
+    PREVIOUS = [{"name": "米饭", "portion": 150}, {"name": "鸡蛋", "portion": 50}]
+
+    @pytest.mark.asyncio
+    async def test_text_only_correction(self):
+        """Test that a correction is made by the text model without the image."""
+        client = SimpleNamespace(get_json_response=AsyncMock(return_value={
+            "ingredients": [
+                {"name": "米饭", "portion": 100, "gi": 83, "carbs_per_100g": 25.9,
+                 "protein_per_100g": 2.6, "fat_per_100g": 0.3},
+            ],
+            "notes": "少吃点米饭更好。",
+        }))
+
+        result = await correct_food_analysis(self.PREVIOUS, "米饭只有100克，没有鸡蛋", client)
+
+        assert result["ingredients"][0]["portion"] == 100
+        assert "gl" not in result["ingredients"][0]
+        assert result["notes"] == "少吃点米饭更好。"
+        user_message = client.get_json_response.await_args.args[1]
+        assert "鸡蛋" in user_message
+        assert "没有鸡蛋" in user_message
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("response", [
+        None,
+        {"ingredients": [{"name": "米饭", "portion": 100}], "notes": ""},
+        {"ingredients": [], "notes": "空的"},
+    ])
+    async def test_unusable_response_falls_back(self, response):
+        """Test that missing or incomplete corrections return None."""
+        client = SimpleNamespace(get_json_response=AsyncMock(return_value=response))
+        assert await correct_food_analysis(self.PREVIOUS, "更正", client) is None
+
+
+class TestGPTClientStreaming:
+    @pytest.mark.asyncio
+    async def test_stream_deltas_and_return_text(self):
+        """Test that on_delta requests a streamed completion and receives each chunk."""
+
+        async def stream():
+            for chunk in _chunks(RESPONSE):
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))]
+                )
+
+        client = GPTClient(cache=None)
+        create = AsyncMock(return_value=stream())
+        client.vision_client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+        received = []
+
+        async def on_delta(text):
+            received.append(text)
+
+        result = await client("https://example.com/a.jpg", "system", "user", on_delta=on_delta)
+
+        assert result == RESPONSE
+        assert "".join(received) == RESPONSE
+        assert create.await_args.kwargs["stream"] is True
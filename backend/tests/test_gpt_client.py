@@ -1,6 +1,11 @@
 import pytest
 import json
-from app.utils.gpt_client import repair_json_str
+import httpx
+from app.utils.gpt_client import (
+    repair_json_str,
+    get_shared_gpt_client,
+    close_shared_gpt_client,
+)
 
 
 class TestRepairJsonStr:
@@ -58,3 +63,27 @@ class TestRepairJsonStr:
     #     input_json = '[{"name": "生菜沙拉", "portion": 250, "gi": "_"}, {"name": "奶油通心粉", "portion": 486}]'
     #     result = repair_json_str(input_json)
     #     assert json.loads(result) == [{"name": "生菜沙拉", "portion": 250, "gi": 0}, {"name": "奶油通心粉", "portion": 486}]
+
+
+class TestSharedGPTClient:
+    @pytest.mark.asyncio
+    async def test_reused_on_same_loop(self):
+        """Test that one pooled client is shared on an event loop."""
+        first = get_shared_gpt_client()
+        second = get_shared_gpt_client()
+        assert first is second
+        assert isinstance(first.http_client, httpx.AsyncClient)
+
+        await close_shared_gpt_client()
+        assert first.http_client.is_closed
+
+    @pytest.mark.asyncio
+    async def test_recreated_after_close(self):
+        """Test that a closed shared client is replaced on next use."""
+        first = get_shared_gpt_client()
+        await close_shared_gpt_client()
+
+        second = get_shared_gpt_client()
+        assert second is not first
+        assert not second.http_client.is_closed
+        await close_shared_gpt_client()
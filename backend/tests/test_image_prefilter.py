@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from app.utils.image_prefilter import (
+    BLANK,
+    BLURRY,
+    TOO_BRIGHT,
+    TOO_DARK,
+    TOO_SMALL,
+    ImageRejectedError,
+    check_image,
+)
+
+
+def _textured(width: int = 800, height: int = 600) -> Image.Image:
+    # Random coloured blocks give sharp edges and plenty of contrast
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(30, 230, size=(height // 20 + 1, width // 20 + 1, 3), dtype=np.uint8)
+    pixels = np.kron(blocks, np.ones((20, 20, 1), dtype=np.uint8))[:height, :width]
+    return Image.fromarray(pixels, "RGB")
+
+
+class TestCheckImage:
+    def test_textured_image_passes(self):
+        """Test that a sharp, well exposed image is accepted."""
+        assert check_image(_textured()) is None
+
+    @pytest.mark.parametrize(
+        "color, reason",
+        [((0, 0, 0), TOO_DARK), ((255, 255, 255), TOO_BRIGHT), ((128, 128, 128), BLANK)],
+    )
+    def test_flat_frames_rejected(self, color, reason):
+        """Test that black, white and uniform frames are rejected."""
+        assert check_image(Image.new("RGB", (800, 600), color)) == reason
+
+    def test_blurry_image_rejected(self):
+        """Test that a heavily blurred image is rejected."""
+        blurred = _textured().filter(ImageFilter.GaussianBlur(radius=12))
+        assert check_image(blurred) == BLURRY
+
+    def test_tiny_image_rejected(self):
+        """Test that thumbnails too small to analyse are rejected."""
+        assert check_image(_textured(40, 40)) == TOO_SMALL
+
+    def test_error_message(self):
+        """Test that the rejection error carries a readable message and the reason."""
+        error = ImageRejectedError(BLURRY)
+        assert error.reason == BLURRY
+        assert str(error) == "Image is too blurry"
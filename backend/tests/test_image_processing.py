@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import io
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils import image_processing
+from app.utils.image_prefilter import ImageRejectedError
+from app.utils.image_processing import (
+    ImageProcessingError,
+    image_digest,
+    load_image_bytes,
+    normalize_image,
+    prepare_image,
+)
+
+
+def _jpeg(width: int, height: int, orientation: int = None) -> bytes:
+    # Coloured blocks so that the image passes the pre-filter
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(30, 230, size=(height // 40 + 1, width // 40 + 1, 3), dtype=np.uint8)
+    pixels = np.kron(blocks, np.ones((40, 40, 1), dtype=np.uint8))[:height, :width]
+    image = Image.fromarray(pixels, "RGB")
+    output = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = "TestCamera"
+    if orientation is not None:
+        exif[0x0112] = orientation
+    image.save(output, format="JPEG", exif=exif)
+    return output.getvalue()
+
+
+class TestNormalizeImage:
+    def test_downsizes_to_max_edge(self):
+        """Test that the longest edge is scaled down and the aspect ratio kept."""
+        result = Image.open(io.BytesIO(normalize_image(_jpeg(4000, 3000), max_edge=1024)))
+        assert result.size == (1024, 768)
+        assert result.format == "JPEG"
+
+    def test_small_images_are_not_enlarged(self):
+        """Test that images below the max edge keep their size."""
+        result = Image.open(io.BytesIO(normalize_image(_jpeg(640, 480), max_edge=1024)))
+        assert result.size == (640, 480)
+
+    def test_exif_orientation_applied_and_stripped(self):
+        """Test that the image is rotated upright and EXIF metadata removed."""
+        # Orientation 6 means the stored pixels must be rotated 90 degrees
+        data = normalize_image(_jpeg(400, 200, orientation=6), max_edge=1024)
+        result = Image.open(io.BytesIO(data))
+        assert result.size == (200, 400)
+        assert len(result.getexif()) == 0
+
+    def test_webp_output(self):
+        """Test that WEBP can be selected as output format."""
+        data = normalize_image(_jpeg(800, 600), max_edge=512, image_format="WEBP")
+        result = Image.open(io.BytesIO(data))
+        assert result.format == "WEBP"
+        assert result.size == (512, 384)
+
+
+class TestPrepareImage:
+    @pytest.mark.asyncio
+    async def test_base64_source(self, monkeypatch):
+        """Test that base64 input is decoded, normalized and digested by original bytes."""
+        monkeypatch.setattr(image_processing, "IMAGE_PROCESS_WORKERS", 0)
+        original = _jpeg(3000, 2000)
+
+        loaded = await load_image_bytes(base64.b64encode(original).decode())
+        data_url = await prepare_image(loaded)
+
+        assert data_url.startswith("data:image/jpeg;base64,")
+        normalized = base64.b64decode(data_url.split(",", 1)[1])
+        assert len(normalized) < len(original)
+        assert image_digest(loaded) == hashlib.sha256(original).hexdigest()
+
+    @pytest.mark.asyncio
+    async def test_process_pool(self):
+        """Test that normalization runs on the process pool."""
+        try:
+            data_url = await prepare_image(_jpeg(2000, 1000))
+        finally:
+            image_processing.shutdown_image_pool()
+
+        result = Image.open(io.BytesIO(base64.b64decode(data_url.split(",", 1)[1])))
+        assert max(result.size) == image_processing.IMAGE_MAX_EDGE
+
+    @pytest.mark.asyncio
+    async def test_broken_pool_is_restarted(self, monkeypatch):
+        """Test that a broken process pool is replaced and the image retried once."""
+        pools = []
+
+        class Pool(ThreadPoolExecutor):
+            def __init__(self, **kwargs):
+                super().__init__(max_workers=1)
+                pools.append(self)
+
+            def submit(self, fn, *args, **kwargs):
+                if len(pools) == 1:
+                    future = Future()
+                    future.set_exception(BrokenProcessPool("A worker process died"))
+                    return future
+                return super().submit(fn, *args, **kwargs)
+
+        monkeypatch.setattr(image_processing, "ProcessPoolExecutor", Pool)
+        monkeypatch.setattr(image_processing, "_executor", None)
+        try:
+            data_url = await prepare_image(_jpeg(800, 600))
+        finally:
+            image_processing.shutdown_image_pool()
+
+        assert data_url.startswith("data:image/jpeg;base64,")
+        assert len(pools) == 2
+        assert pools[0]._shutdown
+
+    @pytest.mark.asyncio
+    async def test_rejected_image(self, monkeypatch):
+        """Test that images failing the pre-filter raise ImageRejectedError."""
+        monkeypatch.setattr(image_processing, "IMAGE_PROCESS_WORKERS", 0)
+        output = io.BytesIO()
+        Image.new("RGB", (800, 600), (0, 0, 0)).save(output, format="JPEG")
+
+        with pytest.raises(ImageRejectedError) as excinfo:
+            await prepare_image(output.getvalue())
+        assert excinfo.value.reason == "too_dark"
+
+    @pytest.mark.asyncio
+    async def test_invalid_data(self, monkeypatch):
+        """Test that undecodable input raises ImageProcessingError."""
+        monkeypatch.setattr(image_processing, "IMAGE_PROCESS_WORKERS", 0)
+        with pytest.raises(ImageProcessingError):
+            await load_image_bytes("test.jpg")
+        with pytest.raises(ImageProcessingError):
+            await prepare_image(b"not an image")
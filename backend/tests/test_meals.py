@@ -0,0 +1,776 @@
+import csv
+import io
+import json
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.backfill_rollups import backfill
+from app.models.nutrition_models import NutritionRecord, Ingredient, MealDailyRollup, MealTombstone
+from app.models.user_models import User
+from app.utils.auth import get_password_hash, create_access_token
+from app.routers.meals import (
+    _next_position,
+    decode_watermark,
+    encode_watermark,
+    history_columns,
+    parse_fields,
+    parse_meal_payload,
+    serialize_record,
+)
+from app.services.meal_service import MealService, same_ingredients
+from app.services.rollup_service import day_bounds, local_date, summarize
+from app.utils.pagination import decode_cursor, encode_cursor
+
+# test_db and client fixtures are imported from conftest.py automatically
+
+
+@pytest.fixture(autouse=True)
+def mock_jwt_secret(monkeypatch):
+    """Mock JWT secret key for testing."""
+    TEST_SECRET = "test_secret_key_123"
+    monkeypatch.setenv("JWT_SECRET_KEY", TEST_SECRET)
+    monkeypatch.setattr("app.utils.auth.SECRET_KEY", TEST_SECRET)
+    monkeypatch.setattr("app.utils.auth.ALGORITHM", "HS256")
+    return TEST_SECRET
+
+
+@pytest.fixture
+def test_user(test_db: Session):
+    """Create a test user and return their token."""
+    user = User(
+        email="meals@example.com",
+        hashed_password=get_password_hash("testpass123"),
+        full_name="Meals User",
+    )
+    test_db.add(user)
+    test_db.commit()
+    test_db.refresh(user)
+
+    token = create_access_token(data={"sub": user.id})
+    return {"user": user, "token": token}
+
+
+@pytest.fixture
+def auth_headers(test_user):
+    """Return authorization headers."""
+    return {"Authorization": f"Bearer {test_user['token']}"}
+
+
+def make_analysis(**overrides):
+    """Build an analysis payload as sent by the mini program."""
+    analysis = {
+        "meal_time": "2025-01-01T08:00:00",
+        "ingredients": [
+            {"name": "米饭", "portion": 100.0, "carbs_per_100g": 25.9, "protein_per_100g": 2.6,
+             "fat_per_100g": 0.3, "gi": 83.0, "gl": 21.5, "gi_category": "high"},
+            {"name": "鸡蛋", "portion": 50.0, "carbs_per_100g": 1.1, "protein_per_100g": 13.0,
+             "fat_per_100g": 10.0, "gi": 0.0, "gl": 0.0, "gi_category": "low"},
+        ],
+        "total_carbs": 26.5,
+        "total_protein": 9.1,
+        "total_fat": 5.3,
+        "total_gl": 21.5,
+        "meal_gl_category": "high",
+        "impact_level": "high",
+        "protein_level": "medium",
+        "fat_level": "low",
+        "impact_explanation": "High impact",
+        "best_time": "After exercise",
+        "notes": "Lunch",
+    }
+    analysis.update(overrides)
+    return analysis
+
+
+def create_meals(test_db: Session, user: User, count: int, start: datetime = datetime(2025, 1, 1, 8, 0)):
+    """Create `count` meals one hour apart, each with two ingredients."""
+    records = []
+    for i in range(count):
+        record = NutritionRecord(
+            user_id=user.id,
+            image_url=f"cloud://meal_{i}.jpg",
+            meal_time=start + timedelta(hours=i),
+            total_carbs=10.0 * (i + 1),
+            total_protein=5.0,
+            total_fat=2.0,
+            total_gl=3.0,
+            notes=f"Meal {i}",
+        )
+        record.ingredients = [
+            Ingredient(name="米饭", portion=100, carbs_per_100g=25.9, protein_per_100g=2.6,
+                       fat_per_100g=0.3, gi=83, gl=21.5, gi_category="high"),
+            Ingredient(name="鸡蛋", portion=50, carbs_per_100g=1.1, protein_per_100g=13,
+                       fat_per_100g=10, gi=0, gl=0, gi_category="low"),
+        ]
+        records.append(record)
+    test_db.add_all(records)
+    test_db.commit()
+    return records
+
+
+class TestPaginationCursor:
+    def test_round_trip(self):
+        """Test that a cursor decodes to the sort key it was created from."""
+        meal_time = datetime(2025, 3, 1, 12, 30, 15)
+        assert decode_cursor(encode_cursor(meal_time, 42)) == (meal_time, 42)
+        assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+
+    @pytest.mark.parametrize("cursor", ["", "not-a-cursor", "eyJ0IjoxfQ"])
+    def test_invalid_cursor(self, cursor):
+        """Test that malformed cursors raise ValueError."""
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+class TestWatermark:
+    def test_round_trip(self):
+        """Test that a watermark holds the positions in records and tombstones."""
+        records, tombstones = (datetime(2025, 3, 1, 12, 0), 4), (datetime(2025, 3, 1, 11, 0), 9)
+        assert decode_watermark(encode_watermark(records, tombstones)) == (records, tombstones)
+
+    def test_single_cursor(self):
+        """Test that a watermark without a tombstone position continues from its time."""
+        updated_at = datetime(2025, 3, 1, 12, 0)
+        assert decode_watermark(encode_cursor(updated_at, 4)) == ((updated_at, 4), (updated_at, 0))
+
+    @pytest.mark.parametrize("watermark", ["garbage", encode_cursor(None, 1), "a.b.c"])
+    def test_invalid(self, watermark):
+        """Test that malformed watermarks raise ValueError."""
+        with pytest.raises(ValueError):
+            decode_watermark(watermark)
+
+    def test_position_is_clamped_to_cutoff(self):
+        """Test that a page never moves the position past the safety cutoff."""
+        cutoff = datetime(2025, 3, 1, 12, 0)
+        before = (cutoff - timedelta(minutes=1), 3)
+        assert _next_position(cutoff, before, None, True) == (before, True)
+        # A page reaching past the cutoff has caught up
+        assert _next_position(cutoff, (cutoff + timedelta(seconds=1), 5), None, True) == ((cutoff, 0), False)
+        assert _next_position(cutoff, None, before, False) == (before, False)
+        assert _next_position(cutoff, None, None, False) == ((cutoff, 0), False)
+
+
+class TestMealHistory:
+    def test_pages_follow_cursor(self, client, auth_headers, test_db, test_user):
+        """Test that following X-Next-Cursor returns every meal once, newest first."""
+        create_meals(test_db, test_user["user"], 5)
+
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/meals", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 2
+            seen.extend(page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        assert [meal["notes"] for meal in seen] == [f"Meal {i}" for i in range(4, -1, -1)]
+        assert all(len(meal["ingredients"]) == 2 for meal in seen)
+
+    def test_limit_is_capped(self, client, auth_headers, test_db, test_user, monkeypatch):
+        """Test that the page size never exceeds the server maximum."""
+        monkeypatch.setattr("app.routers.meals.MEALS_MAX_PAGE_SIZE", 3)
+        create_meals(test_db, test_user["user"], 5)
+
+        response = client.get("/meals/history", params={"limit": 100}, headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.json()) == 3
+        assert "X-Next-Cursor" in response.headers
+
+    def test_time_range_without_more_pages(self, client, auth_headers, test_db, test_user):
+        """Test that a time-bounded request returns no cursor when it fits one page."""
+        create_meals(test_db, test_user["user"], 5)
+
+        response = client.get(
+            "/meals",
+            params={"start_time": "2025-01-01T09:00:00Z", "end_time": "2025-01-01T11:00:00Z"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        assert [meal["notes"] for meal in response.json()] == ["Meal 3", "Meal 2", "Meal 1"]
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_etag_not_modified(self, client, auth_headers, test_db, test_user):
+        """Test that an unchanged history is answered with 304 until a meal is saved."""
+        create_meals(test_db, test_user["user"], 2)
+
+        response = client.get("/meals", headers=auth_headers)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+
+        headers = {**auth_headers, "If-None-Match": etag}
+        response = client.get("/meals", headers=headers)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+        # Other parameters are a different representation
+        response = client.get("/meals", params={"limit": 1}, headers=headers)
+        assert response.status_code == 200
+
+        payload = {"file_id": "cloud://new.jpg", "analysis": make_analysis()}
+        assert client.post("/meals", json=payload, headers=auth_headers).status_code == 200
+        response = client.get("/meals", headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) == 3
+        assert response.headers["ETag"] != etag
+
+    def test_invalid_cursor(self, client, auth_headers):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/meals", params={"cursor": "garbage"}, headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_fields_projection(self, client, auth_headers, test_db, test_user):
+        """Test that ?fields= returns only the selected fields, plus the page key."""
+        create_meals(test_db, test_user["user"], 2)
+
+        response = client.get("/meals", params={"fields": "total_gl,image_url"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert [set(meal) for meal in response.json()] == [
+            {"id", "meal_time", "total_gl", "image_url"}
+        ] * 2
+
+        response = client.get("/meals", params={"fields": "notes,ingredients"}, headers=auth_headers)
+        assert [len(meal["ingredients"]) for meal in response.json()] == [2, 2]
+
+        response = client.get("/meals/history", params={"fields": "calories"}, headers=auth_headers)
+        assert response.status_code == 400
+
+
+class TestHistoryFields:
+    def test_parse_fields(self):
+        """Test that selected fields always include the page key."""
+        assert parse_fields(None) is None
+        assert parse_fields(" total_gl, ,image_url") == {"id", "meal_time", "total_gl", "image_url"}
+        with pytest.raises(ValueError):
+            parse_fields("total_gl,password")
+
+    def test_only_selected_columns_are_read(self):
+        """Test that Text columns are left out of the query unless selected."""
+        keys = [column.key for column in history_columns(parse_fields("total_gl,meal_gl_category"))]
+        assert keys == ["id", "meal_time", "total_gl", "meal_gl_category"]
+        assert len(history_columns(None)) > len(keys)
+
+    def test_serialize_selected_fields(self):
+        """Test that a row of the selected columns serializes without the others."""
+        row = SimpleNamespace(id=1, meal_time=datetime(2025, 1, 1, 8, 0), total_gl=12.34)
+        assert serialize_record(row, parse_fields("total_gl")) == {
+            "id": 1,
+            "meal_time": "2025-01-01T08:00:00",
+            "total_gl": 12.3,
+        }
+
+
+class TestSameIngredients:
+    def test_float_precision_is_ignored(self):
+        """Test that single precision round trips still compare equal."""
+        stored = [Ingredient(**make_analysis()["ingredients"][0])]
+        stored[0].carbs_per_100g = 25.899999618530273
+        assert same_ingredients(stored, make_analysis()["ingredients"][:1])
+
+    def test_changes_are_detected(self):
+        """Test that changed, added and reordered ingredients compare unequal."""
+        ingredients = make_analysis()["ingredients"]
+        stored = [Ingredient(**ingredient) for ingredient in ingredients]
+        assert same_ingredients(stored, ingredients)
+        assert not same_ingredients(stored, ingredients[:1])
+        assert not same_ingredients(stored, list(reversed(ingredients)))
+        assert not same_ingredients(stored, [dict(ingredients[0], portion=150.0), ingredients[1]])
+
+
+def save_concurrently(test_db: Session, user: User, saves, table: str):
+    """
+    Run each (file_id, analysis) save in its own transaction, in parallel.
+
+    Every transaction waits before its first INSERT into `table` until all of
+    them have reached it, so they hold their earlier locks at the same time.
+    Returns the record ids.
+    """
+    barrier = threading.Barrier(len(saves), timeout=10)
+
+    def save(file_id, analysis):
+        db = Session(bind=test_db.get_bind())
+        waited = []
+
+        @event.listens_for(db, "do_orm_execute")
+        def wait_for_others(state):
+            if state.is_insert and state.statement.table.name == table and not waited:
+                waited.append(True)
+                barrier.wait()
+
+        try:
+            service = MealService(db)
+            return service.commit_with_retry(lambda: service.save_meal(user, file_id, analysis))
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=len(saves)) as executor:
+        futures = [executor.submit(save, file_id, analysis) for file_id, analysis in saves]
+        return [future.result(timeout=30) for future in futures]
+
+
+class FakeSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+        self.isolation_levels = []
+
+    def in_transaction(self):
+        return False
+
+    def connection(self, execution_options):
+        self.isolation_levels.append(execution_options["isolation_level"])
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class TestCommitWithRetry:
+    def failing_write(self, *codes):
+        """A write that fails with the given MySQL error codes, then returns "done"."""
+        errors = [OperationalError("INSERT", {}, Exception(code, "error")) for code in codes]
+
+        def write():
+            if errors:
+                raise errors.pop(0)
+            return "done"
+
+        return write
+
+    def test_deadlock_is_retried(self):
+        """Test that a write rolled back by a deadlock is run again."""
+        db = FakeSession()
+        assert MealService(db).commit_with_retry(self.failing_write(1213, 1213)) == "done"
+        assert (db.rollbacks, db.commits) == (2, 1)
+        # Every attempt is a READ COMMITTED transaction
+        assert db.isolation_levels == ["READ COMMITTED"] * 3
+
+    def test_retries_are_bounded(self, monkeypatch):
+        """Test that the last deadlock is raised once the attempts are used up."""
+        monkeypatch.setattr("app.services.meal_service.DEADLOCK_RETRIES", 2)
+        db = FakeSession()
+        with pytest.raises(OperationalError):
+            MealService(db).commit_with_retry(self.failing_write(1213, 1213))
+        assert (db.rollbacks, db.commits) == (2, 0)
+
+    def test_other_errors_are_raised(self):
+        """Test that errors other than deadlocks are not retried."""
+        db = FakeSession()
+        with pytest.raises(OperationalError):
+            MealService(db).commit_with_retry(self.failing_write(2013))
+        assert (db.rollbacks, db.commits) == (1, 0)
+
+
+class TestSaveMeal:
+    def test_retry_updates_same_record(self, client, auth_headers, test_db, test_user):
+        """Test that saving the same file twice keeps one record and its ingredients."""
+        payload = {"file_id": "cloud://lunch.jpg", "analysis": make_analysis()}
+        first = client.post("/meals", json=payload, headers=auth_headers)
+        assert first.status_code == 200
+        ingredient_ids = [i.id for i in test_db.query(Ingredient).order_by(Ingredient.id)]
+
+        payload = {"file_id": "cloud://lunch.jpg", "analysis": make_analysis(notes="Late lunch")}
+        second = client.post("/meals", json=payload, headers=auth_headers)
+        assert second.status_code == 200
+        assert second.json()["id"] == first.json()["id"]
+
+        test_db.expire_all()
+        records = test_db.query(NutritionRecord).all()
+        assert len(records) == 1
+        assert records[0].notes == "Late lunch"
+        # Unchanged ingredients are not rewritten
+        assert [i.id for i in test_db.query(Ingredient).order_by(Ingredient.id)] == ingredient_ids
+
+    def test_changed_ingredients_are_replaced(self, client, auth_headers, test_db, test_user):
+        """Test that a save with different ingredients replaces the stored ones."""
+        payload = {"file_id": "cloud://dinner.jpg", "analysis": make_analysis()}
+        record_id = client.post("/meals", json=payload, headers=auth_headers).json()["id"]
+
+        ingredients = make_analysis()["ingredients"][:1]
+        ingredients[0]["portion"] = 150.0
+        payload = {"file_id": "cloud://dinner.jpg", "analysis": make_analysis(ingredients=ingredients)}
+        response = client.post("/meals", json=payload, headers=auth_headers)
+        assert response.status_code == 200
+
+        test_db.expire_all()
+        stored = test_db.query(Ingredient).filter(Ingredient.nutrition_record_id == record_id).all()
+        assert [(i.name, i.portion) for i in stored] == [("米饭", 150.0)]
+
+    def test_concurrent_first_saves(self, test_db, test_user):
+        """Test that two transactions creating the same meal at once converge on one record."""
+        analysis = make_analysis(meal_time=datetime(2025, 1, 1, 8, 0))
+        saves = [("cloud://lunch.jpg", analysis), ("cloud://lunch.jpg", dict(analysis))]
+        first, second = save_concurrently(test_db, test_user["user"], saves, "nutrition_records")
+        assert first == second
+
+        test_db.expire_all()
+        assert test_db.query(NutritionRecord).count() == 1
+        assert test_db.query(Ingredient).count() == 2
+        assert [rollup.meal_count for rollup in test_db.query(MealDailyRollup)] == [1]
+
+    def test_files_are_separate_meals(self, client, auth_headers, test_db, test_user):
+        """Test that different file ids create different records."""
+        for file_id in ("cloud://a.jpg", "cloud://b.jpg"):
+            payload = {"file_id": file_id, "analysis": make_analysis()}
+            assert client.post("/meals", json=payload, headers=auth_headers).status_code == 200
+
+        assert test_db.query(NutritionRecord).count() == 2
+        assert test_db.query(Ingredient).count() == 4
+
+
+def rollup(day: date, meal_count: int = 1, carbs: float = 10.0):
+    return SimpleNamespace(
+        local_date=day,
+        meal_count=meal_count,
+        total_carbs=carbs,
+        total_protein=1.0,
+        total_fat=1.0,
+        total_gl=2.0,
+    )
+
+
+class TestRollupDays:
+    def test_local_date_uses_rollup_timezone(self):
+        """Test that a late UTC evening meal belongs to the next Shanghai day."""
+        assert local_date(datetime(2025, 1, 1, 15, 30)) == date(2025, 1, 1)
+        assert local_date(datetime(2025, 1, 1, 16, 30)) == date(2025, 1, 2)
+        assert local_date(datetime(2025, 1, 1, 16, 30, tzinfo=timezone.utc)) == date(2025, 1, 2)
+
+    def test_day_bounds(self):
+        """Test that a local day maps to the UTC range starting at local midnight."""
+        start, end = day_bounds(date(2025, 1, 2))
+        assert start == datetime(2025, 1, 1, 16, 0, tzinfo=timezone.utc)
+        assert end == datetime(2025, 1, 2, 16, 0, tzinfo=timezone.utc)
+
+
+class TestSummarize:
+    def test_day(self):
+        """Test that daily granularity returns one period per rollup."""
+        periods = summarize([rollup(date(2025, 1, 6)), rollup(date(2025, 1, 7), 2, 20.0)], "day")
+        assert [(p["period"], p["meal_count"], p["total_carbs"]) for p in periods] == [
+            ("2025-01-06", 1, 10.0),
+            ("2025-01-07", 2, 20.0),
+        ]
+
+    def test_week_starts_on_monday(self):
+        """Test that weekly periods sum Monday to Sunday."""
+        days = [date(2025, 1, 5), date(2025, 1, 6), date(2025, 1, 12), date(2025, 1, 13)]
+        periods = summarize([rollup(day) for day in days], "week")
+        assert [(p["period"], p["days"], p["total_carbs"]) for p in periods] == [
+            ("2024-12-30", 1, 10.0),
+            ("2025-01-06", 2, 20.0),
+            ("2025-01-13", 1, 10.0),
+        ]
+
+    def test_month(self):
+        """Test that monthly periods start on the first day of the month."""
+        days = [date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 28)]
+        periods = summarize([rollup(day) for day in days], "month")
+        assert [(p["period"], p["meal_count"]) for p in periods] == [("2025-01-01", 1), ("2025-02-01", 2)]
+
+
+class TestRollupMaintenance:
+    def save(self, client, auth_headers, file_id, **overrides):
+        response = client.post(
+            "/meals",
+            json={"file_id": file_id, "analysis": make_analysis(**overrides)},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def rollups(self, test_db: Session):
+        test_db.expire_all()
+        return {
+            row.local_date: (row.meal_count, round(row.total_carbs, 1))
+            for row in test_db.query(MealDailyRollup).order_by(MealDailyRollup.local_date)
+        }
+
+    def test_save_updates_rollup(self, client, auth_headers, test_db, test_user):
+        """Test that saved meals are summed into the rollup of their local day."""
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-01T01:00:00", total_carbs=30.0)
+        self.save(client, auth_headers, "cloud://b.jpg", meal_time="2025-01-01T04:00:00", total_carbs=12.5)
+        assert self.rollups(test_db) == {date(2025, 1, 1): (2, 42.5)}
+
+        # Re-saving a meal replaces its contribution instead of adding to it
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-01T01:00:00", total_carbs=20.0)
+        assert self.rollups(test_db) == {date(2025, 1, 1): (2, 32.5)}
+
+    def test_moving_meal_updates_both_days(self, client, auth_headers, test_db, test_user):
+        """Test that changing a meal's time moves it between daily rollups."""
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-01T01:00:00")
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-03T01:00:00")
+        assert self.rollups(test_db) == {date(2025, 1, 3): (1, 26.5)}
+
+    def test_concurrent_saves_of_one_day(self, test_db, test_user):
+        """Test that concurrent saves of different meals on one day both count in its rollup."""
+        saves = [
+            ("cloud://a.jpg", make_analysis(meal_time=datetime(2025, 1, 1, 1, 0), total_carbs=30.0)),
+            ("cloud://b.jpg", make_analysis(meal_time=datetime(2025, 1, 1, 2, 0), total_carbs=12.5)),
+        ]
+        save_concurrently(test_db, test_user["user"], saves, "meal_daily_rollups")
+        assert self.rollups(test_db) == {date(2025, 1, 1): (2, 42.5)}
+
+    def test_save_without_analysis_keeps_rollup(self, client, auth_headers, test_db, test_user):
+        """Test that re-saving a meal without analysis recomputes its day with the meal in it."""
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-01T01:00:00", total_carbs=30.0)
+        response = client.post("/meals", json={"file_id": "cloud://a.jpg"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert self.rollups(test_db) == {date(2025, 1, 1): (1, 30.0)}
+
+    def test_delete_updates_rollup(self, client, auth_headers, test_db, test_user):
+        """Test that deleting a meal removes it from its day's rollup."""
+        first = self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-01T01:00:00")
+        second = self.save(client, auth_headers, "cloud://b.jpg", meal_time="2025-01-01T02:00:00")
+
+        assert client.delete(f"/meals/{first}", headers=auth_headers).status_code == 200
+        assert self.rollups(test_db) == {date(2025, 1, 1): (1, 26.5)}
+
+        assert client.delete(f"/meals/{second}", headers=auth_headers).status_code == 200
+        assert self.rollups(test_db) == {}
+        assert test_db.query(NutritionRecord).count() == 0
+
+    def test_delete_unknown_meal(self, client, auth_headers):
+        """Test that deleting a meal the user does not own returns 404."""
+        response = client.delete("/meals/12345", headers=auth_headers)
+        assert response.status_code == 404
+
+    def test_summary(self, client, auth_headers, test_db, test_user):
+        """Test that the summary endpoint groups rollups by the requested period."""
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-06T01:00:00")
+        self.save(client, auth_headers, "cloud://b.jpg", meal_time="2025-01-08T01:00:00")
+        self.save(client, auth_headers, "cloud://c.jpg", meal_time="2025-01-14T01:00:00")
+
+        response = client.get(
+            "/meals/summary",
+            params={"granularity": "week", "from": "2025-01-01", "to": "2025-01-31"},
+            headers=auth_headers,
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["from"] == "2025-01-01"
+        assert [(p["period"], p["meal_count"]) for p in data["periods"]] == [
+            ("2025-01-06", 2),
+            ("2025-01-13", 1),
+        ]
+
+    def test_summary_rejects_inverted_range(self, client, auth_headers):
+        """Test that a range ending before it starts is rejected."""
+        response = client.get(
+            "/meals/summary", params={"from": "2025-02-01", "to": "2025-01-01"}, headers=auth_headers
+        )
+        assert response.status_code == 400
+
+    def test_backfill_rebuilds_rollups(self, client, auth_headers, test_db, test_user, monkeypatch):
+        """Test that the backfill recreates rollups from the stored meals."""
+        self.save(client, auth_headers, "cloud://a.jpg", meal_time="2025-01-01T01:00:00")
+        self.save(client, auth_headers, "cloud://b.jpg", meal_time="2025-01-02T01:00:00")
+        expected = self.rollups(test_db)
+        test_db.query(MealDailyRollup).delete()
+        test_db.commit()
+
+        monkeypatch.setattr("app.backfill_rollups.SessionLocal", lambda: Session(bind=test_db.get_bind()))
+        assert backfill() == 2
+        assert self.rollups(test_db) == expected
+
+
+class TestMealExport:
+    def test_ndjson(self, client, auth_headers, test_db, test_user, monkeypatch):
+        """Test that every meal is exported once, oldest first, with its ingredients."""
+        monkeypatch.setattr("app.services.export_service.EXPORT_CHUNK_SIZE", 2)
+        create_meals(test_db, test_user["user"], 5)
+
+        response = client.get("/meals/export", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        meals = [json.loads(line) for line in response.text.splitlines()]
+        assert [meal["notes"] for meal in meals] == [f"Meal {i}" for i in range(5)]
+        assert [i["name"] for i in meals[0]["ingredients"]] == ["米饭", "鸡蛋"]
+
+    def test_csv(self, client, auth_headers, test_db, test_user):
+        """Test that the CSV export has a header and one row per meal."""
+        create_meals(test_db, test_user["user"], 3)
+
+        response = client.get("/meals/export", params={"format": "csv"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert "attachment" in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["notes"] for row in rows] == ["Meal 0", "Meal 1", "Meal 2"]
+        assert len(json.loads(rows[0]["ingredients"])) == 2
+
+    def test_unknown_format(self, client, auth_headers):
+        """Test that unsupported formats are rejected."""
+        response = client.get("/meals/export", params={"format": "xml"}, headers=auth_headers)
+        assert response.status_code == 422
+
+
+class TestParseMealPayload:
+    def test_valid(self):
+        """Test that a valid meal returns its file id and parsed analysis."""
+        file_id, analysis = parse_meal_payload({"file_id": "cloud://a.jpg", "analysis": make_analysis()})
+        assert file_id == "cloud://a.jpg"
+        assert analysis["meal_time"] == datetime(2025, 1, 1, 8, 0)
+
+    def test_without_analysis(self):
+        """Test that a meal may be saved without an analysis."""
+        assert parse_meal_payload({"file_id": "cloud://a.jpg"}) == ("cloud://a.jpg", None)
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            "cloud://a.jpg",
+            {"analysis": {}},
+            {"file_id": "cloud://a.jpg", "analysis": []},
+            {"file_id": "cloud://a.jpg", "analysis": {"meal_time": "yesterday"}},
+            {"file_id": "cloud://a.jpg", "analysis": {"ingredients": [{"portion": 1}]}},
+        ],
+    )
+    def test_invalid(self, payload):
+        """Test that malformed meals raise ValueError."""
+        with pytest.raises(ValueError):
+            parse_meal_payload(payload)
+
+    def test_malformed_numeric_field(self):
+        """Test that an analysis is validated against the Meal model."""
+        analysis = make_analysis()
+        analysis["ingredients"][0]["portion"] = "a bowl"
+        with pytest.raises(ValueError, match="ingredients.0.portion"):
+            parse_meal_payload({"file_id": "cloud://a.jpg", "analysis": analysis})
+
+
+class TestSaveMealBatch:
+    def test_saves_valid_meals(self, client, auth_headers, test_db, test_user):
+        """Test that valid meals are saved and invalid ones reported per item."""
+        meals = [
+            {"file_id": "cloud://a.jpg", "analysis": make_analysis()},
+            {"analysis": make_analysis()},
+            {"file_id": "cloud://b.jpg", "analysis": make_analysis(meal_time="2025-01-02T08:00:00")},
+        ]
+        response = client.post("/meals/batch", json={"meals": meals}, headers=auth_headers)
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["status"] for result in results] == ["saved", "invalid", "saved"]
+        assert "id" not in results[1]
+
+        test_db.expire_all()
+        assert test_db.query(NutritionRecord).count() == 2
+        assert test_db.query(Ingredient).count() == 4
+        assert {row.local_date for row in test_db.query(MealDailyRollup)} == {
+            date(2025, 1, 1),
+            date(2025, 1, 2),
+        }
+
+    def test_resync_is_idempotent(self, client, auth_headers, test_db, test_user):
+        """Test that sending the same batch again updates the same records."""
+        single = client.post(
+            "/meals", json={"file_id": "cloud://a.jpg", "analysis": make_analysis()}, headers=auth_headers
+        ).json()["id"]
+        meals = [
+            {"file_id": "cloud://a.jpg", "analysis": make_analysis(notes="Synced")},
+            {"file_id": "cloud://b.jpg", "analysis": make_analysis()},
+        ]
+        first = client.post("/meals/batch", json={"meals": meals}, headers=auth_headers).json()["results"]
+        second = client.post("/meals/batch", json={"meals": meals}, headers=auth_headers).json()["results"]
+        assert first[0]["id"] == single
+        assert [result["id"] for result in first] == [result["id"] for result in second]
+
+        test_db.expire_all()
+        assert test_db.query(NutritionRecord).count() == 2
+        assert test_db.query(Ingredient).count() == 4
+        assert test_db.query(NutritionRecord).get(single).notes == "Synced"
+
+    def test_rejects_oversized_batch(self, client, auth_headers, monkeypatch):
+        """Test that batches above the maximum size are rejected."""
+        monkeypatch.setattr("app.routers.meals.MEALS_BATCH_MAX_SIZE", 2)
+        meals = [{"file_id": f"cloud://{i}.jpg"} for i in range(3)]
+        response = client.post("/meals/batch", json={"meals": meals}, headers=auth_headers)
+        assert response.status_code == 400
+
+
+class TestMealChanges:
+    def make_stale(self, test_db: Session, records, minutes: int = 10):
+        """Move the records' updated_at outside the safety window, keeping their order."""
+        base = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0) - timedelta(minutes=minutes)
+        for i, record in enumerate(records):
+            test_db.query(NutritionRecord).filter(NutritionRecord.id == record.id).update(
+                {"updated_at": base + timedelta(seconds=i)}, synchronize_session=False
+            )
+        test_db.commit()
+
+    def test_full_sync_pages(self, client, auth_headers, test_db, test_user):
+        """Test that an initial sync returns every meal once across pages."""
+        self.make_stale(test_db, create_meals(test_db, test_user["user"], 5))
+
+        seen = []
+        since = None
+        for _ in range(5):
+            params = {"limit": 2}
+            if since:
+                params["since"] = since
+            body = client.get("/meals/changes", params=params, headers=auth_headers).json()
+            seen.extend(body["upserted"])
+            since = body["watermark"]
+            if not body["has_more"]:
+                break
+
+        assert [meal["notes"] for meal in seen] == [f"Meal {i}" for i in range(5)]
+        assert all(len(meal["ingredients"]) == 2 for meal in seen)
+
+        body = client.get("/meals/changes", params={"since": since}, headers=auth_headers).json()
+        assert body == {"upserted": [], "deleted": [], "watermark": since, "has_more": False}
+
+    def test_returns_edits_and_deletions(self, client, auth_headers, test_db, test_user):
+        """Test that meals saved or deleted after the watermark are reported."""
+        records = create_meals(test_db, test_user["user"], 3)
+        self.make_stale(test_db, records)
+        since = client.get("/meals/changes", headers=auth_headers).json()["watermark"]
+
+        payload = {"file_id": "cloud://meal_0.jpg", "analysis": make_analysis(notes="Edited")}
+        assert client.post("/meals", json=payload, headers=auth_headers).status_code == 200
+        assert client.delete(f"/meals/{records[1].id}", headers=auth_headers).status_code == 200
+
+        body = client.get("/meals/changes", params={"since": since}, headers=auth_headers).json()
+        assert [meal["notes"] for meal in body["upserted"]] == ["Edited"]
+        assert body["deleted"] == [records[1].id]
+
+    def test_deletions_are_paged(self, client, auth_headers, test_db, test_user):
+        """Test that deletions are limited per response and continue on the next sync."""
+        records = create_meals(test_db, test_user["user"], 5)
+        for record in records:
+            assert client.delete(f"/meals/{record.id}", headers=auth_headers).status_code == 200
+        # Outside the safety window, after the watermark
+        now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        test_db.query(MealTombstone).update(
+            {"deleted_at": now - timedelta(minutes=1)}, synchronize_session=False
+        )
+        test_db.commit()
+        since = encode_watermark((now - timedelta(minutes=10), 0), (now - timedelta(minutes=10), 0))
+
+        deleted = []
+        for _ in range(5):
+            body = client.get("/meals/changes", params={"since": since, "limit": 2}, headers=auth_headers).json()
+            assert len(body["deleted"]) <= 2
+            deleted.extend(body["deleted"])
+            since = body["watermark"]
+            if not body["has_more"]:
+                break
+        assert sorted(deleted) == sorted(record.id for record in records)
+
+    def test_invalid_watermark(self, client, auth_headers):
+        """Test that a malformed watermark is rejected."""
+        response = client.get("/meals/changes", params={"since": "garbage"}, headers=auth_headers)
+        assert response.status_code == 400
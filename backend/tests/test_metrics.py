@@ -0,0 +1,49 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestMetrics:
+    def test_counters_and_timings(self):
+        """Test that counters add up and timings track count, sum and max."""
+        metrics.increment("requests")
+        metrics.increment("requests", 2)
+        metrics.observe("latency", 0.5)
+        metrics.observe("latency", 1.5)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["counters"]["requests"] == 3
+        assert snapshot["timings"]["latency"] == {"count": 2, "sum": 2.0, "max": 1.5}
+
+    def test_gauges_read_at_snapshot_time(self):
+        """Test that gauges reflect the value when the snapshot is taken."""
+        state = {"in_use": 1}
+        metrics.register_gauges("test_pool", lambda: dict(state))
+
+        assert metrics.snapshot()["gauges"]["test_pool"] == {"in_use": 1}
+        state["in_use"] = 4
+        assert metrics.snapshot()["gauges"]["test_pool"] == {"in_use": 4}
+
+    def test_failing_gauge_is_skipped(self):
+        """Test that a broken gauge callback does not break the snapshot."""
+        metrics.register_gauges("broken", lambda: 1 / 0)
+        metrics.increment("requests")
+
+        snapshot = metrics.snapshot()
+        assert "broken" not in snapshot["gauges"]
+        assert snapshot["counters"]["requests"] == 1
+
+
+class TestMetricsEndpoint:
+    def test_not_served_on_the_api_by_default(self):
+        """Test that internal metrics are not exposed on the public API port."""
+        assert TestClient(app).get("/metrics").status_code == 404
@@ -42,7 +42,7 @@ class TestMigrations:
 
         # Check if all expected tables exist
         tables = inspector.get_table_names()
-        expected_tables = {"users", "weixin_users", "nutrition_records", "ingredients", "tasks"}
+        expected_tables = {"users", "weixin_users", "nutrition_records", "ingredients", "tasks", "meal_daily_rollups", "meal_tombstones"}
         assert expected_tables.issubset(set(tables)), f"Missing tables. Found: {tables}"
 
         # Check users table columns
@@ -54,6 +54,7 @@ class TestMigrations:
             "is_active",
             "activation_token",
             "full_name",
+            "meals_version",
             "created_at",
             "updated_at"
         }
@@ -66,6 +67,7 @@ class TestMigrations:
             "openid",
             "nickname",
             "avatar_url",
+            "meals_version",
             "created_at",
             "updated_at"
         }
@@ -129,7 +131,11 @@ class TestMigrations:
             "error",
             "created_at",
             "updated_at",
-            "params"
+            "params",
+            "lease_owner",
+            "lease_expires_at",
+            "attempts",
+            "image_digest"
         }
         assert expected_task_columns.issubset(task_columns), f"Missing task columns. Found: {task_columns}"
 
@@ -0,0 +1,161 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+from app.dependencies import get_current_user
+from app.models.user_models import User, WeixinUser, WeixinUserCreate
+from app.routers.weixin_auth import update_weixin_profile
+from app.utils import auth, metrics, query_stats
+from app.utils.principal_cache import PrincipalCache, principal_cache, user_subject
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch):
+    monkeypatch.setattr(auth, "SECRET_KEY", "test_secret_key_123")
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    query_stats.instrument(engine)
+    User.__table__.create(engine)
+    WeixinUser.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(WeixinUser(id=1, openid="openid-1", nickname="Before"))
+    session.add(User(id=1, email="a@example.com", hashed_password="x", full_name="A"))
+    session.commit()
+    session.close()
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def resolve(session_factory, token: str):
+    """Run get_current_user in a fresh session, returning the user and the statement count."""
+    db = session_factory()
+    stats, stats_token = query_stats.start_request()
+    try:
+        user = get_current_user(token, db)
+        return user, stats.count, db
+    finally:
+        query_stats.end_request(stats_token)
+
+
+class TestTokenCache:
+    def test_verified_token_is_not_decoded_again(self, monkeypatch):
+        """Test that a verified token is answered from the cache."""
+        token = auth.create_access_token({"sub": "weixin:openid-1"})
+        assert auth.decode_access_token(token) == "weixin:openid-1"
+
+        def fail(*args, **kwargs):
+            raise AssertionError("token verified again")
+
+        monkeypatch.setattr(auth.jwt, "decode", fail)
+        assert auth.decode_access_token(token) == "weixin:openid-1"
+
+    def test_entries_expire_with_the_token(self):
+        """Test that a cached token is dropped once its exp has passed."""
+        token = auth.create_access_token({"sub": "1"}, expires_delta=timedelta(seconds=60))
+        assert auth.decode_access_token(token) == "1"
+        key, (expires_at, subject) = next(iter(auth._verified_tokens.items()))
+        auth._verified_tokens[key] = (0, subject)
+
+        # The token itself has not expired, so it is verified and cached again
+        assert auth.decode_access_token(token) == "1"
+        assert auth._verified_tokens[key][0] == expires_at
+
+    def test_invalid_tokens_are_not_cached(self):
+        """Test that tokens failing verification are rejected every time."""
+        token = auth.create_access_token({"sub": "1"})
+        forged = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+        assert auth.decode_access_token(forged) is None
+        assert auth.decode_access_token(forged) is None
+        assert len(auth._verified_tokens) == 0
+
+    def test_cache_is_bounded(self, monkeypatch):
+        """Test that the least recently used tokens are evicted."""
+        monkeypatch.setattr(auth, "TOKEN_CACHE_MAX_ENTRIES", 2)
+        for user_id in range(3):
+            auth.decode_access_token(auth.create_access_token({"sub": str(user_id)}))
+        assert sorted(subject for _, subject in auth._verified_tokens.values()) == ["1", "2"]
+
+
+class TestPrincipalCache:
+    def test_cached_principal_needs_no_query(self, session_factory):
+        """Test that a repeated request resolves its user without a statement."""
+        token = auth.create_access_token({"sub": "weixin:openid-1"})
+        user, count, db = resolve(session_factory, token)
+        assert count == 1
+        db.close()
+
+        user, count, db = resolve(session_factory, token)
+        assert count == 0
+        assert isinstance(user, WeixinUser)
+        assert (user.id, user.openid, user.nickname) == (1, "openid-1", "Before")
+        # Bound to the request's session, like a queried user
+        assert inspect(user).session is db
+        assert db.info["writer"] == "WeixinUser:1"
+        db.close()
+
+        counters = metrics.snapshot()["counters"]
+        assert counters["principal_cache_hits"] == 1
+        assert counters["principal_cache_misses"] == 1
+
+    def test_requests_get_separate_copies(self, session_factory):
+        """Test that a change made by one request does not leak into the cache."""
+        token = auth.create_access_token({"sub": "1"})
+        user, _, db = resolve(session_factory, token)
+        user.full_name = "Changed"
+        db.close()
+
+        user, count, db = resolve(session_factory, token)
+        assert count == 0
+        assert user.full_name == "A"
+        db.close()
+
+    def test_unknown_user_is_rejected(self, session_factory):
+        """Test that subjects without a user are not cached."""
+        token = auth.create_access_token({"sub": "weixin:missing"})
+        for _ in range(2):
+            with pytest.raises(HTTPException) as error:
+                resolve(session_factory, token)
+            assert error.value.status_code == 401
+        assert len(principal_cache) == 0
+
+    def test_profile_update_invalidates(self, session_factory):
+        """Test that updating a WeChat profile drops the cached user."""
+        token = auth.create_access_token({"sub": "weixin:openid-1"})
+        resolve(session_factory, token)[2].close()
+
+        db = session_factory()
+        update_weixin_profile(WeixinUserCreate(openid="openid-1", nickname="After"), db)
+        db.close()
+
+        user, count, db = resolve(session_factory, token)
+        assert count == 1
+        assert user.nickname == "After"
+        db.close()
+
+    def test_ttl_and_size_bound(self, monkeypatch):
+        """Test that entries expire after the TTL and the cache stays bounded."""
+        cache = PrincipalCache(max_entries=2, ttl=60)
+        users = [User(id=user_id) for user_id in range(3)]
+        for user in users:
+            cache.set(user_subject(user), user)
+        assert len(cache) == 2
+        assert cache.get("0") is None
+        assert cache.get("2") is users[2]
+
+        monkeypatch.setattr("app.utils.principal_cache.time.monotonic", lambda: float("inf"))
+        assert cache.get("2") is None
+
+    def test_user_subject_matches_token_subject(self):
+        """Test that invalidation uses the subject the tokens carry."""
+        assert user_subject(WeixinUser(id=1, openid="openid-1")) == "weixin:openid-1"
+        assert user_subject(User(id=7)) == "7"
+        assert principal_cache.get("7") is None
@@ -0,0 +1,126 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models.nutrition_models import NutritionRecord
+from app.models.task_models import Task, TaskStatus
+from app.models.user_models import User
+from app.routers.meals import HISTORY_RECORD_COLUMNS, _after_cursor
+from app.utils.background_tasks import _claimable
+
+# test_db fixture is imported from conftest.py automatically
+
+
+def explain(db: Session, query) -> list:
+    """Return the EXPLAIN rows MySQL produces for an ORM query."""
+    compiled = query.statement.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True}
+    )
+    result = db.connection().exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+    return [dict(row) for row in result.mappings()]
+
+
+@pytest.fixture
+def populated_db(test_db: Session):
+    """Create enough meals and tasks for the optimizer to prefer indexes."""
+    users = [
+        User(email=f"plans{i}@example.com", hashed_password="x", full_name=f"Plans {i}")
+        for i in range(4)
+    ]
+    test_db.add_all(users)
+    test_db.commit()
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for user in users:
+        test_db.add_all(
+            NutritionRecord(
+                user_id=user.id,
+                image_url=f"cloud://{user.id}/meal_{i}.jpg",
+                meal_time=start + timedelta(hours=i),
+            )
+            for i in range(50)
+        )
+        test_db.add_all(
+            Task(
+                user_id=user.id,
+                task_type="process_image",
+                status=TaskStatus.COMPLETED,
+                created_at=start + timedelta(minutes=i),
+            )
+            for i in range(50)
+        )
+    test_db.add_all(
+        Task(user_id=users[0].id, task_type="process_image", status=TaskStatus.PENDING)
+        for _ in range(3)
+    )
+    test_db.commit()
+    test_db.execute(text("ANALYZE TABLE nutrition_records, tasks"))
+    return {"db": test_db, "user": users[0]}
+
+
+class TestQueryPlans:
+    """Guard the hot queries against regressing into full table scans."""
+
+    def test_meal_history_uses_owner_time_index(self, populated_db):
+        """Test that a history page reads the (owner, meal_time, id) index."""
+        db, user = populated_db["db"], populated_db["user"]
+        query = (
+            db.query(*HISTORY_RECORD_COLUMNS)
+            .filter(NutritionRecord.user_id == user.id)
+            .order_by(NutritionRecord.meal_time.desc(), NutritionRecord.id.desc())
+            .limit(20)
+        )
+        plan = explain(db, query)[0]
+        assert plan["type"] != "ALL"
+        assert plan["key"] == "ix_nutrition_records_user_meal_time"
+        assert "filesort" not in (plan["Extra"] or "")
+
+    def test_meal_history_next_page_uses_owner_time_index(self, populated_db):
+        """Test that a page after a cursor still reads the history index."""
+        db, user = populated_db["db"], populated_db["user"]
+        query = (
+            db.query(*HISTORY_RECORD_COLUMNS)
+            .filter(
+                NutritionRecord.user_id == user.id,
+                _after_cursor(datetime(2025, 1, 2, tzinfo=timezone.utc), 10),
+            )
+            .order_by(NutritionRecord.meal_time.desc(), NutritionRecord.id.desc())
+            .limit(20)
+        )
+        plan = explain(db, query)[0]
+        assert plan["type"] != "ALL"
+        assert plan["key"] == "ix_nutrition_records_user_meal_time"
+
+    def test_save_meal_lookup_uses_owner_image_index(self, populated_db):
+        """Test that the save_meal lookup by owner and image is an index lookup."""
+        db, user = populated_db["db"], populated_db["user"]
+        query = db.query(NutritionRecord).filter(
+            NutritionRecord.user_id == user.id,
+            NutritionRecord.image_url == f"cloud://{user.id}/meal_7.jpg",
+        )
+        plan = explain(db, query)[0]
+        assert plan["type"] == "ref"
+        assert plan["key"] == "ix_nutrition_records_user_image_url"
+
+    def test_claim_uses_status_index(self, populated_db):
+        """Test that claiming tasks does not scan every task."""
+        db = populated_db["db"]
+        query = (
+            db.query(Task.id)
+            .filter(_claimable(datetime.now(timezone.utc)))
+            .order_by(Task.created_at)
+            .limit(10)
+        )
+        plan = explain(db, query)[0]
+        assert plan["type"] != "ALL"
+        assert plan["key"].startswith("ix_tasks_status_")
+
+    def test_task_status_lookup_uses_primary_key(self, populated_db):
+        """Test that the status endpoint's (id, owner) lookup reads the primary key."""
+        db, user = populated_db["db"], populated_db["user"]
+        task_id = db.query(Task.id).filter(Task.user_id == user.id).first().id
+        query = db.query(Task).filter(Task.id == task_id, Task.user_id == user.id)
+        plan = explain(db, query)[0]
+        assert plan["type"] == "const"
+        assert plan["key"] == "PRIMARY"
@@ -0,0 +1,169 @@
+import contextvars
+import logging
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.dependencies import get_current_user, get_db, get_read_db
+from app import main
+from app.main import app
+from app.models.nutrition_models import Ingredient, MealDailyRollup, NutritionRecord
+from app.models.user_models import User
+from app.utils import metrics, query_stats
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    query_stats.instrument(engine)
+    yield engine
+    engine.dispose()
+
+
+def run_queries(engine, count: int, ids=(1,)):
+    with engine.connect() as connection:
+        for _ in range(count):
+            connection.execute(
+                text("SELECT 1 WHERE 1 IN :ids").bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(ids)},
+            )
+
+
+class TestStatementShape:
+    def test_in_lists_compare_equal(self):
+        """Test that expanded IN lists of any length have the same shape."""
+        assert query_stats.statement_shape("SELECT a FROM t WHERE id IN (%s, %s, %s)") == (
+            query_stats.statement_shape("SELECT a\n  FROM t WHERE id IN (%s)")
+        )
+        assert query_stats.statement_shape("SELECT a FROM t WHERE id = ?") == "SELECT a FROM t WHERE id = ?"
+
+
+class TestQueryStats:
+    def test_counts_statements_of_the_request(self, engine):
+        """Test that statements are counted and timed for the current request only."""
+        run_queries(engine, 1)
+        stats, token = query_stats.start_request("GET /test")
+        try:
+            run_queries(engine, 3)
+        finally:
+            query_stats.end_request(token)
+        run_queries(engine, 1)
+
+        assert stats.count == 3
+        assert stats.total_seconds >= stats.slowest_seconds > 0
+        assert "SELECT 1" in stats.slowest_statement
+        assert metrics.snapshot()["timings"]["db_statement_seconds"]["count"] == 5
+
+    def test_threads_record_into_the_request(self, engine):
+        """Test that work run in a copied context records into the same stats."""
+        stats, token = query_stats.start_request()
+        try:
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=context.run, args=(run_queries, engine, 2))
+            thread.start()
+            thread.join()
+        finally:
+            query_stats.end_request(token)
+        assert stats.count == 2
+
+    def test_repeated_statement_warning(self, engine, monkeypatch, caplog):
+        """Test that a statement shape repeated past the threshold is reported once."""
+        monkeypatch.setattr(query_stats, "REPEATED_STATEMENT_THRESHOLD", 2)
+        stats, token = query_stats.start_request("GET /meals")
+        try:
+            with caplog.at_level(logging.WARNING, logger="app.utils.query_stats"):
+                for size in range(1, 6):
+                    run_queries(engine, 1, ids=range(size))
+        finally:
+            query_stats.end_request(token)
+
+        warnings = [record for record in caplog.records if "possible N+1" in record.message]
+        assert len(warnings) == 1
+        assert "GET /meals" in warnings[0].message
+        assert metrics.snapshot()["counters"]["db_repeated_statements"] == 1
+
+    def test_slow_statement_log(self, engine, monkeypatch, caplog):
+        """Test that statements over the threshold are logged and counted."""
+        monkeypatch.setattr(query_stats, "SLOW_QUERY_SECONDS", 1e-9)
+        with caplog.at_level(logging.WARNING, logger="app.utils.query_stats"):
+            run_queries(engine, 2)
+        assert len([record for record in caplog.records if "Slow statement" in record.message]) == 2
+        assert metrics.snapshot()["counters"]["db_slow_statements"] == 2
+
+    def test_failed_statement_is_not_recorded(self, engine):
+        """Test that a failing statement does not unbalance the timing state."""
+        stats, token = query_stats.start_request()
+        try:
+            with engine.connect() as connection:
+                with pytest.raises(Exception):
+                    connection.execute(text("SELECT * FROM missing_table"))
+                connection.execute(text("SELECT 1"))
+                assert connection.info["query_started_at"] == []
+        finally:
+            query_stats.end_request(token)
+        assert stats.count == 1
+
+
+class TestQueryStatsMiddleware:
+    def test_headers_and_metrics(self, engine, monkeypatch):
+        """Test that requests report their statements as metrics and headers."""
+        MealDailyRollup.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        app.dependency_overrides[get_db] = lambda: session
+        app.dependency_overrides[get_current_user] = lambda: User(id=1)
+        monkeypatch.setattr(main, "QUERY_STATS_HEADERS", True)
+        try:
+            response = TestClient(app).get("/meals/summary")
+        finally:
+            app.dependency_overrides.clear()
+            session.close()
+
+        assert response.status_code == 200
+        assert response.headers["X-DB-Statements"] == "1"
+        assert "meal_daily_rollups" in response.headers["X-DB-Slowest-Statement"]
+        timing = metrics.snapshot()["timings"]["db_statements_per_request.get_meal_summary"]
+        assert timing == {"count": 1, "sum": 1, "max": 1}
+
+    def test_no_headers_by_default(self, engine, monkeypatch):
+        """Test that the headers are not returned unless enabled, even in debug mode."""
+        monkeypatch.setattr(app, "debug", True)
+        MealDailyRollup.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        app.dependency_overrides[get_db] = lambda: session
+        app.dependency_overrides[get_current_user] = lambda: User(id=1)
+        try:
+            response = TestClient(app).get("/meals/summary")
+        finally:
+            app.dependency_overrides.clear()
+            session.close()
+
+        assert response.status_code == 200
+        assert "X-DB-Statements" not in response.headers
+
+    def test_streamed_body_is_recorded(self, engine):
+        """Test that the statements of a streamed response are recorded after its body."""
+        NutritionRecord.__table__.create(engine)
+        Ingredient.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        app.dependency_overrides[get_read_db] = lambda: session
+        app.dependency_overrides[get_current_user] = lambda: User(id=1)
+        try:
+            response = TestClient(app).get("/meals/export")
+        finally:
+            app.dependency_overrides.clear()
+            session.close()
+
+        assert response.status_code == 200
+        timing = metrics.snapshot()["timings"]["db_statements_per_request.export_meals"]
+        assert timing["count"] == 1
+        assert timing["sum"] >= 1
@@ -234,6 +234,24 @@ class TestSubscriptionSystem:
         for action in upgrade_actions:
             assert Decimal(action["credit"]) == expected_credit, f"Expected credit {expected_credit} but got {action['credit']}"
 
+    def test_subscription_status_etag(self, client, test_user, auth_headers, db_session):
+        """Test that an unchanged subscription status is answered with 304"""
+        response = client.get("/subscriptions/status", headers=auth_headers)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+
+        headers = {**auth_headers, "If-None-Match": etag}
+        response = client.get("/subscriptions/status", headers=headers)
+        assert response.status_code == 304
+        assert response.content == b""
+
+        # A new subscription changes the status and its tag
+        SubscriptionService(db_session).create_trial_subscription(test_user.openid)
+        response = client.get("/subscriptions/status", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["plan_id"] == "trial"
+        assert response.headers["ETag"] != etag
+
     def test_subscription_upgrade_from_monthly_to_yearly(self, client, test_user, auth_headers, db_session):
         """Test upgrading from monthly to yearly subscription"""
         # Use date-aligned times to avoid partial day calculations
@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+
+from app.utils import metrics
+from app.utils.gpt_client import GPTClient
+from app.utils.vision_cache import VisionCache, make_cache_key
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestVisionCache:
+    @pytest.mark.asyncio
+    async def test_hit_after_miss(self):
+        """Test that a second identical request is served from the cache."""
+        cache = VisionCache(max_entries=10, ttl=60)
+        compute = AsyncMock(return_value="<JSON>{}</JSON>")
+
+        assert await cache.get_or_compute("key", compute) == "<JSON>{}</JSON>"
+        assert await cache.get_or_compute("key", compute) == "<JSON>{}</JSON>"
+
+        assert compute.await_count == 1
+        counters = metrics.snapshot()["counters"]
+        assert counters["vision_cache_misses"] == 1
+        assert counters["vision_cache_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_none_is_not_cached(self):
+        """Test that failed (None) responses are retried on the next request."""
+        cache = VisionCache(max_entries=10, ttl=60)
+        compute = AsyncMock(side_effect=[None, "ok"])
+
+        assert await cache.get_or_compute("key", compute) is None
+        assert await cache.get_or_compute("key", compute) == "ok"
+        assert compute.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_entries_expire(self):
+        """Test that entries older than the TTL are recomputed."""
+        cache = VisionCache(max_entries=10, ttl=0)
+        compute = AsyncMock(return_value="ok")
+
+        await cache.get_or_compute("key", compute)
+        await cache.get_or_compute("key", compute)
+        assert compute.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_is_evicted(self):
+        """Test that the cache evicts the least recently used entry when full."""
+        cache = VisionCache(max_entries=2, ttl=60)
+        await cache.get_or_compute("a", AsyncMock(return_value="a"))
+        await cache.get_or_compute("b", AsyncMock(return_value="b"))
+        # Touch "a" so that "b" becomes the oldest entry
+        await cache.get_or_compute("a", AsyncMock())
+        await cache.get_or_compute("c", AsyncMock(return_value="c"))
+
+        compute = AsyncMock(return_value="b2")
+        assert await cache.get_or_compute("b", compute) == "b2"
+        assert compute.await_count == 1
+        assert await cache.get_or_compute("a", AsyncMock()) is not None
+        assert metrics.snapshot()["counters"]["vision_cache_evictions"] >= 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_call(self):
+        """Test that identical in-flight requests are de-duplicated."""
+        cache = VisionCache(max_entries=10, ttl=60)
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"ingredients": []}
+
+        results = await asyncio.gather(
+            *(cache.get_or_compute("key", compute) for _ in range(5))
+        )
+        assert calls == 1
+        assert all(result == {"ingredients": []} for result in results)
+        # Callers get independent copies of mutable results
+        results[0]["ingredients"].append("rice")
+        assert results[1] == {"ingredients": []}
+        assert metrics.snapshot()["counters"]["vision_cache_coalesced"] == 4
+
+    @pytest.mark.asyncio
+    async def test_waiters_retry_when_leader_fails(self):
+        """Test that waiting callers compute themselves if the first call raises."""
+        cache = VisionCache(max_entries=10, ttl=60)
+        attempts = 0
+
+        async def compute():
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0.01)
+            if attempts == 1:
+                raise RuntimeError("upstream error")
+            return "ok"
+
+        results = await asyncio.gather(
+            cache.get_or_compute("key", compute),
+            cache.get_or_compute("key", compute),
+            return_exceptions=True,
+        )
+        assert isinstance(results[0], RuntimeError)
+        assert results[1] == "ok"
+
+
+class TestGPTClientCache:
+    @pytest.mark.asyncio
+    async def test_image_key_identifies_image(self):
+        """Test that requests for the same image key hit the cache despite new URLs."""
+        client = GPTClient(cache=VisionCache(max_entries=10, ttl=60))
+        client._analyze_image = AsyncMock(return_value="analysis")
+
+        await client("https://a.example/img.jpg?sign=1", "system", "user", image_key="cloud://img")
+        await client("https://a.example/img.jpg?sign=2", "system", "user", image_key="cloud://img")
+        assert client._analyze_image.await_count == 1
+
+        # A different prompt is a different request
+        await client("https://a.example/img.jpg?sign=3", "system", "other", image_key="cloud://img")
+        assert client._analyze_image.await_count == 2
+
+    def test_cache_key_depends_on_every_part(self):
+        """Test that changing any part of the request changes the key."""
+        base = make_cache_key("img", "system", "user", "model", None)
+        assert base == make_cache_key("img", "system", "user", "model", None)
+        assert base != make_cache_key("img", "system", "user", "other-model", None)
+        assert base != make_cache_key("img", "system", "user", "model", "json_object")
+        assert base != make_cache_key("imgs", "ystem", "user", "model", None)
@@ -0,0 +1,83 @@
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.storage import weixin_cloud_storage
+from app.storage.weixin_cloud_storage import (
+    WeixinCloudStorage,
+    close_shared_session,
+    get_shared_session,
+)
+
+
+async def start_api(status: int, body: dict) -> TestServer:
+    """Start a fake Weixin API answering batchdownloadfile with `body`."""
+
+    async def batch_download(request):
+        return web.json_response(body, status=status)
+
+    app = web.Application()
+    app.router.add_post("/tcb/batchdownloadfile", batch_download)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def download_url(server: TestServer) -> str:
+    storage = WeixinCloudStorage("app_id", "secret", "env")
+    storage.base_url = str(server.make_url("")).rstrip("/")
+    return await storage.get_download_url_async("cloud://env/a.jpg")
+
+
+class TestDownloadUrlAsync:
+    @pytest.mark.asyncio
+    async def test_download_url(self):
+        """Test that the download URL of the file is returned."""
+        server = await start_api(200, {"errcode": 0, "file_list": [
+            {"fileid": "cloud://env/a.jpg", "status": 0, "download_url": "https://cdn/a.jpg"}
+        ]})
+        try:
+            assert await download_url(server) == "https://cdn/a.jpg"
+        finally:
+            await close_shared_session()
+            await server.close()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "status, body",
+        [
+            (500, {}),
+            (200, {"errcode": 40001, "errmsg": "invalid credential"}),
+            (200, {"errcode": 0, "file_list": [{"status": 1, "errmsg": "file not exists"}]}),
+        ],
+    )
+    async def test_errors_raise(self, status, body):
+        """Test that HTTP, API and per-file errors are raised."""
+        server = await start_api(status, body)
+        try:
+            with pytest.raises(Exception) as excinfo:
+                await download_url(server)
+            if status != 200:
+                assert isinstance(excinfo.value, aiohttp.ClientResponseError)
+            else:
+                assert "Failed to get download URL" in str(excinfo.value)
+        finally:
+            await close_shared_session()
+            await server.close()
+
+
+class TestSharedSession:
+    @pytest.mark.asyncio
+    async def test_reused_on_same_loop(self, monkeypatch):
+        """Test that one session with a timeout is shared on an event loop."""
+        monkeypatch.setattr(weixin_cloud_storage, "WEIXIN_API_TIMEOUT", 3.0)
+        first = get_shared_session()
+        assert get_shared_session() is first
+        assert first.timeout.total == 3.0
+
+        await close_shared_session()
+        assert first.closed
+        second = get_shared_session()
+        assert second is not first
+        await close_shared_session()
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+from app import worker
+from app.utils import background_tasks
+
+
+@pytest.fixture
+def health_server():
+    """Start the worker health endpoint on a free port."""
+    server = worker.start_health_server(0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    worker._draining.clear()
+
+
+class TestWorker:
+    """Test cases for the standalone worker."""
+
+    def test_health_reports_worker_stats(self, health_server):
+        """Test that /health reports the task processor state."""
+        with urllib.request.urlopen(f"{health_server}/health") as response:
+            assert response.status == 200
+            data = json.loads(response.read())
+
+        assert data["status"] == "healthy"
+        assert data["worker_id"] == background_tasks.WORKER_ID
+        assert data["concurrency"] == background_tasks.TASK_WORKER_CONCURRENCY
+        assert data["in_flight"] == 0
+
+    def test_health_unavailable_while_draining(self, health_server):
+        """Test that a draining worker reports 503."""
+        worker._draining.set()
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            urllib.request.urlopen(f"{health_server}/health")
+
+        assert exc_info.value.code == 503
+        assert json.loads(exc_info.value.read())["status"] == "draining"
+
+    def test_enqueue_ignored_without_processor(self, monkeypatch):
+        """Test that the API does not queue tasks it will never run."""
+        loop = MagicMock()
+        monkeypatch.setattr(background_tasks, "task_processor_running", False)
+        monkeypatch.setattr(background_tasks, "_loop", loop)
+        background_tasks.enqueue_task(1)
+        assert not loop.call_soon_threadsafe.called
+
+
+class TestIdlePolling:
+    """Test cases for the scan schedule of idle task processors."""
+
+    def test_idle_backoff(self):
+        """Test that empty scans double the interval up to the maximum."""
+        intervals = [1.0]
+        for _ in range(8):
+            intervals.append(background_tasks.idle_backoff(intervals[-1], 0, 1.0, 60.0))
+        assert intervals == [1, 2, 4, 8, 16, 32, 60, 60, 60]
+        assert background_tasks.idle_backoff(60.0, 1, 1.0, 60.0) == 1.0
+        # Without a maximum, as in the API, the interval stays fixed
+        assert background_tasks.idle_backoff(30.0, 0, 30.0) == 30.0
+
+    def test_exhausted_sweep_runs_once_per_lease(self, monkeypatch):
+        """Test that scans fail exhausted tasks only once per lease interval."""
+        calls = []
+
+        def claim(limit, sweep_exhausted, exclude):
+            calls.append((limit, sweep_exhausted))
+            return []
+
+        monkeypatch.setattr(background_tasks, "_claim_pending_task_params", claim)
+        monkeypatch.setattr(background_tasks, "_next_exhausted_sweep", 0.0)
+        monkeypatch.setattr(background_tasks, "_inflight_tasks", {})
+        monkeypatch.setattr(background_tasks, "TASK_RECONCILE_BATCH_SIZE", 5)
+        for _ in range(3):
+            asyncio.run(background_tasks.reconcile_pending_tasks())
+        assert calls == [(5, True), (5, False), (5, False)]
+
+        # Without free slots only a due sweep touches the database
+        monkeypatch.setattr(background_tasks, "TASK_WORKER_CONCURRENCY", 0)
+        asyncio.run(background_tasks.reconcile_pending_tasks())
+        monkeypatch.setattr(background_tasks, "_next_exhausted_sweep", 0.0)
+        asyncio.run(background_tasks.reconcile_pending_tasks())
+        assert calls[3:] == [(0, True)]
+
+
+class TestInflightTasks:
+    """Test cases for tasks this worker is still running."""
+
+    def test_scan_excludes_inflight_tasks(self, monkeypatch):
+        """Test that a reconciliation scan does not claim tasks running here."""
+        excluded = []
+
+        def claim(limit, sweep_exhausted, exclude):
+            excluded.extend(exclude)
+            return []
+
+        monkeypatch.setattr(background_tasks, "_claim_pending_task_params", claim)
+        monkeypatch.setattr(background_tasks, "_inflight_tasks", {7: MagicMock()})
+        asyncio.run(background_tasks.reconcile_pending_tasks())
+        assert excluded == [7]
+
+    def test_dispatch_skips_inflight_task(self, monkeypatch):
+        """Test that a wake-up for a task running here does not claim it again."""
+        claim = MagicMock()
+        monkeypatch.setattr(background_tasks, "_claim_task_params", claim)
+        monkeypatch.setattr(background_tasks, "_inflight_tasks", {7: MagicMock()})
+        assert asyncio.run(background_tasks.dispatch_task(7)) is False
+        assert not claim.called
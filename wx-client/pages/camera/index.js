@@ -28,6 +28,7 @@ Page({
     taskPollingInterval: null,
     taskTimeoutTimer: null,    // Timer for task timeout
     taskProgress: 0,           // Progress percentage (0-100)
+    partialResultShown: false, // Streamed ingredients already displayed
   },
 
   updateSubscriptionStatus: function() {
@@ -540,6 +541,15 @@ Page({
           this.setData({
             taskProgress: progressPercentage
           });
+
+          // Show the ingredients as soon as they are parsed; the notes
+          // arrive with the completed result
+          if (taskStatus.result && !this.data.partialResultShown) {
+            this.setData({
+              partialResultShown: true
+            });
+            this.updateAnalysisPanel(taskStatus.result, this.data.imageFileId);
+          }
         }
       } catch (error) {
         console.error('Error checking task status:', error);
@@ -551,7 +561,8 @@ Page({
     this.setData({
       taskPollingInterval: pollingInterval,
       taskTimeoutTimer: timeoutTimer,
-      taskProgress: 0 // Reset progress when starting
+      taskProgress: 0, // Reset progress when starting
+      partialResultShown: false
     });
   },
   
@@ -724,7 +735,7 @@ Page({
       // Call API to process image asynchronously with the feedback
       const taskResponse = await api.processImageAsync(
         this.data.imageFileId,
-        null, // Only send the modified ingredients list
+        { ingredients: currentIngredients }, // Lets the server correct without the image
         feedback // Send feedback based on user edits
       );
       
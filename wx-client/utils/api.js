@@ -16,8 +16,44 @@ const getAppData = () => {
   return app ? app.globalData : null;
 };
 
+// Responses of GET requests by URL, revalidated with If-None-Match
+const etagCache = {};
+
+const getHeader = (headers, name) => {
+  const key = Object.keys(headers || {}).find(k => k.toLowerCase() === name.toLowerCase());
+  return key ? headers[key] : null;
+};
+
+// Add If-None-Match for a GET request whose response is cached
+const addConditionalHeader = (url, method, header) => {
+  if (method === 'GET' && etagCache[url]) {
+    header['If-None-Match'] = etagCache[url].etag;
+  }
+};
+
+// Settle a request, serving 304 responses from the cache.
+// With withHeader the promise resolves to { data, header } instead of the data.
+const handleResponse = (res, url, method, resolve, reject, withHeader = false) => {
+  const settle = (data, header) => resolve(withHeader ? { data, header } : data);
+  if (res.statusCode === 304 && etagCache[url]) {
+    settle(etagCache[url].data, etagCache[url].header);
+  } else if (res.statusCode >= 200 && res.statusCode < 300) {
+    const etag = getHeader(res.header, 'ETag');
+    if (method === 'GET' && etag) {
+      etagCache[url] = { etag, data: res.data, header: res.header };
+    }
+    settle(res.data, res.header);
+  } else if (res.statusCode === 401) {
+    // Token expired or invalid
+    handleUnauthorized(reject);
+  } else {
+    reject(new Error(`Request failed with status ${res.statusCode}`));
+  }
+};
+
 // Cloud container request implementation
-const cloudRequest = (url, method, data, header) => {
+const cloudRequest = (url, method, data, header, withHeader = false) => {
+  addConditionalHeader(url, method, header);
   return new Promise((resolve, reject) => {
     // Call cloud container
     wx.cloud.callContainer({
@@ -28,16 +64,7 @@ const cloudRequest = (url, method, data, header) => {
       header: header,
       method: method,
       data: data,
-      success: res => {
-        if (res.statusCode >= 200 && res.statusCode < 300) {
-          resolve(res.data);
-        } else if (res.statusCode === 401) {
-          // Token expired or invalid
-          handleUnauthorized(reject);
-        } else {
-          reject(new Error(`Request failed with status ${res.statusCode}`));
-        }
-      },
+      success: res => handleResponse(res, url, method, resolve, reject, withHeader),
       fail: err => {
         reject(err);
       }
@@ -46,23 +73,15 @@ const cloudRequest = (url, method, data, header) => {
 };
 
 // Standard request implementation (existing code)
-const standardRequest = (url, method, data, header) => {
+const standardRequest = (url, method, data, header, withHeader = false) => {
+  addConditionalHeader(url, method, header);
   return new Promise((resolve, reject) => {
     wx.request({
       url: `${url}`,
       method: method,
       data: data,
       header: header,
-      success: res => {
-        if (res.statusCode >= 200 && res.statusCode < 300) {
-          resolve(res.data);
-        } else if (res.statusCode === 401) {
-          // Token expired or invalid
-          handleUnauthorized(reject);
-        } else {
-          reject(new Error(`Request failed with status ${res.statusCode}`));
-        }
-      },
+      success: res => handleResponse(res, url, method, resolve, reject, withHeader),
       fail: err => {
         reject(err);
       }
@@ -94,7 +113,7 @@ const handleUnauthorized = (reject) => {
 };
 
 // Unified request function that chooses the appropriate implementation
-const request = (url, method, data, needToken = true) => {
+const request = (url, method, data, needToken = true, withHeader = false) => {
   const header = {};
 
   // Add authorization header if token is available and needed
@@ -112,11 +131,11 @@ const request = (url, method, data, needToken = true) => {
   if (apiConfig.baseUrl.startsWith('https://') || apiConfig.baseUrl.startsWith('http://')) {
     console.log('standardRequest');
     header['ngrok-skip-browser-warning'] = true;
-    return standardRequest(apiConfig.baseUrl + url, method, data, header);
+    return standardRequest(apiConfig.baseUrl + url, method, data, header, withHeader);
   } else {
     console.log('cloudRequest');
     header['X-WX-SERVICE'] = getAppData().serviceName;
-    return cloudRequest(url, method, data, header);
+    return cloudRequest(url, method, data, header, withHeader);
   }
 };
 
@@ -155,12 +174,32 @@ const api = {
   },
   
   // Meals
-  getMealHistory: (startTime=null, endTime=null) => {
+  // fields: optional list of fields to return, e.g. ['total_gl', 'image_url']
+  // The server returns at most one page of meals per request and the cursor
+  // of the next page in the X-Next-Cursor header. The cursor is followed until
+  // no header is returned, so the promise resolves to every meal in the range.
+  getMealHistory: (startTime=null, endTime=null, fields=null) => {
     let url = '/meals/history';
+    const params = [];
     if (startTime && endTime) {
-      url += `?start_time=${startTime}&end_time=${endTime}`;
+      params.push(`start_time=${startTime}&end_time=${endTime}`);
     }
-    return request(url, 'GET');
+    if (fields) {
+      params.push(`fields=${fields.join(',')}`);
+    }
+    if (params.length) {
+      url += `?${params.join('&')}`;
+    }
+    const separator = params.length ? '&' : '?';
+    const fetchPages = (cursor, meals) => {
+      const pageUrl = cursor ? `${url}${separator}cursor=${encodeURIComponent(cursor)}` : url;
+      return request(pageUrl, 'GET', null, true, true).then(({ data, header }) => {
+        const next = getHeader(header, 'X-Next-Cursor');
+        const all = meals.concat(data);
+        return next ? fetchPages(next, all) : all;
+      });
+    };
+    return fetchPages(null, []);
   },
   
   getUserMetrics: (startTime, endTime) => {
@@ -170,7 +209,21 @@ const api = {
   saveMeal: (mealData) => {
     return request('/meals', 'POST', mealData);
   },
-  
+
+  // Save several meals at once, e.g. when syncing meals logged offline
+  saveMeals: (meals) => {
+    return request('/meals/batch', 'POST', { meals });
+  },
+
+  // Meals saved or deleted since the watermark of the previous sync
+  getMealChanges: (since = null) => {
+    let url = '/meals/changes';
+    if (since) {
+      url += `?since=${encodeURIComponent(since)}`;
+    }
+    return request(url, 'GET');
+  },
+
   // Image Processing
   processImage: (fileId, analysis = null, userComment = null) => {
     const data = {